@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+from typing import Any
+
+
+# 基准测试的合成系统输入（按规模生成，内容确定、可重复）：
+# - system.d：conf_files 个 *.conf，分布在 etc/usr 两个目录；每个 conf 让 root own 一个 bus name，
+#   每 10 个中有 1 个在 default policy 下 allow own（产生 flagged 结果），每 4 个带一条 default deny 规则
+# - introspection：前 introspect_services 个 bus name 可被 busctl introspect，对象树深 tree_depth、每层 tree_fanout 个子节点，
+#   每个节点 interfaces 个 interface、每个 interface methods 个方法（由桩命令按规则即时生成，不落盘 XML）
+# - polkit：policy_files 个 *.policy，每个 actions_per_policy 个 action，implicit 取值轮换（含 yes/auth_self）
+# - dpkg：packages 个包的 *.list，每包 files_per_package 个文件，其中一半是真实存在的可执行文件（部分带 S 位、部分有 capabilities）；
+#   conf 与 policy 文件归属的 bench-dbus-*/bench-polkit-* 包同样写出 *.list，dpkg-query -S 桩与快照的属主索引结果一致
+# - systemd：units 个 service 的 unit 属性
+# 桩命令读取的数据按命令拆成独立 JSON（stub/<command>.json），单次调用只加载自己需要的部分
+
+SCALES: dict[str, dict[str, int]] = {
+    "small": {
+        "conf_files": 200,
+        "introspect_services": 10,
+        "tree_depth": 2,
+        "tree_fanout": 3,
+        "interfaces": 2,
+        "methods": 5,
+        "policy_files": 20,
+        "actions_per_policy": 5,
+        "packages": 20,
+        "files_per_package": 20,
+        "units": 200,
+    },
+    "medium": {
+        "conf_files": 1000,
+        "introspect_services": 40,
+        "tree_depth": 3,
+        "tree_fanout": 3,
+        "interfaces": 3,
+        "methods": 8,
+        "policy_files": 100,
+        "actions_per_policy": 8,
+        "packages": 100,
+        "files_per_package": 50,
+        "units": 1000,
+    },
+    "large": {
+        "conf_files": 3000,
+        "introspect_services": 100,
+        "tree_depth": 3,
+        "tree_fanout": 4,
+        "interfaces": 4,
+        "methods": 10,
+        "policy_files": 300,
+        "actions_per_policy": 10,
+        "packages": 300,
+        "files_per_package": 100,
+        "units": 3000,
+    },
+}
+
+IMPLICIT_VALUES = ("no", "auth_admin", "auth_admin_keep", "auth_self", "yes")
+CAPABILITIES = ("cap_net_admin", "cap_net_raw", "cap_sys_admin", "cap_dac_override", "cap_setuid")
+
+
+def bus_name(index: int) -> str:
+    return f"org.bench.Service{index:05d}"
+
+
+def _write_text(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+
+
+def _write_lines(path: str, lines: list[str]) -> None:
+    _write_text(path, "".join(f"{line}\n" for line in lines))
+
+
+def _conf_text(index: int) -> str:
+    name = bus_name(index)
+    default_rules = []
+    if index % 10 == 0:
+        default_rules.append(f'    <allow own="{name}"/>')
+    if index % 4 == 0:
+        default_rules.append(f'    <deny send_destination="{name}" send_interface="{name}.I0"/>')
+    default_policy = "\n".join(default_rules)
+    return (
+        '<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-BUS Bus Configuration 1.0//EN"\n'
+        ' "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">\n'
+        "<busconfig>\n"
+        '  <policy user="root">\n'
+        f'    <allow own="{name}"/>\n'
+        f'    <allow send_destination="{name}"/>\n'
+        "  </policy>\n"
+        '  <policy context="default">\n'
+        f"{default_policy}\n"
+        f'    <allow send_destination="{name}" send_interface="org.freedesktop.DBus.Introspectable"/>\n'
+        "  </policy>\n"
+        "</busconfig>\n"
+    )
+
+
+def _policy_text(action_ids: list[str]) -> str:
+    actions = "".join(
+        f'  <action id="{action_id}">\n'
+        f"    <description>Bench action {action_id}</description>\n"
+        "    <defaults>\n"
+        "      <allow_any>no</allow_any>\n"
+        "      <allow_inactive>no</allow_inactive>\n"
+        "      <allow_active>auth_admin</allow_active>\n"
+        "    </defaults>\n"
+        "  </action>\n"
+        for action_id in action_ids
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        "<policyconfig>\n"
+        f"{actions}"
+        "</policyconfig>\n"
+    )
+
+
+def _pkaction_output(action_id: str, index: int) -> str:
+    any_value = IMPLICIT_VALUES[index % 3]
+    inactive_value = IMPLICIT_VALUES[(index + 1) % 4]
+    active_value = IMPLICIT_VALUES[index % len(IMPLICIT_VALUES)]
+    return (
+        f"{action_id}:\n"
+        f"  description:       Bench action {action_id}\n"
+        "  message:           Authentication is required\n"
+        "  vendor:            bench\n"
+        "  vendor_url:        \n"
+        "  icon:              \n"
+        f"  implicit any:      {any_value}\n"
+        f"  implicit inactive: {inactive_value}\n"
+        f"  implicit active:   {active_value}\n"
+    )
+
+
+def _unit_properties(index: int) -> dict[str, str]:
+    name = f"bench{index:05d}"
+    return {
+        "LoadState": "loaded",
+        "User": "" if index % 3 == 0 else name,
+        "Group": "" if index % 3 == 0 else name,
+        "SupplementaryGroups": "adm" if index % 5 == 0 else "",
+        "CapabilityBoundingSet": " ".join(CAPABILITIES[: index % len(CAPABILITIES) + 1]),
+        "AmbientCapabilities": CAPABILITIES[index % len(CAPABILITIES)] if index % 4 == 0 else "",
+        "ProtectSystem": ("no", "yes", "full", "strict")[index % 4],
+        "ProtectHome": ("no", "yes", "read-only", "tmpfs")[index % 4],
+        "PrivateTmp": "yes" if index % 2 else "no",
+        "NoNewPrivileges": "yes" if index % 3 else "no",
+        "ReadWritePaths": f"/var/lib/{name} -/run/{name}" if index % 3 == 1 else "",
+        "ReadOnlyPaths": "/etc" if index % 6 == 2 else "",
+        "InaccessiblePaths": "/home" if index % 7 == 3 else "",
+        "StateDirectory": name if index % 2 == 0 else "",
+        "RuntimeDirectory": name if index % 5 == 1 else "",
+    }
+
+
+def generate(root: str, scale: dict[str, int]) -> dict[str, Any]:
+    # 返回基准用例需要的路径；root 需为空目录或不存在
+    etc_dir = os.path.join(root, "etc", "dbus-1", "system.d")
+    usr_dir = os.path.join(root, "usr", "share", "dbus-1", "system.d")
+    policy_dir = os.path.join(root, "usr", "share", "polkit-1", "actions")
+    dpkg_info_dir = os.path.join(root, "var", "lib", "dpkg", "info")
+    bin_dir = os.path.join(root, "usr", "bin")
+    stub_dir = os.path.join(root, "stub")
+    list_dir = os.path.join(root, "lists")
+    for directory in (etc_dir, usr_dir, policy_dir, dpkg_info_dir, bin_dir, stub_dir, list_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    owners: dict[str, str] = {}
+
+    bus_names: list[str] = []
+    for index in range(scale["conf_files"]):
+        conf_dir = etc_dir if index % 2 else usr_dir
+        path = os.path.join(conf_dir, f"{bus_name(index)}.conf")
+        _write_text(path, _conf_text(index))
+        owners[path] = f"bench-dbus-{index % 50:02d}"
+        bus_names.append(bus_name(index))
+
+    action_ids: list[str] = []
+    pkaction: dict[str, str] = {}
+    for policy_index in range(scale["policy_files"]):
+        ids = [f"org.bench.policy{policy_index:04d}.action{n:02d}" for n in range(scale["actions_per_policy"])]
+        path = os.path.join(policy_dir, f"org.bench.policy{policy_index:04d}.policy")
+        _write_text(path, _policy_text(ids))
+        owners[path] = f"bench-polkit-{policy_index % 20:02d}"
+        for action_id in ids:
+            pkaction[action_id] = _pkaction_output(action_id, len(action_ids))
+            action_ids.append(action_id)
+
+    package_files: dict[str, list[str]] = {}
+    for path, owner in owners.items():
+        package_files.setdefault(owner, []).append(path)
+
+    packages: list[str] = []
+    caps: dict[str, str] = {}
+    for package_index in range(scale["packages"]):
+        package = f"bench-pkg-{package_index:04d}"
+        files: list[str] = []
+        for file_index in range(scale["files_per_package"]):
+            if file_index % 2:
+                files.append(f"/usr/share/doc/{package}/file{file_index:03d}")
+                continue
+            path = os.path.join(bin_dir, f"{package}-{file_index:03d}")
+            _write_text(path, "#!/bin/sh\n")
+            mode = 0o755
+            if file_index % 10 == 0:
+                mode |= stat.S_ISUID
+            os.chmod(path, mode)
+            if file_index % 8 == 2:
+                caps[path] = CAPABILITIES[file_index % len(CAPABILITIES)] + "=ep"
+            files.append(path)
+        package_files[package] = files
+        packages.append(package)
+    for package, files in package_files.items():
+        _write_lines(os.path.join(dpkg_info_dir, f"{package}.list"), files)
+
+    units = {f"bench{index:05d}.service": _unit_properties(index) for index in range(scale["units"])}
+
+    tree = {key: scale[key] for key in ("tree_depth", "tree_fanout", "interfaces", "methods")}
+    stub_data = {
+        "systemctl": units,
+        "busctl": {"services": bus_names[: scale["introspect_services"]], "tree": tree},
+        "dpkg-query": {"owners": owners, "packages": package_files},
+        "pkaction": pkaction,
+        "getcap": caps,
+    }
+    for command, data in stub_data.items():
+        with open(os.path.join(stub_dir, f"{command}.json"), "w", encoding="utf-8") as handle:
+            json.dump(data, handle)
+
+    lists = {
+        "services": sorted(units),
+        "bus_names": bus_names[: scale["introspect_services"]],
+        "packages": packages,
+        "actions": action_ids,
+    }
+    paths = {name: os.path.join(list_dir, f"{name}.txt") for name in lists}
+    for name, items in lists.items():
+        _write_lines(paths[name], items)
+
+    return {
+        "etc_dir": etc_dir,
+        "usr_dir": usr_dir,
+        "policy_dir": policy_dir,
+        "dpkg_info_dir": dpkg_info_dir,
+        "stub_dir": stub_dir,
+        "services_file": paths["services"],
+        "bus_names_file": paths["bus_names"],
+        "packages_file": paths["packages"],
+        "actions_file": paths["actions"],
+    }
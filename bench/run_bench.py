@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shlex
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "tools")
+sys.path.insert(0, TOOLS_DIR)
+
+import _fixtures  # noqa: E402
+from _common import RUN_STATS  # noqa: E402
+
+import check_dbus_system_conf as dbus_conf  # noqa: E402
+import check_deb_binaries_privilege as deb_privilege  # noqa: E402
+import check_polkit_action_implicit as polkit_implicit  # noqa: E402
+import check_service_cap as service_cap  # noqa: E402
+import check_service_fs_scope as service_fs_scope  # noqa: E402
+import run_all  # noqa: E402
+
+
+# 规则工具基准测试：
+# - 按规模生成合成夹具（见 _fixtures.py），生成 busctl/systemctl/dpkg-query/getcap/pkaction 桩命令并放到 PATH 最前，
+#   不需要真实的系统总线、systemd 或 dpkg 数据库
+# - 在进程内调用各工具的 main()，测量端到端墙钟时间（多次取中位数），并从 RUN_STATS 取阶段耗时与外部命令次数
+# - 基线按规模名记录在 baselines.json（含规模参数与桩命令延迟）；参数不一致时拒绝比较
+# - 回归判定：外部命令次数多于基线；退出码与基线不同。二者与机器无关，可直接与仓库中提交的基线比较
+# - 耗时与机器相关，默认只展示；--check-timing 时耗时超过基线 × (1 + tolerance) 且差值超过 min-delta 也判为回归，
+#   应配合在同一台机器上用 --update-baseline 记录的基线（如 --baseline-file 指向本地文件）
+# - polkit policy 目录为工具内常量，基准运行期间临时指向夹具目录
+
+STUB_COMMANDS = ("busctl", "systemctl", "dpkg-query", "getcap", "pkaction")
+DEFAULT_BASELINE_FILE = os.path.join(BENCH_DIR, "baselines.json")
+BASELINE_VERSION = 1
+
+Case = Callable[[dict[str, Any]], list[str]]
+
+CASES: dict[str, tuple[Callable[[list[str]], int], Case]] = {
+    "check_dbus_system_conf": (
+        dbus_conf.main,
+        lambda p: ["--etc-dir", p["etc_dir"], "--usr-dir", p["usr_dir"], "--json"],
+    ),
+    "check_dbus_system_conf_services": (
+        dbus_conf.main,
+        lambda p: ["--etc-dir", p["etc_dir"], "--usr-dir", p["usr_dir"], "--services-file", p["bus_names_file"], "--json"],
+    ),
+    "check_service_cap": (service_cap.main, lambda p: ["--all-services", "--json"]),
+    "check_service_fs_scope": (service_fs_scope.main, lambda p: ["--all-services", "--json"]),
+    "check_deb_binaries_privilege": (deb_privilege.main, lambda p: ["--packages-file", p["packages_file"], "--json"]),
+    "check_polkit_action_implicit": (polkit_implicit.main, lambda p: ["--actions-file", p["actions_file"], "--json"]),
+    "run_all": (
+        run_all.main,
+        lambda p: [
+            "--services-file",
+            p["services_file"],
+            "--packages-file",
+            p["packages_file"],
+            "--actions-file",
+            p["actions_file"],
+            "--bus-names-file",
+            p["bus_names_file"],
+            "--etc-dir",
+            p["etc_dir"],
+            "--usr-dir",
+            p["usr_dir"],
+            "--dpkg-info-dir",
+            p["dpkg_info_dir"],
+            "--output",
+            os.devnull,
+        ],
+    ),
+}
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="run_bench",
+        description="Benchmark the rule tools against synthetic fixtures and stub system commands, and compare with baselines.",
+    )
+    parser.add_argument(
+        "--scale",
+        default="small",
+        choices=sorted(_fixtures.SCALES),
+        help="Fixture size preset (default: small).",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=N",
+        help="Override one fixture size parameter of the preset, e.g. conf_files=5000 (repeatable).",
+    )
+    parser.add_argument(
+        "--case",
+        action="append",
+        choices=sorted(CASES),
+        help="Only run this case (repeatable; default: every case).",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median is reported (default: 3).")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Extra seconds every stub command sleeps before answering (default: 0).",
+    )
+    parser.add_argument(
+        "--command-latency",
+        action="append",
+        default=[],
+        metavar="COMMAND=SECONDS",
+        help="Per-command stub latency, e.g. busctl=0.02 (repeatable; overrides --latency).",
+    )
+    parser.add_argument(
+        "--baseline-file",
+        default=DEFAULT_BASELINE_FILE,
+        help="Baseline file (default: bench/baselines.json).",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Record this run as the baseline for the scale instead of comparing.",
+    )
+    parser.add_argument(
+        "--check-timing",
+        action="store_true",
+        help="Also fail on wall-time slowdowns; only meaningful against a baseline recorded on this machine.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown over the baseline as a fraction, with --check-timing (default: 0.25).",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.05,
+        help="Ignore slowdowns smaller than this many seconds, with --check-timing (default: 0.05).",
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="Generate fixtures here and keep them (must be empty or missing; default: a temporary directory).",
+    )
+    parser.add_argument("--json", action="store_true", help="Output the results and comparison as JSON.")
+    return parser.parse_args(argv)
+
+
+def _parse_assignments(values: list[str], option: str) -> dict[str, str]:
+    parsed: dict[str, str] = {}
+    for value in values:
+        key, sep, amount = value.partition("=")
+        if not sep or not key or not amount:
+            raise ValueError(f"{option} expects KEY=VALUE, got {value!r}")
+        parsed[key] = amount
+    return parsed
+
+
+def _scale_settings(scale_name: str, overrides: list[str]) -> dict[str, int]:
+    scale = dict(_fixtures.SCALES[scale_name])
+    for key, value in _parse_assignments(overrides, "--set").items():
+        if key not in scale:
+            raise ValueError(f"unknown fixture parameter {key!r} (expected one of: {', '.join(sorted(scale))})")
+        if not value.isdigit():
+            raise ValueError(f"--set {key} must be a non-negative integer")
+        scale[key] = int(value)
+    return scale
+
+
+def _latency_settings(default: float, overrides: list[str]) -> dict[str, float]:
+    if default < 0:
+        raise ValueError("--latency must be >= 0")
+    latency = {command: default for command in STUB_COMMANDS}
+    for command, value in _parse_assignments(overrides, "--command-latency").items():
+        if command not in latency:
+            raise ValueError(f"unknown stub command {command!r} (expected one of: {', '.join(STUB_COMMANDS)})")
+        try:
+            latency[command] = float(value)
+        except ValueError:
+            raise ValueError(f"invalid --command-latency seconds {value!r}") from None
+        if latency[command] < 0:
+            raise ValueError("--command-latency must be >= 0")
+    return latency
+
+
+def _write_stub_commands(bin_dir: str, stub_dir: str, latency: dict[str, float]) -> None:
+    os.makedirs(bin_dir, exist_ok=True)
+    stub_script = os.path.join(BENCH_DIR, "stub_command.py")
+    for command in STUB_COMMANDS:
+        path = os.path.join(bin_dir, command)
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(
+                "#!/bin/sh\n"
+                f"exec {shlex.quote(sys.executable)} -S {shlex.quote(stub_script)} "
+                f"{command} {shlex.quote(stub_dir)} {latency[command]} \"$@\"\n",
+            )
+        os.chmod(path, 0o755)
+
+
+def _run_case(name: str, paths: dict[str, Any], repeat: int) -> dict[str, Any]:
+    main, build_argv = CASES[name]
+    argv = build_argv(paths)
+    runs: list[tuple[float, int, dict[str, Any]]] = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as stderr:
+            started = time.perf_counter()
+            exit_code = main(argv)
+            seconds = time.perf_counter() - started
+        # --json/--output 模式下单条目错误写入结果，stderr 中的 ERROR 行只来自致命错误（参数、缺少命令等）
+        errors = [line for line in stderr.getvalue().splitlines() if line.startswith("ERROR:")]
+        if errors:
+            raise RuntimeError(f"{name} failed (exit code {exit_code}): {errors[0]}")
+        runs.append((seconds, exit_code, RUN_STATS.report()))
+
+    runs.sort(key=lambda run: run[0])
+    seconds, exit_code, stats = runs[len(runs) // 2]
+    return {
+        "seconds": round(statistics.median(run[0] for run in runs), 4),
+        "min_seconds": round(runs[0][0], 4),
+        "max_seconds": round(runs[-1][0], 4),
+        "exit_code": exit_code,
+        "phases": {phase: entry["seconds"] for phase, entry in stats["phases"].items()},
+        "commands": {command: entry["count"] for command, entry in stats["commands"].items()},
+    }
+
+
+def _load_baselines(path: str) -> dict[str, Any]:
+    if not os.path.exists(path):
+        return {"version": BASELINE_VERSION, "baselines": {}}
+    with open(path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    if data.get("version") != BASELINE_VERSION:
+        raise ValueError(f"unsupported baseline file version in {path}: {data.get('version')!r}")
+    return data
+
+
+def _compare(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    tolerance: float,
+    min_delta: float,
+    check_timing: bool,
+) -> list[str]:
+    regressions: list[str] = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = base["seconds"] * (1.0 + tolerance)
+        if check_timing and result["seconds"] > limit and result["seconds"] - base["seconds"] > min_delta:
+            regressions.append(
+                f"{name}: {result['seconds']:.3f}s vs baseline {base['seconds']:.3f}s "
+                f"(+{(result['seconds'] / base['seconds'] - 1.0) * 100:.0f}%)",
+            )
+        for command, count in sorted(result["commands"].items()):
+            expected = base["commands"].get(command, 0)
+            if count > expected:
+                regressions.append(f"{name}: {command} called {count} times vs baseline {expected}")
+        if result["exit_code"] != base["exit_code"]:
+            regressions.append(f"{name}: exit code {result['exit_code']} vs baseline {base['exit_code']}")
+    return regressions
+
+
+def _print_results(results: dict[str, dict[str, Any]], baseline: dict[str, dict[str, Any]]) -> None:
+    for name, result in results.items():
+        base = baseline.get(name)
+        reference = f" (baseline {base['seconds']:.3f}s)" if base else ""
+        commands = " ".join(f"{command}={count}" for command, count in sorted(result["commands"].items())) or "(none)"
+        slowest = sorted(result["phases"].items(), key=lambda item: -item[1])[:3]
+        phases = " ".join(f"{phase}={seconds:.3f}s" for phase, seconds in slowest) or "(none)"
+        print(f"Case: {name} | Seconds: {result['seconds']:.3f}{reference} | Exit: {result['exit_code']}")
+        print(f"  Commands: {commands}")
+        print(f"  Slowest phases: {phases}")
+
+
+def main(argv: list[str]) -> int:
+    args = _parse_args(argv)
+
+    try:
+        if args.repeat < 1:
+            raise ValueError("--repeat must be >= 1")
+        if args.tolerance < 0 or args.min_delta < 0:
+            raise ValueError("--tolerance and --min-delta must be >= 0")
+        scale = _scale_settings(args.scale, args.set)
+        latency = _latency_settings(args.latency, args.command_latency)
+        settings = {"scale": scale, "latency": latency}
+        baselines = _load_baselines(args.baseline_file)
+        recorded = baselines["baselines"].get(args.scale)
+        if recorded is not None and recorded["settings"] != settings and not args.update_baseline:
+            raise ValueError(
+                f"baseline for scale {args.scale!r} was recorded with different settings; "
+                "rerun with the same --set/--latency options or --update-baseline",
+            )
+        baseline = recorded["cases"] if recorded is not None else {}
+
+        with contextlib.ExitStack() as stack:
+            if args.work_dir:
+                if os.path.isdir(args.work_dir) and os.listdir(args.work_dir):
+                    raise ValueError(f"--work-dir is not empty: {args.work_dir}")
+                work_dir = args.work_dir
+            else:
+                work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="dbus-bench-"))
+
+            started = time.monotonic()
+            paths = _fixtures.generate(os.path.join(work_dir, "fixtures"), scale)
+            bin_dir = os.path.join(work_dir, "bin")
+            _write_stub_commands(bin_dir, paths["stub_dir"], latency)
+            print(
+                f"INFO: Fixtures for scale {args.scale} generated in {time.monotonic() - started:.1f}s ({work_dir})",
+                file=sys.stderr,
+            )
+
+            saved_path = os.environ.get("PATH", "")
+            saved_policy_dirs = polkit_implicit.POLICY_SEARCH_DIRS
+            os.environ["PATH"] = bin_dir + os.pathsep + saved_path
+            polkit_implicit.POLICY_SEARCH_DIRS = (paths["policy_dir"],)
+            try:
+                results: dict[str, dict[str, Any]] = {}
+                for name in args.case or list(CASES):
+                    results[name] = _run_case(name, paths, args.repeat)
+                    print(f"INFO: {name}: {results[name]['seconds']:.3f}s", file=sys.stderr)
+            finally:
+                os.environ["PATH"] = saved_path
+                polkit_implicit.POLICY_SEARCH_DIRS = saved_policy_dirs
+
+        regressions: list[str] = []
+        if args.update_baseline:
+            cases = dict(baseline) if recorded is not None and recorded["settings"] == settings else {}
+            cases.update(results)
+            baselines["baselines"][args.scale] = {"settings": settings, "cases": dict(sorted(cases.items()))}
+            with open(args.baseline_file, "w", encoding="utf-8") as handle:
+                json.dump(baselines, handle, indent=2, ensure_ascii=False, sort_keys=True)
+                handle.write("\n")
+            print(f"INFO: Baseline for scale {args.scale} written to {args.baseline_file}", file=sys.stderr)
+        elif not baseline:
+            print(
+                f"WARNING: no baseline for scale {args.scale} in {args.baseline_file}; rerun with --update-baseline",
+                file=sys.stderr,
+            )
+        else:
+            regressions = _compare(results, baseline, args.tolerance, args.min_delta, args.check_timing)
+
+        if args.json:
+            payload = {"scale": args.scale, "settings": settings, "results": results, "regressions": regressions}
+            print(json.dumps(payload, indent=2, ensure_ascii=False, sort_keys=True))
+        else:
+            _print_results(results, baseline)
+            for regression in regressions:
+                print(f"REGRESSION: {regression}")
+
+        return 3 if regressions else 0
+    except Exception as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+
+
+# 基准测试用的系统命令桩（busctl/systemctl/dpkg-query/getcap/pkaction）：
+# - 由 run_bench.py 生成的包装脚本调用：stub_command.py <command> <stub_dir> <latency_seconds> <原始参数...>
+# - 数据来自合成夹具 <stub_dir>/<command>.json；输出格式与真实命令中被工具解析的部分一致
+# - 每次调用先 sleep latency_seconds，模拟真实命令（如 busctl 经系统总线往返）的延迟
+# - 仅依赖标准库，以 python -S 启动以减少每次调用的解释器开销
+
+
+def _load(stub_dir: str, command: str) -> object:
+    with open(os.path.join(stub_dir, f"{command}.json"), encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def _systemctl(stub_dir: str, args: list[str]) -> int:
+    units = _load(stub_dir, "systemctl")
+    args = [arg for arg in args if arg != "--no-pager"]
+    verb = args[0] if args else ""
+    if verb == "show":
+        properties = [arg.split("=", 1)[1] for arg in args if arg.startswith("--property=")]
+        names = [arg for arg in args[1:] if not arg.startswith("-")]
+        blocks = []
+        for name in names:
+            unit = units.get(name, {"LoadState": "not-found"})
+            blocks.append("\n".join(f"{prop}={unit.get(prop, '')}" for prop in properties))
+        print("\n\n".join(blocks))
+        return 0
+    if verb == "list-units":
+        for name in units:
+            print(f"{name} loaded active running Bench unit")
+        return 0
+    if verb == "list-unit-files":
+        for name in units:
+            print(f"{name} enabled enabled")
+        return 0
+    print(f"Unknown command verb {verb}.", file=sys.stderr)
+    return 1
+
+
+def _busctl(stub_dir: str, args: list[str]) -> int:
+    data = _load(stub_dir, "busctl")
+    service, object_path = args[-2], args[-1]
+    if service not in data["services"]:
+        print(f"Failed to introspect object {object_path} of service {service}: Unit {service}.service not found.", file=sys.stderr)
+        return 1
+    tree = data["tree"]
+    depth = 0 if object_path == "/" else len(object_path.strip("/").split("/"))
+    parts = ['<node>', '<interface name="org.freedesktop.DBus.Introspectable"><method name="Introspect"/></interface>']
+    for interface_index in range(tree["interfaces"]):
+        methods = "".join(f'<method name="Method{m}"/>' for m in range(tree["methods"]))
+        parts.append(f'<interface name="{service}.I{interface_index}">{methods}</interface>')
+    if depth < tree["tree_depth"]:
+        parts.extend(f'<node name="n{child}"/>' for child in range(tree["tree_fanout"]))
+    parts.append("</node>")
+    print("".join(parts))
+    return 0
+
+
+def _dpkg_query(stub_dir: str, args: list[str]) -> int:
+    data = _load(stub_dir, "dpkg-query")
+    mode, target = args[0], args[1]
+    if mode == "-L":
+        files = data["packages"].get(target)
+        if files is None:
+            print(f"dpkg-query: package '{target}' is not installed", file=sys.stderr)
+            return 1
+        print("\n".join(files))
+        return 0
+    owner = data["owners"].get(target)
+    if owner is None:
+        print(f"dpkg-query: no path found matching pattern {target}", file=sys.stderr)
+        return 1
+    print(f"{owner}: {target}")
+    return 0
+
+
+def _pkaction(stub_dir: str, args: list[str]) -> int:
+    actions = _load(stub_dir, "pkaction")
+    action_id = args[args.index("-a") + 1]
+    if action_id not in actions:
+        print(f"No action with action id {action_id}", file=sys.stderr)
+        return 1
+    print(actions[action_id], end="")
+    return 0
+
+
+def _getcap(stub_dir: str, args: list[str]) -> int:
+    caps = _load(stub_dir, "getcap")
+    for path in args:
+        if path in caps:
+            print(f"{path} {caps[path]}")
+    return 0
+
+
+COMMANDS = {
+    "systemctl": _systemctl,
+    "busctl": _busctl,
+    "dpkg-query": _dpkg_query,
+    "pkaction": _pkaction,
+    "getcap": _getcap,
+}
+
+
+def main(argv: list[str]) -> int:
+    command, stub_dir, latency = argv[0], argv[1], float(argv[2])
+    if latency > 0:
+        time.sleep(latency)
+    return COMMANDS[command](stub_dir, argv[3:])
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
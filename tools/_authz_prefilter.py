@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import posixpath
+import re
+from typing import Any
+
+from _source_index import (
+    SOURCE_SUFFIXES,
+    SourceIndex,
+    method_string_refs,
+    named_handlers,
+    referencing_functions,
+)
+
+
+# D-Bus 方法授权静态预筛（在调用 codex 之前）：
+# - 基于源码符号索引定位候选处理函数，在函数体及其直接调用的项目内函数中匹配授权模式
+# - 候选处理函数按名称查找后，只保留与该方法 interface/object path 字符串同文件或同目录的函数；
+#   同名但属于其他服务/接口的函数不参与判定
+# - 结论三类：authorization-evident（每个候选处理函数都有 polkit 检查或“读取调用方 UID 并比较”，且未见 PID 派生主体）
+#             none-visible（找到候选处理函数，但其及直接被调函数均未见任何授权相关模式）
+#             unknown（未找到处理函数、仅部分候选函数有检查、仅读取身份/构造 polkit 主体、仅找到注册/分发位置，或授权依赖 PID 派生信息）
+# - 仅做“明显成立”的判定：任何不确定都落入 unknown，交由 codex 复核
+
+VERDICT_EVIDENT = "authorization-evident"
+VERDICT_NONE_VISIBLE = "none-visible"
+VERDICT_UNKNOWN = "unknown"
+
+VERDICTS = (VERDICT_EVIDENT, VERDICT_NONE_VISIBLE, VERDICT_UNKNOWN)
+
+# (语言, 类别, 正则)：
+# - polkit：实际发起授权检查的调用，视为授权证据
+# - sender_uid：读取调用方 UID；仅在同时出现 uid_compare 时视为授权证据
+# - polkit_subject：构造 polkit 主体/Authority 代理，本身不构成检查
+# - pid_subject：视为不安全主体
+# 语言取值与源码索引一致（any 表示不限）；qt 对应按 C/C++ 索引的文件
+AUTHZ_PATTERNS = [
+    ("any", "polkit", r"\bCheckAuthorization\b"),
+    ("go", "polkit", r"\bpolkit\.\w*[Cc]heck\w*\("),
+    ("c", "polkit", r"\bpolkit_authority_check_authorization(?:_sync)?\s*\("),
+    ("python", "polkit", r"\bAuthority\b.*\bcheck_authorization\w*\s*\("),
+    ("qt", "polkit", r"\bcheckAuthorization(?:Sync)?\s*\("),
+    ("any", "polkit_subject", r"org\.freedesktop\.PolicyKit1\.Authority"),
+    ("any", "polkit_subject", r"[\"']system-bus-name[\"']"),
+    ("c", "polkit_subject", r"\bpolkit_system_bus_name_new\s*\("),
+    ("qt", "polkit_subject", r"\bPolkitQt1::(?:Authority|SystemBusNameSubject)\b"),
+    ("any", "sender_uid", r"\bGetConnectionUnixUser\b"),
+    ("any", "sender_uid", r"\bGetConnectionCredentials\b"),
+    ("c", "sender_uid", r"\bsd_bus_(?:query_sender_creds|creds_get_e?uid)\s*\("),
+    ("c", "sender_uid", r"\bg_credentials_get_unix_user\s*\("),
+    ("python", "sender_uid", r"\bget_unix_user\s*\("),
+    ("qt", "sender_uid", r"\bserviceUid\s*\("),
+    ("any", "uid_compare", r"\b\w*[Uu]id\w*\s*(?:!=|==)\s*0\b|\b0\s*(?:!=|==)\s*[\w.]*[Uu]id\b"),
+    ("any", "pid_subject", r"\bGetConnectionUnixProcessID\b"),
+    ("any", "pid_subject", r"[\"']unix-process[\"']"),
+    ("c", "pid_subject", r"\bpolkit_unix_process_new\w*\s*\("),
+    ("c", "pid_subject", r"\bsd_bus_creds_get_pid\s*\("),
+    ("python", "pid_subject", r"\bUnixProcess\b"),
+    ("qt", "pid_subject", r"\bUnixProcessSubject\b"),
+    ("qt", "pid_subject", r"\bservicePid\s*\("),
+]
+
+_PATTERN_LANGUAGES = {"qt": "c"}
+
+_COMPILED_PATTERNS = {
+    language: [
+        (kind, re.compile(pattern))
+        for pattern_language, kind, pattern in AUTHZ_PATTERNS
+        if pattern_language == "any" or _PATTERN_LANGUAGES.get(pattern_language, pattern_language) == language
+    ]
+    for language in set(SOURCE_SUFFIXES.values())
+}
+
+# 与授权相关、但单独出现不足以判定的类别；出现时不再判为 none-visible
+_AUTHZ_HINT_KINDS = ("polkit", "sender_uid", "polkit_subject")
+
+MAX_EVIDENCE = 8
+
+
+def _scan_function(index: SourceIndex, function: tuple[str, str, int, int]) -> dict[str, list[str]]:
+    _, rel_path, start, end = function
+    lines = index.files.get(rel_path) or []
+    patterns = _COMPILED_PATTERNS.get(index.languages.get(rel_path) or "") or []
+    hits: dict[str, list[str]] = {}
+    for line_no in range(start, min(end, len(lines)) + 1):
+        text = lines[line_no - 1]
+        kinds = {kind for kind, pattern in patterns if pattern.search(text)}
+        for kind in sorted(kinds):
+            hits.setdefault(kind, []).append(f"{rel_path}:{line_no}: {text.strip()}")
+    return hits
+
+
+def _describe(function: tuple[str, str, int, int]) -> str:
+    name, rel_path, start, end = function
+    return f"{name} ({rel_path}:{start}-{end})"
+
+
+def _collect_hits(index: SourceIndex, functions: list[tuple[str, str, int, int]]) -> dict[str, list[str]]:
+    scanned: list[tuple[str, str, int, int]] = []
+    for function in functions:
+        for target in [function] + index.callees(function):
+            if target not in scanned:
+                scanned.append(target)
+
+    hits: dict[str, list[str]] = {}
+    for function in scanned:
+        for kind, lines in _scan_function(index, function).items():
+            for line in lines:
+                if line not in hits.setdefault(kind, []):
+                    hits[kind].append(line)
+    return hits
+
+
+def _interface_scope(index: SourceIndex, entry: dict[str, str]) -> tuple[set[str], set[str]]:
+    # interface 名与 object path 以字符串字面量出现的文件（导出/注册代码）及其所在目录（Go 包、同一服务的源码目录）
+    refs = list(index.string_refs.get(entry["interface"]) or [])
+    if entry["path"] != "/":
+        refs.extend(index.string_refs.get(entry["path"]) or [])
+    files = {rel_path for rel_path, _ in refs}
+    return files, {posixpath.dirname(rel_path) for rel_path in files}
+
+
+def _in_scope(function: tuple[str, str, int, int], scope: tuple[set[str], set[str]]) -> bool:
+    files, directories = scope
+    rel_path = function[1]
+    return rel_path in files or posixpath.dirname(rel_path) in directories
+
+
+def _has_check(hits: dict[str, list[str]]) -> bool:
+    return bool(hits.get("polkit")) or bool(hits.get("sender_uid") and hits.get("uid_compare"))
+
+
+def _check_lines(hits: dict[str, list[str]]) -> list[str]:
+    lines = list(hits.get("polkit") or [])
+    if hits.get("sender_uid") and hits.get("uid_compare"):
+        lines += hits["sender_uid"] + hits["uid_compare"]
+    return lines
+
+
+def _hint_lines(hits: dict[str, list[str]]) -> list[str]:
+    return [line for kind in _AUTHZ_HINT_KINDS for line in hits.get(kind) or []]
+
+
+def classify_method(index: SourceIndex, entry: dict[str, str]) -> dict[str, Any]:
+    scope = _interface_scope(index, entry)
+    named = named_handlers(index, entry["method"])
+    direct = [function for function in named if _in_scope(function, scope)]
+    referenced = [
+        function
+        for function in referencing_functions(index, method_string_refs(index, entry["method"]), named)
+        if _in_scope(function, scope)
+    ]
+
+    # 授权证据只认候选处理函数及其直接被调函数，且要求每个候选函数都有检查；
+    # 分发函数可能为多个方法共用，其中的授权不一定覆盖本方法
+    direct_hits = [_collect_hits(index, [function]) for function in direct]
+    referenced_hits = _collect_hits(index, referenced)
+    checked = [hits for hits in direct_hits if _has_check(hits)]
+    authz = [line for hits in checked for line in _check_lines(hits)]
+    hints = [line for hits in direct_hits for line in _hint_lines(hits)] + _hint_lines(referenced_hits)
+    pid = [line for hits in direct_hits for line in hits.get("pid_subject") or []]
+    pid += referenced_hits.get("pid_subject") or []
+
+    if pid:
+        verdict = VERDICT_UNKNOWN
+        reason = "authorization relies on caller PID-derived information"
+    elif direct and len(checked) == len(direct):
+        verdict = VERDICT_EVIDENT
+        reason = "polkit check or sender UID comparison found in every candidate handler"
+    elif checked:
+        verdict = VERDICT_UNKNOWN
+        reason = f"authorization check found in only {len(checked)} of {len(direct)} candidate handlers"
+    elif direct and not hints:
+        verdict = VERDICT_NONE_VISIBLE
+        reason = "handler found without any authorization pattern"
+    elif direct:
+        verdict = VERDICT_UNKNOWN
+        reason = "caller identity read or polkit subject built without a visible check"
+    elif referenced:
+        verdict = VERDICT_UNKNOWN
+        reason = "authorization not attributable to this method's handler"
+    elif named:
+        verdict = VERDICT_UNKNOWN
+        reason = "same-name handlers not attributable to this interface or object path"
+    else:
+        verdict = VERDICT_UNKNOWN
+        reason = "no handler found"
+
+    evidence = list(dict.fromkeys(pid + authz + hints))
+    return {
+        "verdict": verdict,
+        "reason": reason,
+        "handlers": [_describe(function) for function in direct + referenced],
+        "evidence": evidence[:MAX_EVIDENCE],
+    }
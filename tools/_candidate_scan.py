@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import fnmatch
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable
+
+try:
+    import re._parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse  # type: ignore[no-redef]
+
+
+# 内置候选行扫描器（rg 不可用时的替代实现）：
+# - 将候选正则编译为一个带命名分组的字节串交替式；先用各正则的必需字面量在 mmap 上做 find 定位候选行，
+#   再只对候选行执行交替式（`\b` 开头的正则无法利用 re 的前缀加速，逐位置整文件匹配慢一个数量级）
+# - 遍历规则与 rg 默认行为对齐：跳过隐藏文件/目录与二进制文件，遵循排除 glob、各级 .gitignore 与 .git/info/exclude
+# - 文件按批分发到进程池；文件数较少时在当前进程内扫描，避免进程启动开销
+# - 返回结构化命中：{"file": 相对路径, "line": 行号, "pattern": 命中的候选正则, "text": 行文本}
+
+FILES_PER_TASK = 64
+MIN_FILES_FOR_POOL = 256
+BINARY_SNIFF_BYTES = 8192
+MAX_LINE_TEXT = 500
+MIN_LITERAL_LENGTH = 3
+
+_compiled_cache: dict[tuple[str, ...], tuple[re.Pattern[bytes], list[bytes] | None]] = {}
+
+
+def _required_literals(items: Any) -> list[str] | None:
+    # 返回“至少出现其一”的字面量集合（取最短字面量最长者），无法确定时返回 None
+    candidates: list[list[str]] = []
+    run: list[str] = []
+    for op, av in list(items) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append(["".join(run)])
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            found = _required_literals(av[-1])
+        elif op is sre_parse.BRANCH:
+            alternatives = [_required_literals(alternative) for alternative in av[1]]
+            found = None if any(a is None for a in alternatives) else [lit for a in alternatives for lit in a]
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            found = _required_literals(av[2])
+        else:
+            found = None
+        if found:
+            candidates.append(found)
+    candidates = [c for c in candidates if min(len(lit) for lit in c) >= MIN_LITERAL_LENGTH]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (min(len(lit) for lit in c), -len(c)))
+
+
+def compile_alternation(patterns: Iterable[str]) -> tuple[re.Pattern[bytes], list[bytes] | None]:
+    # 返回交替式与预筛字面量；任一正则提取不到必需字面量时不做预筛（整文件匹配）
+    patterns = tuple(patterns)
+    if patterns not in _compiled_cache:
+        source = "|".join(f"(?P<p{index}>{pattern})" for index, pattern in enumerate(patterns))
+        literals: list[bytes] | None = []
+        for pattern in patterns:
+            required = _required_literals(sre_parse.parse(pattern))
+            if required is None:
+                literals = None
+                break
+            literals.extend(lit.encode("utf-8") for lit in required if lit.encode("utf-8") not in literals)
+        _compiled_cache[patterns] = (re.compile(source.encode("utf-8"), re.MULTILINE), literals)
+    return _compiled_cache[patterns]
+
+
+def _glob_to_regex(pattern: str) -> str:
+    # gitignore 通配：`**/` 匹配任意层目录，`/**` 匹配其下全部内容，`*`/`?` 不跨越 `/`
+    out: list[str] = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            out.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            out.append(".*")
+            index += 2
+        elif char == "*":
+            out.append("[^/]*")
+            index += 1
+        elif char == "?":
+            out.append("[^/]")
+            index += 1
+        elif char == "[":
+            end = pattern.find("]", index + 1)
+            if end == -1:
+                out.append(re.escape(char))
+                index += 1
+            else:
+                body = pattern[index + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                index = end + 1
+        elif char == "\\" and index + 1 < len(pattern):
+            out.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            out.append(re.escape(char))
+            index += 1
+    return "".join(out)
+
+
+class GitIgnore:
+    # 规则按目录由浅入深累积，后出现的规则优先（与 git 一致）；被忽略的目录整体剪枝，其下文件不再被 `!` 规则恢复
+    def __init__(self) -> None:
+        self.rules: list[tuple[str, bool, bool, re.Pattern[str]]] = []
+
+    def add_file(self, path: Path, base: str) -> None:
+        try:
+            lines = path.read_text(encoding="utf-8", errors="replace").splitlines()
+        except OSError:
+            return
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            regex = _glob_to_regex(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((base, negate, dir_only, re.compile(f"{regex}$")))
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        result = False
+        for base, negate, dir_only, regex in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                candidate = rel_path[len(base) + 1 :]
+            else:
+                candidate = rel_path
+            if regex.match(candidate):
+                result = not negate
+        return result
+
+
+def glob_excluded(rel_path: str, globs: Iterable[str], is_dir: bool = False) -> bool:
+    # rg `--glob '!x'` 语义：不含 `/` 的 glob 匹配文件名，含 `/` 的 glob 相对根目录匹配；`dir/**` 直接剪掉目录
+    name = rel_path.rsplit("/", 1)[-1]
+    for glob in globs:
+        if is_dir:
+            if glob.endswith("/**") and fnmatch.fnmatch(rel_path, glob[:-3]):
+                return True
+            continue
+        if "/" in glob:
+            if fnmatch.fnmatch(rel_path, glob):
+                return True
+        elif fnmatch.fnmatch(name, glob):
+            return True
+    return False
+
+
+def iter_candidate_files(root: Path, exclude_globs: Iterable[str]) -> list[str]:
+    exclude_globs = list(exclude_globs)
+    gitignore = GitIgnore()
+    gitignore.add_file(root / ".git" / "info" / "exclude", "")
+    files: list[str] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        current = Path(dirpath)
+        rel_dir = current.relative_to(root).as_posix()
+        rel_dir = "" if rel_dir == "." else rel_dir
+        if ".gitignore" in filenames:
+            gitignore.add_file(current / ".gitignore", rel_dir)
+
+        kept_dirs = []
+        for name in sorted(dirnames):
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if name.startswith(".") or glob_excluded(rel_path, exclude_globs, is_dir=True):
+                continue
+            if gitignore.ignored(rel_path, is_dir=True):
+                continue
+            kept_dirs.append(name)
+        dirnames[:] = kept_dirs
+
+        for name in sorted(filenames):
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if name.startswith(".") or glob_excluded(rel_path, exclude_globs):
+                continue
+            if gitignore.ignored(rel_path, is_dir=False):
+                continue
+            files.append(rel_path)
+    return files
+
+
+def _candidate_line_starts(data: mmap.mmap, literals: list[bytes]) -> list[int]:
+    starts: set[int] = set()
+    for literal in literals:
+        index = data.find(literal)
+        while index != -1:
+            line_start = data.rfind(b"\n", 0, index) + 1
+            starts.add(line_start)
+            line_end = data.find(b"\n", index)
+            if line_end == -1:
+                break
+            index = data.find(literal, line_end)
+    return sorted(starts)
+
+
+def _scan_file(
+    root: str,
+    rel_path: str,
+    regex: re.Pattern[bytes],
+    literals: list[bytes] | None,
+    patterns: tuple[str, ...],
+) -> list[dict[str, Any]]:
+    path = os.path.join(root, rel_path)
+    try:
+        with open(path, "rb") as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data.find(b"\0", 0, BINARY_SNIFF_BYTES) != -1:
+                    return []
+                if literals is None:
+                    line_starts = sorted({data.rfind(b"\n", 0, m.start()) + 1 for m in regex.finditer(data)})
+                else:
+                    line_starts = _candidate_line_starts(data, literals)
+
+                hits: list[dict[str, Any]] = []
+                line_no = 1
+                counted_to = 0
+                for line_start in line_starts:
+                    line_end = data.find(b"\n", line_start)
+                    if line_end == -1:
+                        line_end = len(data)
+                    line = data[line_start:line_end]
+                    match = regex.search(line)
+                    if match is None:
+                        continue
+                    line_no += data[counted_to:line_start].count(b"\n")
+                    counted_to = line_start
+                    hits.append(
+                        {
+                            "file": rel_path,
+                            "line": line_no,
+                            "pattern": patterns[int(match.lastgroup[1:])],
+                            "text": line[:MAX_LINE_TEXT].decode("utf-8", errors="replace").rstrip("\r"),
+                        }
+                    )
+                return hits
+    except (OSError, ValueError):
+        return []
+
+
+def _scan_batch(root: str, rel_paths: list[str], patterns: tuple[str, ...]) -> list[dict[str, Any]]:
+    regex, literals = compile_alternation(patterns)
+    hits: list[dict[str, Any]] = []
+    for rel_path in rel_paths:
+        hits.extend(_scan_file(root, rel_path, regex, literals, patterns))
+    return hits
+
+
+def scan_candidates(
+    root: Path,
+    patterns: Iterable[str],
+    exclude_globs: Iterable[str],
+    paths: Iterable[str] | None = None,
+    jobs: int | None = None,
+) -> list[dict[str, Any]]:
+    # paths 指定时只扫描这些文件（与 rg 显式传入路径一致，不再套用 .gitignore）
+    patterns = tuple(patterns)
+    root_str = str(root)
+    rel_paths = list(paths) if paths is not None else iter_candidate_files(root, exclude_globs)
+    batches = [rel_paths[i : i + FILES_PER_TASK] for i in range(0, len(rel_paths), FILES_PER_TASK)]
+    jobs = jobs or os.cpu_count() or 1
+
+    if jobs == 1 or len(rel_paths) < MIN_FILES_FOR_POOL:
+        results = [_scan_batch(root_str, batch, patterns) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_scan_batch, [root_str] * len(batches), batches, [patterns] * len(batches)))
+    return [hit for batch_hits in results for hit in batch_hits]
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import random
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+
+# codex 调用的自适应并发与超时控制（供 AI 检查工具共用）：
+# - 并发（AIMD）：worker 线程数为上限，实际同时运行的 codex 数由 limit 决定；每次成功 limit += 1/limit（约每轮 +1），
+#   超时或非 0 退出视为拥塞，limit 减半（同一个中位延迟窗口内最多减一次，避免一阵失败直接压到下限；
+#   该类调用样本不足时以其当前超时作为窗口）
+# - 超时：按调用类别（kind：方法/分片检查、JSON 修复、服务上下文等）分别统计延迟，各类观测到足够样本后取最近 LATENCY_WINDOW 次
+#   调用延迟的 p95 × TIMEOUT_MULTIPLIER，限制在 [min_timeout, max_timeout]；样本不足时使用 max_timeout（即 --timeout）。
+#   分类统计避免低成本的修复调用把完整分析的超时压到下限；只统计成功调用的延迟：后端整体变慢时，超时后的重试以 max_timeout
+#   运行并成功，其真实延迟进入窗口，超时随之放宽；偶发卡死的调用不会把超时一直顶在上限
+# - 重试：超时与非 0 退出按指数退避（带抖动）重试；超时后的重试直接使用 max_timeout，避免慢而正常的调用被反复杀掉
+# - adaptive=False 时并发固定为上限、超时固定为 max_timeout，仅保留重试
+# - 用量：每次尝试（含重试）累计提示词/输出字符数、估算 token 数与耗时；可传入 usage 字典记录单次检查的用量，
+#   全局累计用于 --budget（tokens=N 按估算 token 总数、seconds=N 按 codex 调用耗时总和），用尽后由调用方停止调度新的检查
+
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 5
+TIMEOUT_MULTIPLIER = 3.0
+MAX_BACKOFF_SECONDS = 300.0
+CHARS_PER_TOKEN = 4
+BUDGET_KEYS = ("tokens", "seconds")
+DEFAULT_KIND = "check"
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：约 4 个字符 1 个 token
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def parse_budget(values: list[str]) -> dict[str, float]:
+    budget: dict[str, float] = {}
+    for value in values:
+        key, sep, amount = value.partition("=")
+        if not sep or key not in BUDGET_KEYS:
+            raise ValueError(f"expected tokens=N or seconds=N, got {value!r}")
+        try:
+            budget[key] = float(amount)
+        except ValueError:
+            raise ValueError(f"invalid number in {value!r}") from None
+        if budget[key] <= 0:
+            raise ValueError(f"{key} budget must be > 0")
+    return budget
+
+
+def _output_text(chunk: str | bytes | None) -> str:
+    if isinstance(chunk, bytes):
+        return chunk.decode("utf-8", errors="replace")
+    return chunk or ""
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def new_usage() -> dict[str, Any]:
+    return {"calls": 0, "prompt_chars": 0, "output_chars": 0, "prompt_tokens": 0, "output_tokens": 0, "seconds": 0.0}
+
+
+class CodexController:
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_timeout: float,
+        min_timeout: float,
+        retries: int,
+        backoff: float,
+        adaptive: bool = True,
+        min_concurrency: int = 1,
+        before_launch: Callable[[], None] | None = None,
+        budget: dict[str, float] | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self.before_launch = before_launch
+        self.budget = dict(budget or {})
+        self.usage = new_usage()
+        self.limit = float(max_concurrency)
+        self.lowest_limit = float(max_concurrency)
+        self.active = 0
+        self.latencies: dict[str, deque[float]] = {}
+        self.counts = {"calls": 0, "succeeded": 0, "timeouts": 0, "failed_exits": 0, "retries": 0}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def _samples(self, kind: str) -> list[float]:
+        return list(self.latencies.get(kind) or ())
+
+    def _timeout_locked(self, kind: str) -> float:
+        samples = self._samples(kind)
+        if not self.adaptive or len(samples) < MIN_LATENCY_SAMPLES:
+            return self.max_timeout
+        observed = percentile(samples, 0.95) * TIMEOUT_MULTIPLIER
+        return max(self.min_timeout, min(self.max_timeout, observed))
+
+    def timeout(self, kind: str = DEFAULT_KIND) -> float:
+        with self._condition:
+            return self._timeout_locked(kind)
+
+    def _acquire(self) -> None:
+        with self._condition:
+            while self.active >= max(self.min_concurrency, int(self.limit)):
+                self._condition.wait()
+            self.active += 1
+            self.counts["calls"] += 1
+
+    def _release(self, kind: str, latency: float, ok: bool) -> None:
+        with self._condition:
+            self.active -= 1
+            if ok:
+                self.latencies.setdefault(kind, deque(maxlen=LATENCY_WINDOW)).append(latency)
+                self.counts["succeeded"] += 1
+                if self.adaptive:
+                    self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            elif self.adaptive:
+                now = time.monotonic()
+                samples = self._samples(kind)
+                cooldown = percentile(samples, 0.5) if len(samples) >= MIN_LATENCY_SAMPLES else self._timeout_locked(kind)
+                if now - self._last_decrease >= cooldown:
+                    self.limit = max(float(self.min_concurrency), self.limit / 2.0)
+                    self.lowest_limit = min(self.lowest_limit, self.limit)
+                    self._last_decrease = now
+            self._condition.notify_all()
+
+    def _account(self, usage: dict[str, Any] | None, prompt: str, output: str, seconds: float) -> None:
+        with self._condition:
+            for target in (self.usage, usage):
+                if target is None:
+                    continue
+                target["calls"] = target.get("calls", 0) + 1
+                target["prompt_chars"] = target.get("prompt_chars", 0) + len(prompt)
+                target["output_chars"] = target.get("output_chars", 0) + len(output)
+                target["prompt_tokens"] = target.get("prompt_tokens", 0) + estimate_tokens(prompt)
+                target["output_tokens"] = target.get("output_tokens", 0) + estimate_tokens(output)
+                target["seconds"] = round(target.get("seconds", 0.0) + seconds, 3)
+
+    def budget_exhausted(self) -> str:
+        # 返回用尽原因；未设置或未用尽时返回空字符串
+        with self._condition:
+            used = {
+                "tokens": self.usage["prompt_tokens"] + self.usage["output_tokens"],
+                "seconds": self.usage["seconds"],
+            }
+        for key in BUDGET_KEYS:
+            if key in self.budget and used[key] >= self.budget[key]:
+                return f"{key} budget exhausted ({used[key]:g} of {self.budget[key]:g})"
+        return ""
+
+    def run(
+        self,
+        launch: Callable[[float], subprocess.CompletedProcess],
+        prompt: str = "",
+        usage: dict[str, Any] | None = None,
+        kind: str = DEFAULT_KIND,
+    ) -> subprocess.CompletedProcess:
+        # launch(timeout) 执行一次 codex 调用；重试用尽后返回最后一次结果或抛出最后一次 TimeoutExpired；
+        # prompt 只用于用量统计，usage 非空时累计本次检查（含重试）的用量；kind 决定延迟统计与超时所用的类别
+        attempt = 0
+        timeout = self.timeout(kind)
+        while True:
+            if self.before_launch is not None:
+                self.before_launch()
+            self._acquire()
+            started = time.monotonic()
+            try:
+                result = launch(timeout)
+            except subprocess.TimeoutExpired as exc:
+                self._release(kind, timeout, ok=False)
+                self._account(usage, prompt, _output_text(exc.stdout), time.monotonic() - started)
+                with self._condition:
+                    self.counts["timeouts"] += 1
+                if attempt >= self.retries:
+                    raise
+                timeout = self.max_timeout
+            else:
+                elapsed = time.monotonic() - started
+                self._release(kind, elapsed, ok=result.returncode == 0)
+                self._account(usage, prompt, result.stdout or "", elapsed)
+                if result.returncode == 0:
+                    return result
+                with self._condition:
+                    self.counts["failed_exits"] += 1
+                if attempt >= self.retries:
+                    return result
+            attempt += 1
+            with self._condition:
+                self.counts["retries"] += 1
+            delay = min(MAX_BACKOFF_SECONDS, self.backoff * 2 ** (attempt - 1)) * (1.0 + random.random() * 0.5)
+            time.sleep(delay)
+
+    def stats(self) -> dict[str, Any]:
+        # 顶层延迟与超时为主检查类别（DEFAULT_KIND）；各类别明细见 latency_by_kind
+        with self._condition:
+            samples = self._samples(DEFAULT_KIND)
+            stats: dict[str, Any] = dict(self.counts)
+            stats.update(
+                {
+                    "adaptive": self.adaptive,
+                    "max_concurrency": self.max_concurrency,
+                    "final_concurrency": int(self.limit),
+                    "lowest_concurrency": int(self.lowest_limit),
+                    "latency_p50_seconds": round(percentile(samples, 0.5), 3),
+                    "latency_p95_seconds": round(percentile(samples, 0.95), 3),
+                }
+            )
+            stats["latency_by_kind"] = {
+                kind: {
+                    "samples": len(window),
+                    "latency_p50_seconds": round(percentile(list(window), 0.5), 3),
+                    "latency_p95_seconds": round(percentile(list(window), 0.95), 3),
+                    "timeout_seconds": round(self._timeout_locked(kind), 3),
+                }
+                for kind, window in sorted(self.latencies.items())
+            }
+            stats["usage"] = dict(self.usage)
+            stats["timeout_seconds"] = round(self._timeout_locked(DEFAULT_KIND), 3)
+        if self.budget:
+            stats["budget"] = dict(self.budget)
+        return stats
+
+
+def throughput(usage: dict[str, Any], wall_seconds: float, checked: int) -> dict[str, Any]:
+    # 汇总吞吐：每分钟完成的检查数与估算 token 数（按整次运行的墙钟时间）
+    minutes = max(wall_seconds, 1e-6) / 60.0
+    tokens = usage["prompt_tokens"] + usage["output_tokens"]
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "checked": checked,
+        "checked_per_minute": round(checked / minutes, 2),
+        "tokens": tokens,
+        "tokens_per_minute": round(tokens / minutes, 1),
+        "codex_seconds": usage["seconds"],
+    }
@@ -1,16 +1,28 @@
 from __future__ import annotations
 
+import json
 import os
+import re
 import subprocess
-from typing import Iterable
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+
+from _trace import span
 
 
 # 公共工具函数：
 # - 统一处理 UTF-8 BOM、零宽字符（避免肉眼不可见字符污染参数）
 # - 统一执行外部命令
 # - 统一解析 `key=value` 输出（systemctl show 等）
+# - 统一 systemd service 枚举与批量 systemctl show（一次进程查询多个 unit）
 # - 统一区分“缺少命令”和“缺少输入文件”的错误输出/退出码
 # - 统一 dpkg-query 所属包查询（dpkg-query -S）
+# - 统一 JSON Lines 流式输出（逐条写出并立即 flush）
+# - 统一运行统计（--stats）：外部命令的次数、耗时直方图、退出码与输出大小；按阶段累计耗时
+# - 外部命令与阶段同时记录为执行轨迹 span（--trace-file，见 _trace.py）
 
 _ZERO_WIDTH_TRANSLATION = str.maketrans(
     "",
@@ -51,33 +63,149 @@ def parse_key_value_lines(output: str) -> dict[str, str]:
     return result
 
 
+# 外部命令耗时直方图的桶上界（秒）；超过最后一个上界的计入 ">5s"
+LATENCY_BUCKETS = ((0.01, "<=10ms"), (0.05, "<=50ms"), (0.1, "<=100ms"), (0.5, "<=500ms"), (1.0, "<=1s"), (5.0, "<=5s"))
+
+
+class RunStats:
+    # 进程内运行统计：run_command 始终记录（开销为一次计时与字典更新），--stats 时写入 JSON summary。
+    # 阶段耗时为独占时间：嵌套阶段的耗时只计入最内层，各阶段之和不超过单线程的总耗时
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.monotonic()
+            self.phases: dict[str, dict[str, Any]] = {}
+            self.commands: dict[str, dict[str, Any]] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [time.monotonic(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.monotonic() - frame[0]
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                entry = self.phases.setdefault(name, {"count": 0, "seconds": 0.0})
+                entry["count"] += 1
+                entry["seconds"] += elapsed - frame[1]
+
+    def record_command(self, args: list[str], seconds: float, exit_code: int | str, output_chars: int) -> None:
+        name = os.path.basename(args[0]) if args else ""
+        label = next((label for bound, label in LATENCY_BUCKETS if seconds <= bound), ">5s")
+        with self._lock:
+            entry = self.commands.setdefault(
+                name,
+                {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "output_chars": 0, "exit_codes": {}, "histogram": {}},
+            )
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["output_chars"] += output_chars
+            entry["exit_codes"][str(exit_code)] = entry["exit_codes"].get(str(exit_code), 0) + 1
+            entry["histogram"][label] = entry["histogram"].get(label, 0) + 1
+
+    def report(self) -> dict[str, Any]:
+        with self._lock:
+            phases = {
+                name: {"count": entry["count"], "seconds": round(entry["seconds"], 4)}
+                for name, entry in sorted(self.phases.items())
+            }
+            commands = {}
+            for name, entry in sorted(self.commands.items()):
+                commands[name] = {
+                    "count": entry["count"],
+                    "seconds": round(entry["seconds"], 4),
+                    "avg_seconds": round(entry["seconds"] / entry["count"], 4),
+                    "max_seconds": round(entry["max_seconds"], 4),
+                    "output_chars": entry["output_chars"],
+                    "exit_codes": dict(sorted(entry["exit_codes"].items())),
+                    "histogram": {
+                        label: entry["histogram"][label]
+                        for label in [label for _, label in LATENCY_BUCKETS] + [">5s"]
+                        if label in entry["histogram"]
+                    },
+                }
+            return {
+                "total_seconds": round(time.monotonic() - self.started, 4),
+                "phases": phases,
+                "commands": commands,
+            }
+
+
+RUN_STATS = RunStats()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    with RUN_STATS.phase(name), span(name, "phase"):
+        yield
+
+
 def run_command(
     args: list[str],
     timeout_seconds: float,
     *,
     env: dict[str, str] | None = None,
 ) -> subprocess.CompletedProcess[str]:
-    return subprocess.run(
-        args,
-        check=False,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        timeout=timeout_seconds,
-        env=env,
-    )
+    with span(os.path.basename(args[0]) if args else "", "command", {"argv": " ".join(args)}) as trace_args:
+        started = time.monotonic()
+        try:
+            completed = subprocess.run(
+                args,
+                check=False,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=timeout_seconds,
+                env=env,
+            )
+        except subprocess.TimeoutExpired:
+            RUN_STATS.record_command(args, time.monotonic() - started, "timeout", 0)
+            raise
+        except FileNotFoundError:
+            RUN_STATS.record_command(args, time.monotonic() - started, "not-found", 0)
+            raise
+        output_chars = len(completed.stdout or "") + len(completed.stderr or "")
+        RUN_STATS.record_command(args, time.monotonic() - started, completed.returncode, output_chars)
+        trace_args.update({"exit_code": completed.returncode, "output_chars": output_chars})
+        return completed
 
 
-def systemctl_show(service: str, properties: Iterable[str], timeout_seconds: float) -> str:
-    args = ["systemctl", "--no-pager", "show", service]
-    for prop in properties:
-        args.append(f"--property={prop}")
+SYSTEMCTL_SHOW_BATCH_SIZE = 100
+
+_BLANK_LINE_RE = re.compile(r"\n[ \t]*\n")
+
+
+def chunks(values: list[str], size: int) -> Iterable[list[str]]:
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
 
+
+def _systemctl_env() -> dict[str, str]:
     env = os.environ.copy()
     env.setdefault("SYSTEMD_COLORS", "0")
     env.setdefault("SYSTEMD_PAGER", "")
+    return env
+
+
+def systemctl_show(service: str, properties: Iterable[str], timeout_seconds: float) -> str:
+    args = ["systemctl", "--no-pager", "show", service]
+    for prop in properties:
+        args.append(f"--property={prop}")
 
-    completed = run_command(args, timeout_seconds, env=env)
+    with phase("unit_query"):
+        completed = run_command(args, timeout_seconds, env=_systemctl_env())
     if completed.returncode != 0:
         if (completed.stdout or "").strip():
             return completed.stdout
@@ -86,6 +214,91 @@ def systemctl_show(service: str, properties: Iterable[str], timeout_seconds: flo
     return completed.stdout
 
 
+def systemctl_show_many(services: list[str], properties: Iterable[str], timeout_seconds: float) -> list[str]:
+    # systemctl show 对多个 unit 按参数顺序输出，块之间以空行分隔
+    if len(services) == 1:
+        return [systemctl_show(services[0], properties, timeout_seconds)]
+
+    args = ["systemctl", "--no-pager", "show", *services]
+    for prop in properties:
+        args.append(f"--property={prop}")
+
+    with phase("unit_query"):
+        completed = run_command(args, timeout_seconds, env=_systemctl_env())
+    if completed.returncode != 0:
+        message = (completed.stderr or "").strip() or "systemctl show failed"
+        raise RuntimeError(message)
+
+    blocks = [block for block in _BLANK_LINE_RE.split(completed.stdout.strip("\n")) if block.strip()]
+    if len(blocks) != len(services):
+        raise RuntimeError(f"systemctl show returned {len(blocks)} blocks for {len(services)} units")
+    return blocks
+
+
+def systemctl_show_batches(
+    services: list[str],
+    properties: Iterable[str],
+    timeout_seconds: float,
+    batch_size: int = SYSTEMCTL_SHOW_BATCH_SIZE,
+) -> Iterator[tuple[str, str | Exception | None]]:
+    # 批量查询失败（非法 unit 名、超时等）时对该批返回 None，由调用方逐个回退以保留单 unit 的错误信息；
+    # 单 unit 的批本身就是逐个查询，直接返回其异常，避免同一 unit 再查一次（超时时重复等待）
+    # 调用方通过 systemctl_show_output 取得最终输出
+    properties = list(properties)
+    for group in chunks(services, batch_size):
+        try:
+            outputs: list[str | Exception | None] = list(systemctl_show_many(group, properties, timeout_seconds))
+        except (RuntimeError, subprocess.TimeoutExpired) as exc:
+            outputs = [exc] if len(group) == 1 else [None] * len(group)
+        yield from zip(group, outputs)
+
+
+def systemctl_show_output(
+    service: str,
+    batch_output: str | Exception | None,
+    properties: Iterable[str],
+    timeout_seconds: float,
+) -> str:
+    if isinstance(batch_output, Exception):
+        raise batch_output
+    if batch_output is None:
+        return systemctl_show(service, properties, timeout_seconds)
+    return batch_output
+
+
+def _parse_unit_names(output: str, *, skip_states: frozenset[str]) -> set[str]:
+    names: set[str] = set()
+    for raw in output.splitlines():
+        fields = raw.replace("\u25cf", " ").split()
+        if not fields:
+            continue
+        name = fields[0]
+        if not name.endswith(".service") or name.endswith("@.service"):
+            continue
+        if len(fields) > 1 and fields[1] in skip_states:
+            continue
+        names.add(name)
+    return names
+
+
+def list_service_units(timeout_seconds: float) -> list[str]:
+    # 已加载（含非 active）与已安装的 service 并集；模板 unit（foo@.service）无法 show，跳过
+    # list-unit-files 中 state=alias 的条目是其他 unit 的别名（show 结果与目标 unit 相同），跳过以免重复检查
+    queries = (
+        (["systemctl", "--no-pager", "list-units", "--type=service", "--all", "--plain", "--no-legend"], frozenset({"not-found"})),
+        (["systemctl", "--no-pager", "list-unit-files", "--type=service", "--no-legend"], frozenset({"alias"})),
+    )
+    names: set[str] = set()
+    for args, skip_states in queries:
+        with phase("service_enumeration"):
+            completed = run_command(args, timeout_seconds, env=_systemctl_env())
+        if completed.returncode != 0:
+            message = (completed.stderr or "").strip() or f"systemctl {args[2]} failed"
+            raise RuntimeError(message)
+        names.update(_parse_unit_names(completed.stdout, skip_states=skip_states))
+    return sorted(names)
+
+
 def classify_file_not_found(exc: FileNotFoundError, known_commands: Iterable[str]) -> tuple[int, str]:
     filename = getattr(exc, "filename", "") or ""
     missing = os.path.basename(filename)
@@ -117,3 +330,10 @@ def dpkg_query_owners(path: str, timeout_seconds: float) -> list[str]:
     if "no path found" in message or "no packages found" in message:
         return []
     raise RuntimeError((completed.stderr or completed.stdout or "").strip() or "dpkg-query -S failed")
+
+
+def write_jsonl_record(record_type: str, key: str, value: Any) -> None:
+    with phase("output"):
+        line = json.dumps({"type": record_type, key: value}, ensure_ascii=False, sort_keys=True)
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
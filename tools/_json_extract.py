@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+from string import Template
+from typing import Any, Callable, Iterator
+
+
+# codex 输出的容错 JSON 提取与修复提示词（供 AI 检查工具共用）：
+# - 输出常夹带说明文字或 ``` 代码块：顺序扫描 `{`/`[`，用 raw_decode 逐个解析顶层 JSON 值（解析成功即跳过其全文，
+#   嵌套值不会被当作候选），取最后一个通过 schema 校验的值
+# - schema 为 JSON Schema 的小子集（type/required/properties/items/enum），编译为校验函数，错误信息带 JSON 路径，
+#   同时原样写入修复提示词，让 codex 只修格式而不必重新分析
+# - 都不通过时返回最后一个候选及其校验错误，由调用方决定是否发起一次修复
+
+MAX_REPAIR_OUTPUT_CHARS = 100_000
+
+_TYPES: dict[str, tuple[type, ...]] = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+}
+
+Validator = Callable[[Any], "list[str]"]
+
+
+def compile_schema(schema: dict[str, Any]) -> Validator:
+    expected = schema.get("type")
+    required = list(schema.get("required") or [])
+    enum = schema.get("enum")
+    properties = {key: compile_schema(sub) for key, sub in (schema.get("properties") or {}).items()}
+    items = compile_schema(schema["items"]) if "items" in schema else None
+
+    def validate(value: Any, path: str = "$") -> list[str]:
+        if expected is not None:
+            is_bool = isinstance(value, bool)
+            if not isinstance(value, _TYPES[expected]) or (is_bool and expected != "boolean"):
+                return [f"{path}: expected {expected}, got {type(value).__name__}"]
+        if enum is not None and value not in enum:
+            return [f"{path}: must be one of {enum}, got {json.dumps(value, ensure_ascii=False)}"]
+        errors: list[str] = []
+        if isinstance(value, dict):
+            missing = [key for key in required if key not in value]
+            if missing:
+                errors.append(f"{path}: missing keys {missing}")
+            for key, sub in properties.items():
+                if key in value:
+                    errors.extend(sub(value[key], f"{path}.{key}"))
+        if isinstance(value, list) and items is not None:
+            for index, item in enumerate(value):
+                errors.extend(items(item, f"{path}[{index}]"))
+        return errors
+
+    return validate
+
+
+def iter_json_values(text: str) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    index = 0
+    length = len(text)
+    while index < length:
+        starts = [pos for pos in (text.find("{", index), text.find("[", index)) if pos != -1]
+        if not starts:
+            return
+        start = min(starts)
+        try:
+            value, end = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            index = start + 1
+            continue
+        yield value
+        index = end
+
+
+def extract_json(text: str, validator: Validator) -> tuple[Any, list[str]]:
+    # 返回 (值, 校验错误)：优先最后一个校验通过的顶层值；否则为最后一个顶层值及其错误
+    if not text.strip():
+        return None, ["Empty codex output"]
+    last: Any = None
+    last_errors = ["Codex output contains no JSON object or array"]
+    for value in iter_json_values(text):
+        errors = validator(value)
+        if not errors:
+            last, last_errors = value, []
+        elif last_errors:
+            last, last_errors = value, errors
+    return last, last_errors
+
+
+REPAIR_PROMPT = Template(
+    """The text below was supposed to be a single JSON document for an automated checker, but it failed validation.
+
+Validation errors:
+${errors}
+
+Return ONLY the corrected JSON document: no prose, no code fences. Keep every verdict, finding and evidence item
+from the original text and fix only the structure. Do not re-run the analysis or read any files.
+
+Required JSON schema:
+${schema}
+
+Original output:
+${output}
+"""
+)
+
+
+def render_repair_prompt(output: str, errors: list[str], schema: dict[str, Any]) -> str:
+    if len(output) > MAX_REPAIR_OUTPUT_CHARS:
+        # 保留末尾：最终答案通常位于输出最后
+        output = "...(truncated)\n" + output[-MAX_REPAIR_OUTPUT_CHARS:]
+    return REPAIR_PROMPT.substitute(
+        errors="\n".join(f"- {error}" for error in errors),
+        schema=json.dumps(schema, indent=2, ensure_ascii=False),
+        output=output,
+    )
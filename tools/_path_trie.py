@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+
+# 路径前缀树（文件系统范围查询）：
+# - 以路径分量为边，节点上按 owner（service）记录该路径的访问类别
+# - 类别：read_only / inaccessible / writable / tmpfs；最长前缀优先（更具体的路径覆盖父路径）
+# - 同一路径同一 owner 存在多个类别时按 CATEGORY_PRECEDENCE 取最严格者；
+#   例外：显式可写路径（ReadWritePaths 等）覆盖同一路径上由 ProtectSystem 产生的只读根（与 systemd 一致）
+# - tmpfs（ProtectHome=tmpfs、PrivateTmp）是私有挂载：宿主机上的该路径既不可读也不可写
+# - 每个 owner 另有默认类别（未命中任何前缀时生效），用于表达 ProtectSystem=strict 与非 strict 的差异
+
+CATEGORY_READ_ONLY = "read_only"
+CATEGORY_INACCESSIBLE = "inaccessible"
+CATEGORY_WRITABLE = "writable"
+CATEGORY_TMPFS = "tmpfs"
+
+CATEGORY_PRECEDENCE = (
+    CATEGORY_INACCESSIBLE,
+    CATEGORY_READ_ONLY,
+    CATEGORY_TMPFS,
+    CATEGORY_WRITABLE,
+)
+
+PRIVATE_TMP_ROOTS = ("/tmp", "/var/tmp")
+
+
+def split_path(path: str) -> list[str]:
+    # systemd 的 *Paths 允许 "-"（忽略不存在）与 "+"（相对 RootDirectory）前缀，这里统一剥离
+    raw = path.strip().lstrip("-+")
+    return [part for part in raw.split("/") if part and part != "."]
+
+
+def join_path(parts: Iterable[str]) -> str:
+    return "/" + "/".join(parts)
+
+
+class _Node:
+    __slots__ = ("children", "marks")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.marks: dict[str, str] = {}
+
+
+def _stricter(current: str | None, candidate: str) -> str:
+    if current is None:
+        return candidate
+    if CATEGORY_PRECEDENCE.index(candidate) < CATEGORY_PRECEDENCE.index(current):
+        return candidate
+    return current
+
+
+class PathTrie:
+    def __init__(self) -> None:
+        self._root = _Node()
+        self._defaults: dict[str, str] = {}
+
+    def owners(self) -> list[str]:
+        return sorted(self._defaults)
+
+    def set_default(self, owner: str, category: str) -> None:
+        self._defaults[owner] = category
+
+    def insert(self, path: str, owner: str, category: str) -> None:
+        node = self._root
+        for part in split_path(path):
+            node = node.children.setdefault(part, _Node())
+        node.marks[owner] = _stricter(node.marks.get(owner), category)
+        self._defaults.setdefault(owner, CATEGORY_WRITABLE)
+
+    def _find(self, path: str) -> tuple[dict[str, str], _Node | None]:
+        effective = dict(self._defaults)
+        node: _Node | None = self._root
+        effective.update(self._root.marks)
+        for part in split_path(path):
+            node = node.children.get(part) if node is not None else None
+            if node is None:
+                break
+            effective.update(node.marks)
+        return effective, node
+
+    def resolve(self, path: str) -> dict[str, str]:
+        effective, _ = self._find(path)
+        return effective
+
+    def owners_marked_under(self, path: str, category: str) -> set[str]:
+        _, node = self._find(path)
+        if node is None:
+            return set()
+        owners: set[str] = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for owner, mark in current.marks.items():
+                if mark == category:
+                    owners.add(owner)
+            stack.extend(current.children.values())
+        return owners
+
+
+def _effective_sets(result: dict[str, Any]) -> tuple[str, dict[str, list[str]]]:
+    write_scope = result.get("write_scope") or {}
+    mode = write_scope.get("mode") or "all_except"
+    writable = list((write_scope.get("paths") if mode == "only" else write_scope.get("writable_exceptions")) or [])
+
+    # ProtectSystem 只读根在同一路径被显式设为可写时让位；ReadOnlyPaths/ProtectHome=read-only 仍按最严格合并
+    writable_keys = {join_path(split_path(p)) for p in writable}
+    explicit_read_only = {
+        join_path(split_path(p))
+        for p in list(result.get("read_only_paths") or []) + list(result.get("protect_home_read_only_roots") or [])
+    }
+    read_only = [
+        p
+        for p in write_scope.get("read_only_roots") or []
+        if join_path(split_path(p)) not in writable_keys or join_path(split_path(p)) in explicit_read_only
+    ]
+
+    tmpfs = list(result.get("protect_home_tmpfs_roots") or [])
+    if result.get("private_tmp"):
+        tmpfs.extend(PRIVATE_TMP_ROOTS)
+
+    return mode, {
+        CATEGORY_READ_ONLY: read_only,
+        CATEGORY_INACCESSIBLE: list(write_scope.get("inaccessible_paths") or []),
+        CATEGORY_WRITABLE: writable,
+        CATEGORY_TMPFS: tmpfs,
+    }
+
+
+def add_fs_scope_result(trie: PathTrie, result: dict[str, Any]) -> None:
+    if (result.get("status") or "").lower() != "ok":
+        return
+    service = result.get("service") or ""
+    if not service:
+        return
+    mode, sets = _effective_sets(result)
+    trie.set_default(service, CATEGORY_READ_ONLY if mode == "only" else CATEGORY_WRITABLE)
+    for category, paths in sets.items():
+        for path in paths:
+            trie.insert(path, service, category)
+
+
+def build_fs_scope_trie(results: Iterable[dict[str, Any]]) -> PathTrie:
+    trie = PathTrie()
+    for result in results:
+        add_fs_scope_result(trie, result)
+    return trie
+
+
+def query_can_write(trie: PathTrie, path: str) -> list[str]:
+    return sorted(owner for owner, category in trie.resolve(path).items() if category == CATEGORY_WRITABLE)
+
+
+def query_can_read(trie: PathTrie, path: str) -> list[str]:
+    hidden = (CATEGORY_INACCESSIBLE, CATEGORY_TMPFS)
+    return sorted(owner for owner, category in trie.resolve(path).items() if category not in hidden)
+
+
+def query_writable_under(trie: PathTrie, path: str) -> list[str]:
+    owners = set(query_can_write(trie, path))
+    owners.update(trie.owners_marked_under(path, CATEGORY_WRITABLE))
+    return sorted(owners)
+
+
+QUERY_HANDLERS = {
+    "can-write": query_can_write,
+    "can-read": query_can_read,
+    "writable-under": query_writable_under,
+}
+
+
+def run_queries(trie: PathTrie, queries: Iterable[tuple[str, str]]) -> list[dict[str, Any]]:
+    output: list[dict[str, Any]] = []
+    for query_type, path in queries:
+        handler = QUERY_HANDLERS[query_type]
+        output.append({"type": query_type, "path": join_path(split_path(path)), "services": handler(trie, path)})
+    return output
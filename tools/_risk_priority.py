@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Iterable
+
+
+# D-Bus 方法风险评分（供 dbus_access_control_check.py 按风险优先调度）：
+# - 方法名首个单词按动词分级：执行/安装类最高，修改/启停类次之，只读查询类减分
+# - 上下文来自其他工具的输出（--json 或 --jsonl 均可）：
+#   - check_dbus_system_conf.py --services-file：root own 的 bus name 及剔除 default deny 后仍残留的方法
+#   - check_service_cap.py：unit 的实际 Cap，经 D-Bus 激活文件（SystemdService=）或同名 unit 关联到 bus name
+# - 分数只用于排序，不影响检查结论
+
+DEFAULT_DBUS_SERVICES_DIR = "/usr/share/dbus-1/system-services"
+
+HIGH_RISK_VERBS = {
+    "exec", "execute", "run", "spawn", "shell", "command", "eval", "install", "uninstall", "upgrade",
+    "load", "mount", "unmount", "format", "flash", "inject",
+}
+MEDIUM_RISK_VERBS = {
+    "set", "write", "create", "add", "remove", "delete", "update", "modify", "change", "enable", "disable",
+    "start", "stop", "restart", "reload", "reboot", "poweroff", "shutdown", "suspend", "hibernate", "kill",
+    "reset", "import", "export", "copy", "move", "rename", "chown", "chmod", "register", "unregister",
+    "grant", "revoke", "apply", "activate", "deactivate",
+}
+READ_ONLY_VERBS = {"get", "list", "is", "has", "query", "read", "ping", "introspect", "version", "can", "check"}
+
+VERB_WEIGHTS = {"high": 5, "medium": 3, "read_only": -2}
+ROOT_OWNED_WEIGHT = 4
+NOT_DENIED_WEIGHT = 3
+DANGEROUS_CAP_WEIGHT = 1
+MAX_CAP_WEIGHT = 4
+
+DANGEROUS_CAPABILITIES = {
+    "cap_sys_admin", "cap_sys_module", "cap_sys_rawio", "cap_sys_ptrace", "cap_sys_boot", "cap_dac_override",
+    "cap_dac_read_search", "cap_setuid", "cap_setgid", "cap_setfcap", "cap_chown", "cap_fowner",
+    "cap_net_admin", "cap_mknod", "cap_bpf",
+}
+
+_WORD_PATTERN = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+
+
+def leading_verb(method: str) -> str:
+    words = _WORD_PATTERN.findall(method)
+    return words[0].lower() if words else ""
+
+
+def _unit_name(name: str) -> str:
+    return name if "." in name.rsplit("/", 1)[-1] else f"{name}.service"
+
+
+def _iter_results(path: Path) -> Iterable[dict[str, Any]]:
+    # --json 输出为单个对象（results 数组），--jsonl 输出为逐行记录（type=result）
+    text = path.read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, dict):
+        yield from (r for r in data.get("results") or [] if isinstance(r, dict))
+        return
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"{path}: invalid JSON on line {line_no}: {exc}") from exc
+        if isinstance(record, dict) and record.get("type") == "result" and isinstance(record.get("result"), dict):
+            yield record["result"]
+
+
+def _load_activation_units(services_dir: str) -> dict[str, str]:
+    # D-Bus 系统服务激活文件：Name=<bus name>、SystemdService=<unit>
+    units: dict[str, str] = {}
+    if not os.path.isdir(services_dir):
+        return units
+    for name in sorted(os.listdir(services_dir)):
+        if not name.endswith(".service"):
+            continue
+        fields: dict[str, str] = {}
+        try:
+            with open(os.path.join(services_dir, name), "r", encoding="utf-8", errors="replace") as handle:
+                for line in handle:
+                    key, sep, value = line.strip().partition("=")
+                    if sep:
+                        fields[key.strip()] = value.strip()
+        except OSError:
+            continue
+        if fields.get("Name") and fields.get("SystemdService"):
+            units[fields["Name"]] = _unit_name(fields["SystemdService"])
+    return units
+
+
+class RiskContext:
+    def __init__(self) -> None:
+        self.method_services: dict[tuple[str, str, str], set[str]] = {}
+        self.root_services: set[str] = set()
+        self.unit_capabilities: dict[str, list[str]] = {}
+        self.bus_units: dict[str, str] = {}
+
+    def add_result(self, result: dict[str, Any]) -> None:
+        if "effective_capabilities" in result and result.get("service"):
+            caps = [str(cap).lower() for cap in result.get("effective_capabilities") or []]
+            self.unit_capabilities[_unit_name(str(result["service"]))] = caps
+            return
+        service = result.get("service")
+        if not service or "conf_files" not in result or result.get("status") not in ("ok", "uncontrolled", "error"):
+            return
+        # check_dbus_system_conf 只对 root own 的 service 做内省，methods 为剔除 default deny 后的残留方法
+        self.root_services.add(service)
+        methods = result.get("methods") or {}
+        if not isinstance(methods, dict):
+            return
+        for object_path, interfaces in methods.items():
+            if not isinstance(interfaces, dict):
+                continue
+            for interface, names in interfaces.items():
+                for method in names or []:
+                    self.method_services.setdefault((object_path, interface, method), set()).add(service)
+
+    def capabilities(self, service: str) -> list[str]:
+        for unit in (self.bus_units.get(service), f"{service}.service", f"dbus-{service}.service"):
+            if unit and unit in self.unit_capabilities:
+                return self.unit_capabilities[unit]
+        return []
+
+
+def load_risk_context(paths: Iterable[str], dbus_services_dir: str = DEFAULT_DBUS_SERVICES_DIR) -> RiskContext:
+    context = RiskContext()
+    for path in paths:
+        for result in _iter_results(Path(path)):
+            context.add_result(result)
+    context.bus_units = _load_activation_units(dbus_services_dir)
+    return context
+
+
+def score_method(entry: dict[str, str], context: RiskContext | None) -> dict[str, Any]:
+    score = 0
+    reasons: list[str] = []
+    verb = leading_verb(entry["method"])
+    for tier, verbs in (("high", HIGH_RISK_VERBS), ("medium", MEDIUM_RISK_VERBS), ("read_only", READ_ONLY_VERBS)):
+        if verb in verbs:
+            score += VERB_WEIGHTS[tier]
+            reasons.append(f"verb:{verb}")
+            break
+
+    if context is not None:
+        services = context.method_services.get((entry["path"], entry["interface"], entry["method"])) or set()
+        if services:
+            score += NOT_DENIED_WEIGHT
+            reasons.append("not-denied-by-default-policy")
+        if services & context.root_services:
+            score += ROOT_OWNED_WEIGHT
+            reasons.append("root-owned-bus-name")
+        dangerous = sorted({cap for service in services for cap in context.capabilities(service)} & DANGEROUS_CAPABILITIES)
+        if dangerous:
+            score += min(MAX_CAP_WEIGHT, DANGEROUS_CAP_WEIGHT * len(dangerous))
+            reasons.append("capabilities:" + ",".join(dangerous))
+    return {"score": score, "reasons": reasons}
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import subprocess
+import threading
+from typing import Any, Iterable
+
+from _common import dpkg_query_owners, parse_key_value_lines, phase, systemctl_show_batches, systemctl_show_output
+
+
+# 主机快照（供 run_all 与各规则工具共用）：
+# - 一次性采集各工具读取的外部输入：unit 属性、system.d conf、introspection XML、polkit policy/pkaction、dpkg 文件清单、可执行文件权限位与 file capabilities
+# - 数据为纯 dict/list/str/int，便于在同一进程内共享，也便于序列化
+# - `Snapshot` 提供与实时查询对应的只读访问接口；缺失数据以 RuntimeError 表达，由工具按单条错误处理
+# - 归档格式：gzip 压缩的 JSON，顶层携带 format/version，版本不匹配时拒绝加载
+
+DPKG_INFO_DIR = "/var/lib/dpkg/info"
+
+SNAPSHOT_FORMAT = "dbus-security-snapshot"
+SNAPSHOT_VERSION = 1
+
+
+def _files_under(files: Iterable[str], directory: str) -> list[str]:
+    prefix = directory.rstrip("/") + "/"
+    return [path for path in files if path.startswith(prefix)]
+
+
+class Snapshot:
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.data = data
+        self._owners_index: dict[str, list[str]] | None = None
+        self._lock = threading.Lock()
+
+    def inputs(self) -> dict[str, list[str]]:
+        return dict(self.data.get("inputs") or {})
+
+    def service_units(self) -> list[str]:
+        return sorted(set(self.data.get("units") or {}) | set(self.data.get("unit_errors") or {}))
+
+    def unit_properties(self, service: str) -> dict[str, str]:
+        errors = self.data.get("unit_errors") or {}
+        if service in errors:
+            raise RuntimeError(errors[service])
+        units = self.data.get("units") or {}
+        if service not in units:
+            raise RuntimeError(f"service not in snapshot: {service}")
+        return dict(units[service])
+
+    def _files_in_dirs(self, files_key: str, dirs_key: str, directories: Iterable[str]) -> tuple[list[str], list[str]]:
+        recorded = self.data.get(files_key) or {}
+        scanned = set(self.data.get(dirs_key) or [])
+        files: set[str] = set()
+        missing_dirs: list[str] = []
+        for directory in directories:
+            if directory not in scanned:
+                missing_dirs.append(directory)
+                continue
+            files.update(_files_under(recorded, directory))
+        return sorted(files), missing_dirs
+
+    def conf_files(self, directories: Iterable[str]) -> tuple[list[str], list[str]]:
+        return self._files_in_dirs("dbus_conf_files", "dbus_conf_dirs", directories)
+
+    def conf_text(self, path: str) -> str:
+        files = self.data.get("dbus_conf_files") or {}
+        if path not in files:
+            raise RuntimeError(f"conf file not in snapshot: {path}")
+        return files[path]
+
+    def introspect_xml(self, service: str, object_path: str) -> str:
+        pages = (self.data.get("dbus_introspection") or {}).get(service)
+        if pages is None:
+            raise RuntimeError(f"service introspection not in snapshot: {service}")
+        page = pages.get(object_path)
+        if page is None:
+            raise RuntimeError(f"object path not in snapshot: {service} {object_path}")
+        if "error" in page:
+            raise RuntimeError(page["error"])
+        return page["xml"]
+
+    def policy_files(self, directories: Iterable[str]) -> dict[str, str]:
+        files, _ = self._files_in_dirs("polkit_policy_files", "polkit_policy_dirs", directories)
+        recorded = self.data.get("polkit_policy_files") or {}
+        return {path: recorded[path] for path in files}
+
+    def pkaction(self, action_id: str) -> subprocess.CompletedProcess[str]:
+        actions = self.data.get("polkit_actions") or {}
+        if action_id not in actions:
+            raise RuntimeError(f"action not in snapshot: {action_id}")
+        record = actions[action_id]
+        return subprocess.CompletedProcess(
+            ["pkaction", "-a", action_id, "-v"],
+            int(record.get("returncode") or 0),
+            record.get("stdout") or "",
+            record.get("stderr") or "",
+        )
+
+    def _dpkg_files(self) -> dict[str, list[str]]:
+        file_lists = self.data.get("dpkg_files")
+        if file_lists is None:
+            raise RuntimeError("dpkg database not available in snapshot")
+        return file_lists
+
+    def package_files(self, package: str) -> list[str] | None:
+        file_lists = self._dpkg_files()
+        if package in file_lists:
+            return list(file_lists[package])
+        # 多架构包的 .list 文件名带 `:arch` 后缀；按包名匹配时合并所有架构
+        matched = [paths for name, paths in file_lists.items() if name.split(":", 1)[0] == package]
+        if not matched:
+            return None
+        return sorted({path for paths in matched for path in paths})
+
+    def dpkg_owners(self, path: str) -> list[str]:
+        with self._lock:
+            if self._owners_index is None:
+                index: dict[str, set[str]] = {}
+                for name, paths in self._dpkg_files().items():
+                    package = name.split(":", 1)[0]
+                    for file_path in paths:
+                        index.setdefault(file_path, set()).add(package)
+                self._owners_index = {k: sorted(v) for k, v in index.items()}
+        return list(self._owners_index.get(path) or [])
+
+    def require_package(self, package: str) -> None:
+        # 仅采集时列出的包记录了文件 mode 与 capability；其余包回放时无从判断，必须报错而非视为无二进制
+        captured = {name.split(":", 1)[0] for name in self.inputs().get("packages") or []}
+        if package.split(":", 1)[0] not in captured:
+            raise RuntimeError(f"package not in snapshot: {package}")
+
+    def file_mode(self, path: str) -> int | None:
+        modes = self.data.get("file_modes") or {}
+        return modes.get(path)
+
+    def file_caps(self, paths: Iterable[str]) -> dict[str, str]:
+        caps = self.data.get("file_caps") or {}
+        return {path: caps[path] for path in paths if path in caps}
+
+
+def write_snapshot(path: str, snapshot: Snapshot) -> None:
+    payload = {"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "data": snapshot.data}
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        json.dump(payload, handle, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_snapshot(path: str) -> Snapshot:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            payload = json.load(handle)
+    except FileNotFoundError:
+        raise
+    except (OSError, EOFError, json.JSONDecodeError) as exc:
+        raise ValueError(f"invalid snapshot archive: {path}: {exc}") from exc
+    if not isinstance(payload, dict) or payload.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"invalid snapshot archive: {path}")
+    if payload.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version: {payload.get('version')} (expected {SNAPSHOT_VERSION})")
+    return Snapshot(payload.get("data") or {})
+
+
+def lookup_owners(
+    path: str,
+    timeout_seconds: float,
+    snapshot: Snapshot | None,
+    cache: dict[str, list[str]],
+) -> list[str]:
+    if path not in cache:
+        with phase("owner_lookup"):
+            if snapshot is not None:
+                cache[path] = snapshot.dpkg_owners(path)
+            else:
+                cache[path] = dpkg_query_owners(path, timeout_seconds)
+    return cache[path]
+
+
+def collect_units(
+    services: list[str],
+    properties: Iterable[str],
+    timeout_seconds: float,
+) -> tuple[dict[str, dict[str, str]], dict[str, str]]:
+    properties = list(properties)
+    units: dict[str, dict[str, str]] = {}
+    errors: dict[str, str] = {}
+    for service, batch_output in systemctl_show_batches(services, properties, timeout_seconds):
+        try:
+            output = systemctl_show_output(service, batch_output, properties, timeout_seconds)
+            units[service] = parse_key_value_lines(output)
+        except FileNotFoundError:
+            raise
+        except subprocess.TimeoutExpired:
+            errors[service] = f"systemctl timed out after {timeout_seconds}s"
+        except Exception as exc:
+            errors[service] = str(exc)
+    return units, errors
+
+
+def collect_text_files(directories: Iterable[str], suffixes: tuple[str, ...]) -> tuple[dict[str, str], list[str], list[str]]:
+    files: dict[str, str] = {}
+    scanned: list[str] = []
+    missing_dirs: list[str] = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            missing_dirs.append(directory)
+            continue
+        scanned.append(directory)
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if not name.endswith(suffixes):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "r", encoding="utf-8", errors="replace") as handle:
+                        files[path] = handle.read()
+                except OSError:
+                    continue
+    return files, scanned, missing_dirs
+
+
+def collect_dpkg_file_lists(info_dir: str = DPKG_INFO_DIR) -> dict[str, list[str]] | None:
+    # 直接读取 dpkg 数据库的 *.list，代替逐路径 `dpkg-query -S` / 逐包 `dpkg-query -L`
+    if not os.path.isdir(info_dir):
+        return None
+    file_lists: dict[str, list[str]] = {}
+    for name in sorted(os.listdir(info_dir)):
+        if not name.endswith(".list"):
+            continue
+        try:
+            with open(os.path.join(info_dir, name), "r", encoding="utf-8", errors="replace") as handle:
+                paths = [line.strip() for line in handle if line.strip()]
+        except OSError:
+            continue
+        file_lists[name[: -len(".list")]] = paths
+    return file_lists
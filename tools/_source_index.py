@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Iterable
+
+
+# 项目源码符号索引（供 AI 检查工具预先注入提示词）：
+# - 一次遍历项目源码，按语言正则识别函数定义（名称、文件、起止行），并记录“标识符(”形式的调用点
+# - 记录字符串字面量所在行，用于把 D-Bus interface/method 名映射到处理函数（注册表/分发函数）
+# - 仅做轻量启发式：不解析语法树，结果作为 codex 的起点线索，仍需 codex 以源码证据确认
+# - 生成的代码片段有行数上限，避免提示词膨胀
+
+SOURCE_SUFFIXES = {
+    ".go": "go",
+    ".c": "c",
+    ".h": "c",
+    ".cc": "c",
+    ".cpp": "c",
+    ".cxx": "c",
+    ".hpp": "c",
+    ".hh": "c",
+    ".py": "python",
+    ".rs": "rust",
+    ".vala": "c",
+}
+
+# 输出目录等运行期目录由调用方通过 exclude_dirs 排除，这里只跳过版本库元数据与依赖缓存
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules"}
+
+FUNCTION_DEF_PATTERNS = {
+    "go": re.compile(r"^\s*func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)\s*[\[(]"),
+    "python": re.compile(r"^\s*(?:async\s+)?def\s+([A-Za-z_]\w*)\s*\("),
+    "rust": re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+([A-Za-z_]\w*)"),
+    # C/C++：顶格书写的“返回类型 名称(”且该行不以 ; 结尾（排除声明）
+    "c": re.compile(r"^(?!\s)(?:[A-Za-z_][\w:<>,\*&\s]*?[\s\*&])?((?:[A-Za-z_]\w*::)*~?[A-Za-z_]\w*)\s*\([^;]*$"),
+}
+
+CALL_PATTERN = re.compile(r"\b([A-Za-z_]\w*)\s*\(")
+STRING_LITERAL_PATTERN = re.compile(r"\"([^\"\\\n]{1,200})\"")
+
+NON_FUNCTION_NAMES = {
+    "if",
+    "for",
+    "while",
+    "switch",
+    "return",
+    "sizeof",
+    "catch",
+    "else",
+    "do",
+    "case",
+    "defined",
+}
+
+MAX_SLICE_LINES = 60
+MAX_SLICES = 6
+MAX_CALL_SITES = 20
+MAX_FILE_BYTES = 2 * 1024 * 1024
+
+
+def _read_lines(path: Path) -> list[str] | None:
+    try:
+        if path.stat().st_size > MAX_FILE_BYTES:
+            return None
+        return path.read_text(encoding="utf-8", errors="replace").splitlines()
+    except OSError:
+        return None
+
+
+def _trim_function_end(lines: list[str], language: str, start: int, end: int) -> int:
+    # 函数结束行取“下一个定义之前”的最后一个右花括号（Python 取最后一个非空行），去掉夹在中间的下一函数返回类型/注释
+    for line_no in range(end, start, -1):
+        text = lines[line_no - 1]
+        if language == "python":
+            if text.strip():
+                return line_no
+        elif text.startswith("}"):
+            return line_no
+    return end
+
+
+def _short_name(name: str) -> str:
+    return name.rsplit("::", 1)[-1]
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name).lower()
+
+
+class SourceIndex:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.files: dict[str, list[str]] = {}
+        self.languages: dict[str, str] = {}
+        # 函数定义：[(name, rel_path, start_line, end_line)]，行号从 1 开始
+        self.functions: list[tuple[str, str, int, int]] = []
+        self.functions_by_name: dict[str, list[tuple[str, str, int, int]]] = {}
+        self.call_sites: dict[str, list[tuple[str, int]]] = {}
+        self.string_refs: dict[str, list[tuple[str, int]]] = {}
+        self._functions_by_file: dict[str, list[tuple[str, str, int, int]]] = {}
+
+    def add_file(self, rel_path: str, language: str, lines: list[str]) -> None:
+        self.files[rel_path] = lines
+        self.languages[rel_path] = language
+        def_pattern = FUNCTION_DEF_PATTERNS[language]
+        starts: list[tuple[str, int]] = []
+        for line_no, line in enumerate(lines, start=1):
+            match = def_pattern.match(line)
+            definition = match.group(1) if match and _short_name(match.group(1)) not in NON_FUNCTION_NAMES else ""
+            if definition:
+                starts.append((definition, line_no))
+            for call in CALL_PATTERN.finditer(line):
+                name = call.group(1)
+                if name in NON_FUNCTION_NAMES or name == _short_name(definition):
+                    continue
+                self.call_sites.setdefault(name, []).append((rel_path, line_no))
+            for literal in STRING_LITERAL_PATTERN.finditer(line):
+                self.string_refs.setdefault(literal.group(1), []).append((rel_path, line_no))
+
+        file_functions: list[tuple[str, str, int, int]] = []
+        for index, (name, start) in enumerate(starts):
+            end = starts[index + 1][1] - 1 if index + 1 < len(starts) else len(lines)
+            end = _trim_function_end(lines, language, start, end)
+            function = (name, rel_path, start, end)
+            file_functions.append(function)
+            self.functions_by_name.setdefault(_short_name(name), []).append(function)
+        self.functions.extend(file_functions)
+        self._functions_by_file[rel_path] = file_functions
+
+    def enclosing_function(self, rel_path: str, line_no: int) -> tuple[str, str, int, int] | None:
+        for function in self._functions_by_file.get(rel_path) or []:
+            if function[2] <= line_no <= function[3]:
+                return function
+        return None
+
+    def slice(self, rel_path: str, start: int, end: int) -> str:
+        lines = self.files.get(rel_path) or []
+        end = min(end, start + MAX_SLICE_LINES - 1, len(lines))
+        body = "\n".join(f"{n}: {lines[n - 1]}" for n in range(start, end + 1))
+        header = f"--- {rel_path}:{start}-{end}"
+        return f"{header}\n{body}"
+
+    def function_slice(self, function: tuple[str, str, int, int]) -> str:
+        _, rel_path, start, end = function
+        return self.slice(rel_path, start, end)
+
+    def callees(self, function: tuple[str, str, int, int]) -> list[tuple[str, str, int, int]]:
+        # 函数体内调用到的项目内函数（仅一层，按名称匹配）
+        _, rel_path, start, end = function
+        lines = self.files.get(rel_path) or []
+        found: list[tuple[str, str, int, int]] = []
+        for line in lines[start:end]:
+            for call in CALL_PATTERN.finditer(line):
+                for target in self.functions_by_name.get(call.group(1)) or []:
+                    if target != function and target not in found:
+                        found.append(target)
+        return found
+
+    def callers(self, name: str) -> list[tuple[str, int]]:
+        return list(self.call_sites.get(_short_name(name)) or [])
+
+    def format_sites(self, sites: Iterable[tuple[str, int]], limit: int = MAX_CALL_SITES) -> str:
+        sites = list(dict.fromkeys(sites))
+        rendered = []
+        for rel_path, line_no in sites[:limit]:
+            text = (self.files.get(rel_path) or [""] * line_no)[line_no - 1].strip()
+            rendered.append(f"{rel_path}:{line_no}: {text}")
+        if len(sites) > limit:
+            rendered.append(f"... ({len(sites) - limit} more)")
+        return "\n".join(rendered)
+
+
+def build_source_index(project_root: Path, exclude_dirs: Iterable[Path] = ()) -> SourceIndex:
+    root = project_root.resolve()
+    excluded = {path.resolve() for path in exclude_dirs}
+    index = SourceIndex(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        current = Path(dirpath)
+        dirnames[:] = sorted(
+            name for name in dirnames if name not in SKIP_DIRS and (current / name).resolve() not in excluded
+        )
+        for name in sorted(filenames):
+            language = SOURCE_SUFFIXES.get(os.path.splitext(name)[1].lower())
+            if not language:
+                continue
+            path = current / name
+            lines = _read_lines(path)
+            if lines is None:
+                continue
+            index.add_file(path.relative_to(root).as_posix(), language, lines)
+    return index
+
+
+def named_handlers(index: SourceIndex, method: str) -> list[tuple[str, str, int, int]]:
+    # 同名函数（godbus/dbus-python/Qt 导出方法），以及 gdbus-codegen 生成的 handle_<snake> 回调
+    snake = _snake_case(method)
+    names = [method, f"handle_{snake}", f"on_handle_{snake}", f"_on_handle_{snake}", f"on_{snake}"]
+    handlers: list[tuple[str, str, int, int]] = []
+    for name in names:
+        handlers.extend(index.functions_by_name.get(name) or [])
+    return handlers
+
+
+def method_string_refs(index: SourceIndex, method: str) -> list[tuple[str, int]]:
+    refs = list(index.string_refs.get(method) or [])
+    # gdbus-codegen 的 "handle-<kebab>" 信号注册点
+    refs.extend(index.string_refs.get("handle-" + _snake_case(method).replace("_", "-")) or [])
+    return refs
+
+
+def referencing_functions(
+    index: SourceIndex,
+    refs: Iterable[tuple[str, int]],
+    known: Iterable[tuple[str, str, int, int]] = (),
+) -> list[tuple[str, str, int, int]]:
+    # 以字符串字面量出现的方法名（分发表/strcmp 分支/注册调用）所在函数
+    seen = set(known)
+    functions: list[tuple[str, str, int, int]] = []
+    for rel_path, line_no in refs:
+        function = index.enclosing_function(rel_path, line_no)
+        if function is not None and function not in seen:
+            seen.add(function)
+            functions.append(function)
+    return functions
+
+
+def dbus_method_context(index: SourceIndex, path: str, interface: str, method: str) -> dict[str, str]:
+    handlers = named_handlers(index, method)
+    method_refs = method_string_refs(index, method)
+    handlers.extend(referencing_functions(index, method_refs, handlers))
+
+    slices = [index.function_slice(function) for function in handlers[:MAX_SLICES]]
+    if len(handlers) > MAX_SLICES:
+        slices.append(f"... ({len(handlers) - MAX_SLICES} more candidate handlers)")
+
+    call_sites: list[tuple[str, int]] = []
+    for name, _, _, _ in handlers[:MAX_SLICES]:
+        call_sites.extend(index.callers(name))
+
+    interface_refs = list(index.string_refs.get(interface) or [])
+    interface_refs.extend(index.string_refs.get(path) or [])
+
+    return {
+        "dbus_handler_slices": "\n\n".join(slices) or "(no candidate handler found by the source index)",
+        "dbus_handler_call_sites": index.format_sites(call_sites) or "(none)",
+        "dbus_interface_refs": index.format_sites(interface_refs + method_refs) or "(none)",
+    }
+
+
+def exec_call_site_context(
+    index: SourceIndex,
+    patterns: Iterable[str],
+    max_lines: int,
+    paths: Iterable[str] | None = None,
+) -> str:
+    # 按所在函数聚合命中的外部命令调用点，并附上该函数的调用者，便于追溯参数来源；paths 限定只看这些文件（分片检查）
+    compiled = re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+    selected = None if paths is None else set(paths)
+    grouped: dict[tuple[str, str, int, int] | tuple[str, int], list[int]] = {}
+    for rel_path, lines in index.files.items():
+        if selected is not None and rel_path not in selected:
+            continue
+        for line_no, line in enumerate(lines, start=1):
+            if not compiled.search(line):
+                continue
+            function = index.enclosing_function(rel_path, line_no)
+            key = function if function is not None else (rel_path, line_no)
+            grouped.setdefault(key, []).append(line_no)
+
+    blocks: list[str] = []
+    for key, line_numbers in grouped.items():
+        if len(key) == 4:
+            name, rel_path, start, end = key
+            header = f"### {name} ({rel_path}:{start}-{end})"
+        else:
+            rel_path, _ = key
+            name = ""
+            header = f"### (top level) {rel_path}"
+        sites = index.format_sites((rel_path, n) for n in line_numbers)
+        block = [header, "Exec sites:", sites]
+        if name:
+            callers = index.callers(name)
+            block.extend(["Callers:", index.format_sites(callers) or "(none found)"])
+        blocks.append("\n".join(block))
+
+    if not blocks:
+        return "Source index found no exec call sites."
+    output: list[str] = []
+    used = 0
+    for block in blocks:
+        block_lines = block.count("\n") + 1
+        if used + block_lines > max_lines:
+            output.append(f"... (truncated, {len(blocks) - len(output)} more functions)")
+            break
+        output.append(block)
+        used += block_lines
+    return "\n\n".join(output)
+
+
+def dbus_interface_context(index: SourceIndex, interface: str) -> dict[str, str]:
+    # 服务上下文构建用：interface 名的全部引用位置（注册/导出/分发代码）
+    refs = list(index.string_refs.get(interface) or [])
+    return {"dbus_interface_refs": index.format_sites(refs) or "(none)"}
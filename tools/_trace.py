@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import AbstractContextManager, contextmanager
+from typing import Any, Iterator
+
+
+# 执行轨迹导出（--trace-file，供全部工具共用）：
+# - 输出 Chrome Trace Event Format（JSON object 格式），可直接在 chrome://tracing 或 Perfetto（ui.perfetto.dev）中打开
+# - 每个 span 为一个 "X"（complete）事件：ts/dur 为微秒，tid 为线程，首次出现的线程写 thread_name 元数据，
+#   并发 worker 在查看器中各占一条泳道
+# - 未启用时 span() 不计时、不记录事件
+# - 事件在内存中累积，进程结束前一次性写出；span 的 args 会截断过长字符串，避免整条命令行撑大文件
+
+MAX_ARG_CHARS = 300
+
+
+def _clip(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_ARG_CHARS:
+        return value[:MAX_ARG_CHARS] + f"...(+{len(value) - MAX_ARG_CHARS} chars)"
+    return value
+
+
+class TraceRecorder:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.events: list[dict[str, Any]] = []
+        self._threads: set[int] = set()
+        self._origin = time.perf_counter()
+
+    def start(self, process_name: str) -> None:
+        with self._lock:
+            self.enabled = True
+            self.events = [
+                {"ph": "M", "name": "process_name", "pid": os.getpid(), "tid": 0, "args": {"name": process_name}},
+            ]
+            self._threads = set()
+            self._origin = time.perf_counter()
+
+    def _now_us(self) -> float:
+        return round((time.perf_counter() - self._origin) * 1_000_000, 3)
+
+    @contextmanager
+    def span(self, name: str, category: str, args: dict[str, Any] | None = None) -> Iterator[dict[str, Any]]:
+        # 产出的字典即该事件的 args，调用方可在 span 内补充结果（如退出码）
+        details: dict[str, Any] = dict(args or {})
+        if not self.enabled:
+            yield details
+            return
+        started = self._now_us()
+        try:
+            yield details
+        except BaseException as exc:
+            details["error"] = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            self._add(name, category, started, self._now_us() - started, details)
+
+    def _add(self, name: str, category: str, started: float, duration: float, details: dict[str, Any]) -> None:
+        thread = threading.current_thread()
+        event = {
+            "ph": "X",
+            "name": name,
+            "cat": category,
+            "ts": started,
+            "dur": round(duration, 3),
+            "pid": os.getpid(),
+            "tid": thread.ident or 0,
+        }
+        if details:
+            event["args"] = {key: _clip(value) for key, value in details.items()}
+        with self._lock:
+            if event["tid"] not in self._threads:
+                self._threads.add(event["tid"])
+                self.events.append(
+                    {"ph": "M", "name": "thread_name", "pid": event["pid"], "tid": event["tid"], "args": {"name": thread.name}},
+                )
+            self.events.append(event)
+
+    def write(self, path: str) -> None:
+        with self._lock:
+            payload = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=False)
+            handle.write("\n")
+
+    def finish(self, path: str) -> None:
+        # 在 main 的 finally 中调用：异常退出时同样写出已记录的 span；写文件失败只提示，不改变退出码
+        try:
+            self.write(path)
+        except OSError as exc:
+            print(f"ERROR: cannot write trace file {path}: {exc}", file=sys.stderr)
+            return
+        print(f"INFO: Trace written to {path} ({len(self.events)} events)", file=sys.stderr)
+
+
+TRACE = TraceRecorder()
+
+
+def span(name: str, category: str, args: dict[str, Any] | None = None) -> AbstractContextManager[dict[str, Any]]:
+    return TRACE.span(name, category, args)
@@ -9,9 +9,11 @@ import os
 import subprocess
 import sys
 import xml.etree.ElementTree as element_tree
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable
 
-from _common import classify_file_not_found, dpkg_query_owners, read_non_empty_lines, run_command
+from _common import RUN_STATS, classify_file_not_found, phase, read_non_empty_lines, run_command, write_jsonl_record
+from _snapshot import Snapshot, load_snapshot, lookup_owners
+from _trace import TRACE, span
 
 
 # 基于 DBus 安全检查表的约定：
@@ -37,7 +39,10 @@ EXCLUDED_METHOD_INTERFACES = {
 }
 
 
-def _iter_conf_files(directories: Iterable[str]) -> tuple[list[str], list[str]]:
+def iter_conf_files(directories: Iterable[str], snapshot: Snapshot | None = None) -> tuple[list[str], list[str]]:
+    if snapshot is not None:
+        return snapshot.conf_files(directories)
+
     files: set[str] = set()
     missing_dirs: list[str] = []
 
@@ -64,9 +69,12 @@ def _scan_conf_file(
     conf_file: str,
     allow_own_index: dict[str, list[dict[str, Any]]],
     default_deny_index: dict[str, list[dict[str, Any]]],
+    snapshot: Snapshot | None = None,
 ) -> dict[str, Any]:
-    tree = element_tree.parse(conf_file)
-    root = tree.getroot()
+    if snapshot is not None:
+        root = element_tree.fromstring(snapshot.conf_text(conf_file))
+    else:
+        root = element_tree.parse(conf_file).getroot()
 
     default_allow_owns: set[str] = set()
 
@@ -122,21 +130,72 @@ def _scan_conf_file(
     }
 
 
-def _build_conf_summary(results: list[dict[str, Any]]) -> dict[str, int]:
-    summary = {"total": len(results), "ok": 0, "error": 0, "flagged": 0, "findings": 0}
-    for r in results:
-        status = (r.get("status") or "").lower()
-        if status == "ok":
-            summary["ok"] += 1
+def scan_conf_files(
+    conf_files: list[str],
+    timeout_seconds: float,
+    snapshot: Snapshot | None = None,
+) -> tuple[list[dict[str, Any]], dict[str, list[dict[str, Any]]], dict[str, list[dict[str, Any]]]]:
+    conf_results: list[dict[str, Any]] = []
+    allow_own_index: dict[str, list[dict[str, Any]]] = {}
+    default_deny_index: dict[str, list[dict[str, Any]]] = {}
+
+    for conf_file in conf_files:
+        try:
+            with span(conf_file, "conf_file"):
+                conf_results.append(_scan_conf_file(conf_file, allow_own_index, default_deny_index, snapshot))
+        except FileNotFoundError:
+            raise
+        except subprocess.TimeoutExpired:
+            message = f"command timed out after {timeout_seconds}s"
+            conf_results.append({"conf_file": conf_file, "status": "error", "error": message, "packages": []})
+        except element_tree.ParseError as exc:
+            message = f"xml parse error: {exc}"
+            conf_results.append({"conf_file": conf_file, "status": "error", "error": message, "packages": []})
+        except Exception as exc:
+            conf_results.append({"conf_file": conf_file, "status": "error", "error": str(exc), "packages": []})
+
+    return conf_results, allow_own_index, default_deny_index
+
+
+def attach_conf_owners(
+    conf_results: list[dict[str, Any]],
+    owners_cache: dict[str, list[str]],
+    timeout_seconds: float,
+    snapshot: Snapshot | None = None,
+) -> None:
+    for r in conf_results:
+        if (r.get("status") or "").lower() != "ok":
+            continue
+        allow_owns = r.get("allow_own_in_default_policy") or []
+        if not allow_owns:
+            continue
+        conf_file = r.get("conf_file") or ""
+        if conf_file:
+            r["packages"] = lookup_owners(conf_file, timeout_seconds, snapshot, owners_cache)
         else:
-            summary["error"] += 1
+            r["packages"] = []
 
-        if r.get("flagged"):
-            summary["flagged"] += 1
-            summary["findings"] += int(r.get("findings_count") or 0)
+
+def build_conf_summary(results: list[dict[str, Any]]) -> dict[str, Any]:
+    summary = {"total": 0, "ok": 0, "error": 0, "flagged": 0, "findings": 0}
+    for r in results:
+        _count_conf_result(summary, r)
     return summary
 
 
+def _count_conf_result(summary: dict[str, Any], r: dict[str, Any]) -> None:
+    summary["total"] += 1
+    status = (r.get("status") or "").lower()
+    if status == "ok":
+        summary["ok"] += 1
+    else:
+        summary["error"] += 1
+
+    if r.get("flagged"):
+        summary["flagged"] += 1
+        summary["findings"] += int(r.get("findings_count") or 0)
+
+
 def _format_list(values: list[str], *, empty: str) -> str:
     return " ".join(values) if values else empty
 
@@ -171,15 +230,36 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
         action="store_true",
         help="Output JSON to stdout (useful for CI pipelines).",
     )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Stream JSON Lines to stdout: one result record per conf file / service as soon as it is ready, then a summary record.",
+    )
     parser.add_argument(
         "--only-flagged",
         action="store_true",
-        help="Only include flagged records (and errors) in JSON results.",
+        help="Only include flagged records (and errors) in JSON/JSONL results.",
     )
     parser.add_argument(
         "--only-method",
         action="store_true",
-        help="In --services-file + --json mode, output only method triplets (path/interface/method).",
+        help=(
+            "In --services-file + --json/--jsonl mode, output only method triplets (path/interface/method); "
+            "with --jsonl each service's new triplets are streamed as soon as it is introspected."
+        ),
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        help="Read all system inputs from a snapshot archive (see tools/snapshot.py) instead of the live host.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Add per-phase timing and external command statistics to the JSON/JSONL summary (summary.stats).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
     )
     parser.add_argument(
         "--timeout",
@@ -190,7 +270,7 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
     return parser.parse_args(argv)
 
 
-def _is_root_service(entries: list[dict[str, Any]]) -> bool:
+def is_root_service(entries: list[dict[str, Any]]) -> bool:
     return any((e.get("policy_user") or "").lower() == "root" for e in entries)
 
 
@@ -234,7 +314,7 @@ def _matches_default_deny(rule: dict[str, Any], service: str, path: str, interfa
     return True
 
 
-def _busctl_introspect_xml(service: str, object_path: str, timeout_seconds: float) -> str:
+def busctl_introspect_xml(service: str, object_path: str, timeout_seconds: float) -> str:
     args = [
         SYSTEM_COMMANDS["busctl"],
         "--system",
@@ -247,17 +327,18 @@ def _busctl_introspect_xml(service: str, object_path: str, timeout_seconds: floa
         service,
         object_path,
     ]
-    completed = run_command(args, timeout_seconds)
+    with phase("introspection"), span(object_path, "object_path", {"service": service}):
+        completed = run_command(args, timeout_seconds)
     if completed.returncode != 0:
         message = (completed.stderr or completed.stdout or "").strip() or "busctl introspect failed"
         raise RuntimeError(message)
     return completed.stdout
 
 
-def _collect_methods_not_denied(
+def collect_methods_not_denied(
     service: str,
     deny_rules: list[dict[str, Any]],
-    timeout_seconds: float,
+    introspect: Callable[[str], str],
 ) -> tuple[dict[str, dict[str, list[str]]], dict[str, int], list[dict[str, str]]]:
     queue: deque[str] = deque(["/"])
     visited: set[str] = set()
@@ -275,7 +356,7 @@ def _collect_methods_not_denied(
         visited.add(object_path)
 
         try:
-            xml_text = _busctl_introspect_xml(service, object_path, timeout_seconds)
+            xml_text = introspect(object_path)
             node = element_tree.fromstring(xml_text)
         except element_tree.ParseError as exc:
             errors.append({"object_path": object_path, "error": f"introspection xml parse error: {exc}"})
@@ -333,25 +414,89 @@ def _collect_methods_not_denied(
     return methods_tree, stats, errors
 
 
-def _build_service_summary(results: list[dict[str, Any]]) -> dict[str, int]:
-    summary = {"total": len(results), "ok": 0, "uncontrolled": 0, "not_found": 0, "not_root": 0, "error": 0, "flagged": 0}
+def check_bus_name(
+    service: str,
+    allow_own_index: dict[str, list[dict[str, Any]]],
+    default_deny_index: dict[str, list[dict[str, Any]]],
+    owners_cache: dict[str, list[str]],
+    timeout_seconds: float,
+    snapshot: Snapshot | None = None,
+) -> dict[str, Any]:
+    entries = allow_own_index.get(service) or []
+    conf_files_for_service = sorted({e.get("conf_file") for e in entries if e.get("conf_file")})
+
+    if not entries:
+        return {"service": service, "status": "not-found", "flagged": False}
+
+    if not is_root_service(entries):
+        return {
+            "service": service,
+            "status": "not-root",
+            "flagged": False,
+            "conf_files": conf_files_for_service,
+            "packages": [],
+        }
+
+    packages: set[str] = set()
+    for conf_file in conf_files_for_service:
+        packages.update(lookup_owners(conf_file, timeout_seconds, snapshot, owners_cache))
+
+    def introspect(object_path: str) -> str:
+        if snapshot is not None:
+            return snapshot.introspect_xml(service, object_path)
+        return busctl_introspect_xml(service, object_path, timeout_seconds)
+
+    deny_rules = default_deny_index.get(service) or []
+    methods, stats, errors = collect_methods_not_denied(service, deny_rules, introspect)
+    flagged = bool(methods)
+    status = "error" if errors else ("uncontrolled" if flagged else "ok")
+
+    return {
+        "service": service,
+        "status": status,
+        "flagged": flagged,
+        "conf_files": conf_files_for_service,
+        "packages": sorted(packages),
+        "methods": methods,
+        "stats": stats,
+        "errors": errors,
+    }
+
+
+def build_service_summary(results: list[dict[str, Any]]) -> dict[str, Any]:
+    summary = {"total": 0, "ok": 0, "uncontrolled": 0, "not_found": 0, "not_root": 0, "error": 0, "flagged": 0}
     for r in results:
-        status = (r.get("status") or "").lower()
-        if status == "ok":
-            summary["ok"] += 1
-        elif status == "uncontrolled":
-            summary["uncontrolled"] += 1
-        elif status == "not-found":
-            summary["not_found"] += 1
-        elif status == "not-root":
-            summary["not_root"] += 1
-        else:
-            summary["error"] += 1
-        if r.get("flagged"):
-            summary["flagged"] += 1
+        _count_service_result(summary, r)
     return summary
 
 
+def _count_service_result(summary: dict[str, Any], r: dict[str, Any]) -> None:
+    summary["total"] += 1
+    status = (r.get("status") or "").lower()
+    if status == "ok":
+        summary["ok"] += 1
+    elif status == "uncontrolled":
+        summary["uncontrolled"] += 1
+    elif status == "not-found":
+        summary["not_found"] += 1
+    elif status == "not-root":
+        summary["not_root"] += 1
+    else:
+        summary["error"] += 1
+    if r.get("flagged"):
+        summary["flagged"] += 1
+
+
+def _is_reported_service(result: dict[str, Any]) -> bool:
+    return result.get("status") in {"error", "not-found"} or bool(result.get("flagged"))
+
+
+def _write_jsonl_summary(summary: dict[str, Any], missing_dirs: list[str]) -> None:
+    if missing_dirs:
+        write_jsonl_record("missing_dirs", "missing_dirs", missing_dirs)
+    write_jsonl_record("summary", "summary", summary)
+
+
 def _flatten_method_triplets(results: list[dict[str, Any]]) -> list[dict[str, str]]:
     triplets: set[tuple[str, str, str]] = set()
     for result in results:
@@ -413,51 +558,43 @@ def _print_service_finding(result: dict[str, Any]) -> None:
 
 def main(argv: list[str]) -> int:
     args = _parse_args(argv)
+    RUN_STATS.reset()
+    if args.trace_file:
+        TRACE.start("check_dbus_system_conf")
 
     try:
-        # --only-method 仅定义在 services-file 的 JSON 输出场景，避免语义歧义。
-        if args.only_method and not args.json:
-            raise ValueError("--only-method requires --json")
+        # --only-method 仅定义在 services-file 的 JSON/JSONL 输出场景，避免语义歧义。
+        if args.only_method and not (args.json or args.jsonl):
+            raise ValueError("--only-method requires --json or --jsonl")
         if args.only_method and not args.services_file:
             raise ValueError("--only-method requires --services-file")
-
-        conf_files, missing_dirs = _iter_conf_files([args.etc_dir, args.usr_dir])
+        if args.json and args.jsonl:
+            raise ValueError("--json and --jsonl are mutually exclusive")
+        if args.stats and not (args.json or args.jsonl):
+            raise ValueError("--stats requires --json or --jsonl")
+        machine_output = args.json or args.jsonl
+
+        with phase("snapshot_load"):
+            snapshot = load_snapshot(args.from_snapshot) if args.from_snapshot else None
+        with phase("conf_scan"):
+            conf_files, missing_dirs = iter_conf_files([args.etc_dir, args.usr_dir], snapshot)
         if missing_dirs and not conf_files:
             raise ValueError("no .conf files found; directories not found: " + ", ".join(missing_dirs))
 
         owners_cache: dict[str, list[str]] = {}
-        conf_results: list[dict[str, Any]] = []
-        allow_own_index: dict[str, list[dict[str, Any]]] = {}
-        default_deny_index: dict[str, list[dict[str, Any]]] = {}
-        any_error = False
+        with phase("conf_scan"):
+            conf_results, allow_own_index, default_deny_index = scan_conf_files(conf_files, args.timeout, snapshot)
+        any_error = any(r.get("status") == "error" for r in conf_results)
         printed_findings = 0
 
-        if missing_dirs and not args.json:
+        if missing_dirs and not machine_output:
             for directory in missing_dirs:
                 print(f"WARNING: directory not found: {directory}", file=sys.stderr)
 
-        for conf_file in conf_files:
-            try:
-                conf_results.append(_scan_conf_file(conf_file, allow_own_index, default_deny_index))
-            except FileNotFoundError:
-                raise
-            except subprocess.TimeoutExpired:
-                any_error = True
-                message = f"command timed out after {args.timeout}s"
-                conf_results.append({"conf_file": conf_file, "status": "error", "error": message, "packages": []})
-                if not args.json and not args.services_file:
-                    print(f"ERROR: {message}", file=sys.stderr)
-            except element_tree.ParseError as exc:
-                any_error = True
-                message = f"xml parse error: {exc}"
-                conf_results.append({"conf_file": conf_file, "status": "error", "error": message, "packages": []})
-                if not args.json and not args.services_file:
-                    print(f"ERROR: {message}", file=sys.stderr)
-            except Exception as exc:
-                any_error = True
-                conf_results.append({"conf_file": conf_file, "status": "error", "error": str(exc), "packages": []})
-                if not args.json and not args.services_file:
-                    print(f"ERROR: {exc}", file=sys.stderr)
+        if not machine_output and not args.services_file:
+            for r in conf_results:
+                if r.get("status") == "error":
+                    print(f"ERROR: {r.get('error')}", file=sys.stderr)
 
         # 模式 2：基于 services 列表输出 root service 的未被 deny 覆盖的 method
         if args.services_file:
@@ -466,65 +603,44 @@ def main(argv: list[str]) -> int:
                 raise ValueError("services file is empty")
 
             service_results: list[dict[str, Any]] = []
+            summary = build_service_summary([])
             any_not_found = False
+            # --jsonl --only-method：每个 service 内省完成即输出其新出现的方法三元组，供下游边读边检查
+            streamed_triplets: set[tuple[str, str, str]] = set()
 
             for service in services:
-                entries = allow_own_index.get(service) or []
-                conf_files_for_service = sorted({e.get("conf_file") for e in entries if e.get("conf_file")})
-
-                if not entries:
+                with span(service, "service") as trace_args:
+                    result = check_bus_name(service, allow_own_index, default_deny_index, owners_cache, args.timeout, snapshot)
+                    trace_args["status"] = result.get("status")
+                if result.get("status") == "not-found":
                     any_not_found = True
-                    service_results.append({"service": service, "status": "not-found", "flagged": False})
-                    continue
-
-                if not _is_root_service(entries):
-                    service_results.append(
-                        {
-                            "service": service,
-                            "status": "not-root",
-                            "flagged": False,
-                            "conf_files": conf_files_for_service,
-                            "packages": [],
-                        },
-                    )
-                    continue
-
-                packages: set[str] = set()
-                for conf_file in conf_files_for_service:
-                    if conf_file not in owners_cache:
-                        owners_cache[conf_file] = dpkg_query_owners(conf_file, args.timeout)
-                    packages.update(owners_cache[conf_file])
-
-                deny_rules = default_deny_index.get(service) or []
-                methods, stats, errors = _collect_methods_not_denied(service, deny_rules, args.timeout)
-                flagged = bool(methods)
-                if errors:
+                elif result.get("errors"):
                     any_error = True
-                status = "error" if errors else ("uncontrolled" if flagged else "ok")
-
-                service_results.append(
-                    {
-                        "service": service,
-                        "status": status,
-                        "flagged": flagged,
-                        "conf_files": conf_files_for_service,
-                        "packages": sorted(packages),
-                        "methods": methods,
-                        "stats": stats,
-                        "errors": errors,
-                    },
-                )
+                _count_service_result(summary, result)
+                if args.jsonl:
+                    if args.only_method:
+                        triplets = [
+                            t
+                            for t in _flatten_method_triplets([result])
+                            if (t["path"], t["interface"], t["method"]) not in streamed_triplets
+                        ]
+                        streamed_triplets.update((t["path"], t["interface"], t["method"]) for t in triplets)
+                        if triplets:
+                            write_jsonl_record("triplets", "triplets", triplets)
+                    elif not args.only_flagged or _is_reported_service(result):
+                        write_jsonl_record("result", "result", result)
+                    continue
+                service_results.append(result)
 
-            summary = _build_service_summary(service_results)
             output_results = service_results
             if args.only_flagged:
-                output_results = [
-                    r
-                    for r in service_results
-                    if r.get("status") in {"error", "not-found"} or bool(r.get("flagged"))
-                ]
+                output_results = [r for r in service_results if _is_reported_service(r)]
 
-            if args.json:
+            if args.stats:
+                summary["stats"] = RUN_STATS.report()
+            if args.jsonl:
+                _write_jsonl_summary(summary, missing_dirs)
+            elif args.json:
                 if args.only_method:
                     print(json.dumps(_flatten_method_triplets(output_results), indent=2, ensure_ascii=False, sort_keys=True))
                 else:
@@ -551,18 +667,21 @@ def main(argv: list[str]) -> int:
             return 0
 
         # 模式 1：输出 default policy 下 allow own
-        for r in conf_results:
-            if (r.get("status") or "").lower() != "ok":
-                continue
-            allow_owns = r.get("allow_own_in_default_policy") or []
-            if not allow_owns:
-                continue
-            conf_file = r.get("conf_file") or ""
-            if conf_file and conf_file not in owners_cache:
-                owners_cache[conf_file] = dpkg_query_owners(conf_file, args.timeout)
-            r["packages"] = owners_cache.get(conf_file) or []
-
-        summary = _build_conf_summary(conf_results)
+        if args.jsonl:
+            summary = build_conf_summary([])
+            for r in conf_results:
+                attach_conf_owners([r], owners_cache, args.timeout, snapshot)
+                _count_conf_result(summary, r)
+                if not args.only_flagged or r.get("status") != "ok" or bool(r.get("flagged")):
+                    write_jsonl_record("result", "result", r)
+            if args.stats:
+                summary["stats"] = RUN_STATS.report()
+            _write_jsonl_summary(summary, missing_dirs)
+            return 1 if any_error else 0
+
+        attach_conf_owners(conf_results, owners_cache, args.timeout, snapshot)
+
+        summary = build_conf_summary(conf_results)
         output_results = conf_results
         if args.only_flagged:
             output_results = [
@@ -572,6 +691,8 @@ def main(argv: list[str]) -> int:
             ]
 
         if args.json:
+            if args.stats:
+                summary["stats"] = RUN_STATS.report()
             payload: dict[str, Any] = {"results": output_results, "summary": summary}
             if missing_dirs:
                 payload["missing_dirs"] = missing_dirs
@@ -605,6 +726,9 @@ def main(argv: list[str]) -> int:
     except Exception as exc:
         print(f"ERROR: {exc}", file=sys.stderr)
         return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
 
 
 if __name__ == "__main__":
@@ -8,9 +8,20 @@ import os
 import stat
 import subprocess
 import sys
-from typing import Any, Iterable
-
-from _common import classify_file_not_found, read_non_empty_lines, run_command, sanitize_line
+from typing import Any
+
+from _common import (
+    RUN_STATS,
+    chunks,
+    classify_file_not_found,
+    phase,
+    read_non_empty_lines,
+    run_command,
+    sanitize_line,
+    write_jsonl_record,
+)
+from _snapshot import Snapshot, load_snapshot
+from _trace import TRACE, span
 
 
 # 基于 DBus 安全检查表的约定：
@@ -75,17 +86,12 @@ def _parse_getcap_output(stdout: str) -> dict[str, str]:
     return caps
 
 
-def _chunks(values: list[str], size: int) -> Iterable[list[str]]:
-    for i in range(0, len(values), size):
-        yield values[i : i + size]
-
-
-def _get_file_caps(paths: list[str], timeout_seconds: float) -> dict[str, str]:
+def get_file_caps(paths: list[str], timeout_seconds: float) -> dict[str, str]:
     if not paths:
         return {}
 
     caps: dict[str, str] = {}
-    for group in _chunks(paths, 200):
+    for group in chunks(paths, 200):
         completed = _run_command([SYSTEM_COMMANDS["getcap"], *group], timeout_seconds)
         if completed.returncode != 0:
             message = (completed.stderr or "").strip()
@@ -98,9 +104,80 @@ def _mode_octal(mode: int) -> str:
     return f"0o{mode & 0o7777:04o}"
 
 
-def _build_summary(results: list[dict[str, Any]]) -> dict[str, int]:
+def _file_mode(path: str, snapshot: Snapshot | None) -> int | None:
+    if snapshot is not None:
+        return snapshot.file_mode(path)
+    try:
+        return os.stat(path).st_mode
+    except FileNotFoundError:
+        return None
+
+
+def scan_package(package: str, timeout_seconds: float, snapshot: Snapshot | None) -> dict[str, Any]:
+    with phase("package_listing"):
+        if snapshot is not None:
+            files = snapshot.package_files(package)
+        else:
+            files = _list_installed_files(package, timeout_seconds)
+    if files is None:
+        return {"package": package, "status": "not-found"}
+
+    if snapshot is not None:
+        snapshot.require_package(package)
+        # 快照仅记录可执行的常规文件
+        binaries = [p for p in files if snapshot.file_mode(p) is not None]
+        caps_map = snapshot.file_caps(binaries)
+    else:
+        with phase("file_stat"):
+            binaries = [p for p in files if _is_executable_regular_file(p)]
+        with phase("capability_scan"):
+            caps_map = get_file_caps(binaries, timeout_seconds)
+
+    findings: list[dict[str, Any]] = []
+    findings_with_caps = 0
+    findings_with_setuid = 0
+    findings_with_setgid = 0
+
+    for path in binaries:
+        mode = _file_mode(path, snapshot)
+        if mode is None:
+            continue
+        setuid = bool(mode & stat.S_ISUID)
+        setgid = bool(mode & stat.S_ISGID)
+        cap_value = caps_map.get(path)
+
+        if cap_value or setuid or setgid:
+            findings.append(
+                {
+                    "path": path,
+                    "capabilities": cap_value,
+                    "setuid": setuid,
+                    "setgid": setgid,
+                    "mode_octal": _mode_octal(mode),
+                },
+            )
+            if cap_value:
+                findings_with_caps += 1
+            if setuid:
+                findings_with_setuid += 1
+            if setgid:
+                findings_with_setgid += 1
+
+    return {
+        "package": package,
+        "status": "ok",
+        "binaries_scanned": len(binaries),
+        "findings": findings,
+        "findings_count": len(findings),
+        "findings_with_caps": findings_with_caps,
+        "findings_with_setuid": findings_with_setuid,
+        "findings_with_setgid": findings_with_setgid,
+    }
+
+
+def build_summary(results: list[dict[str, Any]]) -> dict[str, Any]:
     summary = {
-        "total": len(results),
+        "total": 0,
         "ok": 0,
         "not_found": 0,
         "error": 0,
@@ -112,23 +189,28 @@ def _build_summary(results: list[dict[str, Any]]) -> dict[str, int]:
     }
 
     for r in results:
-        status = (r.get("status") or "").lower()
-        if status == "ok":
-            summary["ok"] += 1
-        elif status == "not-found":
-            summary["not_found"] += 1
-        else:
-            summary["error"] += 1
-
-        summary["binaries_scanned"] += int(r.get("binaries_scanned") or 0)
-        summary["findings"] += int(r.get("findings_count") or 0)
-        summary["findings_with_caps"] += int(r.get("findings_with_caps") or 0)
-        summary["findings_with_setuid"] += int(r.get("findings_with_setuid") or 0)
-        summary["findings_with_setgid"] += int(r.get("findings_with_setgid") or 0)
+        _count_result(summary, r)
 
     return summary
 
 
+def _count_result(summary: dict[str, Any], r: dict[str, Any]) -> None:
+    summary["total"] += 1
+    status = (r.get("status") or "").lower()
+    if status == "ok":
+        summary["ok"] += 1
+    elif status == "not-found":
+        summary["not_found"] += 1
+    else:
+        summary["error"] += 1
+
+    summary["binaries_scanned"] += int(r.get("binaries_scanned") or 0)
+    summary["findings"] += int(r.get("findings_count") or 0)
+    summary["findings_with_caps"] += int(r.get("findings_with_caps") or 0)
+    summary["findings_with_setuid"] += int(r.get("findings_with_setuid") or 0)
+    summary["findings_with_setgid"] += int(r.get("findings_with_setgid") or 0)
+
+
 def _load_packages(package: str | None, packages_file: str | None) -> list[str]:
     if package and packages_file:
         raise ValueError("package and --packages-file are mutually exclusive")
@@ -179,6 +261,24 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
         action="store_true",
         help="Output JSON to stdout (useful for CI pipelines).",
     )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Stream JSON Lines to stdout: one result record per package as soon as it is scanned, then a summary record.",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        help="Read all system inputs from a snapshot archive (see tools/snapshot.py) instead of the live host.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Add per-phase timing and external command statistics to the JSON/JSONL summary (summary.stats).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
+    )
     parser.add_argument(
         "--timeout",
         type=float,
@@ -190,73 +290,50 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
 
 def main(argv: list[str]) -> int:
     args = _parse_args(argv)
+    RUN_STATS.reset()
+    if args.trace_file:
+        TRACE.start("check_deb_binaries_privilege")
 
     try:
+        # 参数冲突在快照加载与任何系统查询之前拒绝
+        if args.json and args.jsonl:
+            raise ValueError("--json and --jsonl are mutually exclusive")
+        if args.stats and not (args.json or args.jsonl):
+            raise ValueError("--stats requires --json or --jsonl")
         packages = _load_packages(args.package, args.packages_file)
+        with phase("snapshot_load"):
+            snapshot = load_snapshot(args.from_snapshot) if args.from_snapshot else None
+        machine_output = args.json or args.jsonl
+
         results: list[dict[str, Any]] = []
+        summary = build_summary([])
+
+        def record(result: dict[str, Any]) -> None:
+            _count_result(summary, result)
+            if args.jsonl:
+                write_jsonl_record("result", "result", result)
+            else:
+                results.append(result)
 
         any_error = False
         any_not_found = False
 
         for package in packages:
             try:
-                files = _list_installed_files(package, args.timeout)
-                if files is None:
-                    results.append({"package": package, "status": "not-found"})
+                with span(package, "package") as trace_args:
+                    result = scan_package(package, args.timeout, snapshot)
+                    trace_args["status"] = result.get("status")
+                record(result)
+                if result.get("status") == "not-found":
                     any_not_found = True
-                    if not args.json:
+                    if not machine_output:
                         print(f"ERROR: package not installed: {package}", file=sys.stderr)
                     continue
 
-                binaries = [p for p in files if _is_executable_regular_file(p)]
-                caps_map = _get_file_caps(binaries, args.timeout)
-
-                findings: list[dict[str, Any]] = []
-                findings_with_caps = 0
-                findings_with_setuid = 0
-                findings_with_setgid = 0
-
-                for path in binaries:
-                    try:
-                        st = os.stat(path)
-                    except FileNotFoundError:
-                        continue
-                    setuid = bool(st.st_mode & stat.S_ISUID)
-                    setgid = bool(st.st_mode & stat.S_ISGID)
-                    cap_value = caps_map.get(path)
-
-                    if cap_value or setuid or setgid:
-                        findings.append(
-                            {
-                                "path": path,
-                                "capabilities": cap_value,
-                                "setuid": setuid,
-                                "setgid": setgid,
-                                "mode_octal": _mode_octal(st.st_mode),
-                            },
-                        )
-                        if cap_value:
-                            findings_with_caps += 1
-                        if setuid:
-                            findings_with_setuid += 1
-                        if setgid:
-                            findings_with_setgid += 1
-
-                result = {
-                    "package": package,
-                    "status": "ok",
-                    "binaries_scanned": len(binaries),
-                    "findings": findings,
-                    "findings_count": len(findings),
-                    "findings_with_caps": findings_with_caps,
-                    "findings_with_setuid": findings_with_setuid,
-                    "findings_with_setgid": findings_with_setgid,
-                }
-                results.append(result)
-
-                if args.json:
+                if machine_output:
                     continue
 
+                findings = result.get("findings") or []
                 if findings:
                     _print_findings(package, findings)
                     print("")
@@ -268,19 +345,21 @@ def main(argv: list[str]) -> int:
             except subprocess.TimeoutExpired:
                 any_error = True
                 error_message = f"command timed out after {args.timeout}s"
-                results.append({"package": package, "status": "error", "error": error_message})
-                if not args.json:
+                record({"package": package, "status": "error", "error": error_message})
+                if not machine_output:
                     print(f"ERROR: {error_message}", file=sys.stderr)
             except Exception as exc:
                 any_error = True
-                results.append({"package": package, "status": "error", "error": str(exc)})
-                if not args.json:
+                record({"package": package, "status": "error", "error": str(exc)})
+                if not machine_output:
                     print(f"ERROR: {exc}", file=sys.stderr)
 
-        summary = _build_summary(results)
-
+        if args.stats:
+            summary["stats"] = RUN_STATS.report()
         if args.json:
             print(json.dumps({"results": results, "summary": summary}, indent=2, ensure_ascii=False, sort_keys=True))
+        elif args.jsonl:
+            write_jsonl_record("summary", "summary", summary)
         elif len(packages) > 1:
             print("Summary: " + " ".join(f"{k}={v}" for k, v in summary.items()))
 
@@ -296,6 +375,9 @@ def main(argv: list[str]) -> int:
     except Exception as exc:
         print(f"ERROR: {exc}", file=sys.stderr)
         return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
 
 
 if __name__ == "__main__":
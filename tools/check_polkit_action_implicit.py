@@ -10,7 +10,17 @@ import subprocess
 import sys
 from typing import Any, Iterable
 
-from _common import classify_file_not_found, dpkg_query_owners, read_non_empty_lines, run_command, sanitize_line
+from _common import (
+    RUN_STATS,
+    classify_file_not_found,
+    phase,
+    read_non_empty_lines,
+    run_command,
+    sanitize_line,
+    write_jsonl_record,
+)
+from _snapshot import Snapshot, load_snapshot, lookup_owners
+from _trace import TRACE, span
 
 
 # 基于 DBus 安全检查表的约定：
@@ -69,14 +79,21 @@ def _iter_policy_files(search_dirs: Iterable[str]) -> Iterable[str]:
                     yield os.path.join(root, name)
 
 
-def _index_policy_actions(search_dirs: Iterable[str]) -> dict[str, list[str]]:
-    index: dict[str, set[str]] = {}
+def _iter_policy_contents(search_dirs: Iterable[str], snapshot: Snapshot | None) -> Iterable[tuple[str, str]]:
+    if snapshot is not None:
+        yield from snapshot.policy_files(search_dirs).items()
+        return
     for path in _iter_policy_files(search_dirs):
         try:
             with open(path, "r", encoding="utf-8", errors="replace") as handle:
-                content = handle.read()
+                yield path, handle.read()
         except OSError:
             continue
+
+
+def index_policy_actions(search_dirs: Iterable[str], snapshot: Snapshot | None = None) -> dict[str, list[str]]:
+    index: dict[str, set[str]] = {}
+    for path, content in _iter_policy_contents(search_dirs, snapshot):
         for action_id in ACTION_ID_RE.findall(content):
             key = action_id.strip()
             if not key:
@@ -85,21 +102,26 @@ def _index_policy_actions(search_dirs: Iterable[str]) -> dict[str, list[str]]:
     return {k: sorted(v) for k, v in index.items()}
 
 
-def _build_summary(results: list[dict[str, Any]]) -> dict[str, int]:
-    summary = {"total": len(results), "ok": 0, "not_found": 0, "error": 0, "flagged": 0}
+def build_summary(results: list[dict[str, Any]]) -> dict[str, Any]:
+    summary = {"total": 0, "ok": 0, "not_found": 0, "error": 0, "flagged": 0}
     for r in results:
-        status = (r.get("status") or "").lower()
-        if status == "ok":
-            summary["ok"] += 1
-        elif status == "not-found":
-            summary["not_found"] += 1
-        else:
-            summary["error"] += 1
-        if r.get("flagged"):
-            summary["flagged"] += 1
+        _count_result(summary, r)
     return summary
 
 
+def _count_result(summary: dict[str, Any], r: dict[str, Any]) -> None:
+    summary["total"] += 1
+    status = (r.get("status") or "").lower()
+    if status == "ok":
+        summary["ok"] += 1
+    elif status == "not-found":
+        summary["not_found"] += 1
+    else:
+        summary["error"] += 1
+    if r.get("flagged"):
+        summary["flagged"] += 1
+
+
 def _load_action_ids(action_id: str | None, actions_file: str | None) -> list[str]:
     if action_id and actions_file:
         raise ValueError("actionid and --actions-file are mutually exclusive")
@@ -179,6 +201,51 @@ def _print_finding(result: dict[str, Any]) -> None:
         print(f"PolicyFiles: {_format_list(result.get('policy_files') or [])}")
 
 
+def check_action(
+    action_id: str,
+    policy_index: dict[str, list[str]],
+    owners_cache: dict[str, list[str]],
+    timeout_seconds: float,
+    snapshot: Snapshot | None,
+) -> dict[str, Any]:
+    with phase("action_query"):
+        if snapshot is not None:
+            completed = snapshot.pkaction(action_id)
+        else:
+            completed = _run_command(
+                [SYSTEM_COMMANDS["pkaction"], "-a", action_id, "-v"],
+                timeout_seconds,
+            )
+    if completed.returncode != 0:
+        message = (completed.stderr or completed.stdout or "").strip()
+        status = "not-found" if _is_action_not_found_message(message) else "error"
+        return {"action_id": action_id, "status": status, "error": message}
+
+    implicit = _parse_pkaction_verbose(completed.stdout)
+    risk_level, risk_fields, flag_fields = _classify_implicit(implicit)
+    flagged = risk_level in {"high", "manual-review"}
+
+    result: dict[str, Any] = {
+        "action_id": action_id,
+        "status": "ok",
+        "implicit": implicit,
+        "flagged": flagged,
+        "flagged_fields": flag_fields,
+        "risk_level": risk_level,
+        "risk_fields": risk_fields,
+    }
+
+    if flagged:
+        policy_files = policy_index.get(action_id, [])
+        packages: set[str] = set()
+        for policy_file in policy_files:
+            packages.update(lookup_owners(policy_file, timeout_seconds, snapshot, owners_cache))
+        result["policy_files"] = policy_files
+        result["packages"] = sorted(packages)
+
+    return result
+
+
 def _parse_args(argv: list[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         prog="check_polkit_action_implicit",
@@ -194,10 +261,28 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
         action="store_true",
         help="Output JSON to stdout (useful for CI pipelines).",
     )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Stream JSON Lines to stdout: one result record per action as soon as it is checked, then a summary record.",
+    )
     parser.add_argument(
         "--only-flagged",
         action="store_true",
-        help="Only output flagged actions (and errors) in JSON; suppress non-flagged text output.",
+        help="Only output flagged actions (and errors) in JSON/JSONL; suppress non-flagged text output.",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        help="Read all system inputs from a snapshot archive (see tools/snapshot.py) instead of the live host.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Add per-phase timing and external command statistics to the JSON/JSONL summary (summary.stats).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
     )
     parser.add_argument(
         "--timeout",
@@ -210,68 +295,67 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
 
 def main(argv: list[str]) -> int:
     args = _parse_args(argv)
+    RUN_STATS.reset()
+    if args.trace_file:
+        TRACE.start("check_polkit_action_implicit")
 
     try:
+        # 参数冲突在快照加载与任何系统查询之前拒绝
+        if args.json and args.jsonl:
+            raise ValueError("--json and --jsonl are mutually exclusive")
+        if args.stats and not (args.json or args.jsonl):
+            raise ValueError("--stats requires --json or --jsonl")
         action_ids = _load_action_ids(args.actionid, args.actions_file)
-        policy_index = _index_policy_actions(POLICY_SEARCH_DIRS)
+        with phase("snapshot_load"):
+            snapshot = load_snapshot(args.from_snapshot) if args.from_snapshot else None
+        with phase("policy_scan"):
+            policy_index = index_policy_actions(POLICY_SEARCH_DIRS, snapshot)
         owners_cache: dict[str, list[str]] = {}
+        machine_output = args.json or args.jsonl
 
         results: list[dict[str, Any]] = []
+        summary = build_summary([])
+
+        def record(result: dict[str, Any]) -> None:
+            # summary 统计全部结果；--only-flagged 只影响输出的结果条目
+            _count_result(summary, result)
+            if args.only_flagged and result.get("status") == "ok" and not result.get("flagged"):
+                return
+            if args.jsonl:
+                write_jsonl_record("result", "result", result)
+            else:
+                results.append(result)
+
         any_error = False
         any_not_found = False
         any_flagged = False
 
         for index, action_id in enumerate(action_ids):
-            if index > 0 and not args.json:
+            if index > 0 and not machine_output:
                 print("")
 
             try:
-                completed = _run_command(
-                    [SYSTEM_COMMANDS["pkaction"], "-a", action_id, "-v"],
-                    args.timeout,
-                )
-                if completed.returncode != 0:
-                    message = (completed.stderr or completed.stdout or "").strip()
-                    status = "not-found" if _is_action_not_found_message(message) else "error"
-                    results.append({"action_id": action_id, "status": status, "error": message})
-                    if status == "not-found":
-                        any_not_found = True
-                        if not args.json:
-                            print(f"ERROR: action not found: {action_id}", file=sys.stderr)
-                    else:
-                        any_error = True
-                        if not args.json:
-                            print(f"ERROR: pkaction failed for {action_id}: {message}", file=sys.stderr)
+                with span(action_id, "action") as trace_args:
+                    result = check_action(action_id, policy_index, owners_cache, args.timeout, snapshot)
+                    trace_args["status"] = result.get("status")
+                record(result)
+                status = result.get("status")
+                if status == "not-found":
+                    any_not_found = True
+                    if not machine_output:
+                        print(f"ERROR: action not found: {action_id}", file=sys.stderr)
+                    continue
+                if status == "error":
+                    any_error = True
+                    if not machine_output:
+                        print(f"ERROR: pkaction failed for {action_id}: {result.get('error')}", file=sys.stderr)
                     continue
 
-                implicit = _parse_pkaction_verbose(completed.stdout)
-                risk_level, risk_fields, flag_fields = _classify_implicit(implicit)
-                flagged = risk_level in {"high", "manual-review"}
-
-                result: dict[str, Any] = {
-                    "action_id": action_id,
-                    "status": "ok",
-                    "implicit": implicit,
-                    "flagged": flagged,
-                    "flagged_fields": flag_fields,
-                    "risk_level": risk_level,
-                    "risk_fields": risk_fields,
-                }
-
+                flagged = bool(result.get("flagged"))
                 if flagged:
                     any_flagged = True
-                    policy_files = policy_index.get(action_id, [])
-                    packages: set[str] = set()
-                    for policy_file in policy_files:
-                        if policy_file not in owners_cache:
-                            owners_cache[policy_file] = dpkg_query_owners(policy_file, args.timeout)
-                        packages.update(owners_cache[policy_file])
-                    result["policy_files"] = policy_files
-                    result["packages"] = sorted(packages)
-
-                results.append(result)
 
-                if args.json:
+                if machine_output:
                     continue
 
                 if flagged:
@@ -284,26 +368,22 @@ def main(argv: list[str]) -> int:
             except subprocess.TimeoutExpired:
                 any_error = True
                 message = f"command timed out after {args.timeout}s"
-                results.append({"action_id": action_id, "status": "error", "error": message})
-                if not args.json:
+                record({"action_id": action_id, "status": "error", "error": message})
+                if not machine_output:
                     print(f"ERROR: {message}", file=sys.stderr)
             except Exception as exc:
                 any_error = True
-                results.append({"action_id": action_id, "status": "error", "error": str(exc)})
-                if not args.json:
+                record({"action_id": action_id, "status": "error", "error": str(exc)})
+                if not machine_output:
                     print(f"ERROR: {exc}", file=sys.stderr)
 
+        if args.stats:
+            summary["stats"] = RUN_STATS.report()
         if args.json:
-            output_results = results
-            if args.only_flagged:
-                output_results = [
-                    r
-                    for r in results
-                    if r.get("status") != "ok" or bool(r.get("flagged"))
-                ]
-            print(json.dumps({"results": output_results, "summary": _build_summary(results)}, indent=2, ensure_ascii=False, sort_keys=True))
+            print(json.dumps({"results": results, "summary": summary}, indent=2, ensure_ascii=False, sort_keys=True))
+        elif args.jsonl:
+            write_jsonl_record("summary", "summary", summary)
         elif len(action_ids) > 1 and not args.only_flagged:
-            summary = _build_summary(results)
             print("")
             print("Summary: " + " ".join(f"{k}={v}" for k, v in summary.items()))
 
@@ -321,6 +401,9 @@ def main(argv: list[str]) -> int:
     except Exception as exc:
         print(f"ERROR: {exc}", file=sys.stderr)
         return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
 
 
 if __name__ == "__main__":
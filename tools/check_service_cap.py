@@ -8,7 +8,21 @@ import subprocess
 import sys
 from typing import Any
 
-from _common import classify_file_not_found, parse_key_value_lines, read_non_empty_lines, sanitize_line, split_tokens, systemctl_show
+from _common import (
+    RUN_STATS,
+    classify_file_not_found,
+    list_service_units,
+    parse_key_value_lines,
+    phase,
+    read_non_empty_lines,
+    sanitize_line,
+    split_tokens,
+    systemctl_show_batches,
+    systemctl_show_output,
+    write_jsonl_record,
+)
+from _snapshot import Snapshot, load_snapshot
+from _trace import TRACE, span
 
 
 # 基于 DBus 安全检查表的约定：
@@ -109,6 +123,11 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
         "--services-file",
         help="Path to a file containing unit names (one per line).",
     )
+    parser.add_argument(
+        "--all-services",
+        action="store_true",
+        help="Check every loaded and installed service unit (systemctl list-units/list-unit-files).",
+    )
     parser.add_argument(
         "--expected-caps",
         help="Path to a file containing expected effective capability tokens (one per line).",
@@ -118,6 +137,24 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
         action="store_true",
         help="Output JSON to stdout (useful for CI pipelines).",
     )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Stream JSON Lines to stdout: one result record per line as soon as it is ready, then a summary record.",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        help="Read all system inputs from a snapshot archive (see tools/snapshot.py) instead of the live host.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Add per-phase timing and external command statistics to the JSON/JSONL summary (summary.stats).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
+    )
     parser.add_argument(
         "--timeout",
         type=float,
@@ -134,7 +171,7 @@ def _compare_effective_caps(actual_caps: list[str], expected_caps: list[str]) ->
     return (not missing and not unexpected), missing, unexpected
 
 
-def _load_expected_caps(path: str | None) -> list[str] | None:
+def load_expected_caps(path: str | None) -> list[str] | None:
     if not path:
         return None
     lines = read_non_empty_lines(path)
@@ -144,80 +181,138 @@ def _load_expected_caps(path: str | None) -> list[str] | None:
     return _normalize_cap_list(tokens)
 
 
-def _load_services(service: str | None, services_file: str | None) -> list[str]:
-    if service and services_file:
-        raise ValueError("service and --services-file are mutually exclusive")
-    if not service and not services_file:
-        raise ValueError("either a service argument or --services-file is required")
+def _validate_service_selection(service: str | None, services_file: str | None, all_services: bool) -> None:
+    if sum(bool(v) for v in (service, services_file, all_services)) > 1:
+        raise ValueError("service, --services-file and --all-services are mutually exclusive")
+    if not service and not services_file and not all_services:
+        raise ValueError("either a service argument, --services-file or --all-services is required")
 
+
+def _load_services(
+    service: str | None,
+    services_file: str | None,
+    all_services: bool,
+    timeout_seconds: float,
+    snapshot: Snapshot | None = None,
+) -> list[str]:
     if service:
         return [sanitize_line(service)]
 
+    if all_services:
+        services = snapshot.service_units() if snapshot is not None else list_service_units(timeout_seconds)
+        if not services:
+            raise ValueError("no service units found")
+        return services
+
     services = read_non_empty_lines(services_file or "")
     if not services:
         raise ValueError("services file is empty")
     return services
 
 
-def _build_summary(results: list[dict[str, Any]]) -> dict[str, int]:
-    summary = {"total": len(results), "ok": 0, "mismatch": 0, "not_found": 0, "error": 0}
+def build_summary(results: list[dict[str, Any]]) -> dict[str, Any]:
+    summary = {"total": 0, "ok": 0, "mismatch": 0, "not_found": 0, "error": 0}
     for r in results:
-        status = (r.get("status") or "").lower()
-        if status == "ok":
-            summary["ok"] += 1
-        elif status == "mismatch":
-            summary["mismatch"] += 1
-        elif status == "not-found":
-            summary["not_found"] += 1
-        else:
-            summary["error"] += 1
+        _count_result(summary, r)
     return summary
 
 
+def _count_result(summary: dict[str, Any], r: dict[str, Any]) -> None:
+    summary["total"] += 1
+    status = (r.get("status") or "").lower()
+    if status == "ok":
+        summary["ok"] += 1
+    elif status == "mismatch":
+        summary["mismatch"] += 1
+    elif status == "not-found":
+        summary["not_found"] += 1
+    else:
+        summary["error"] += 1
+
+
+def evaluate_service(service: str, kv: dict[str, str], expected_caps: list[str] | None) -> dict[str, Any]:
+    result = _build_result(service, kv)
+
+    load_state = (result.get("load_state") or "").lower()
+    if load_state == "not-found":
+        result["status"] = "not-found"
+    else:
+        result["status"] = "ok"
+
+    if expected_caps is not None and result.get("status") == "ok":
+        match, missing, unexpected = _compare_effective_caps(
+            result.get("effective_capabilities") or [],
+            expected_caps,
+        )
+        result["expected_capabilities"] = expected_caps
+        result["match_expected"] = match
+        result["missing_capabilities"] = missing
+        result["unexpected_capabilities"] = unexpected
+        if not match:
+            result["status"] = "mismatch"
+    return result
+
+
 def main(argv: list[str]) -> int:
     args = _parse_args(argv)
+    RUN_STATS.reset()
+    if args.trace_file:
+        TRACE.start("check_service_cap")
 
     try:
-        services = _load_services(args.service, args.services_file)
-        expected_caps = _load_expected_caps(args.expected_caps)
+        # 参数冲突在快照加载与任何系统查询之前拒绝
+        if args.json and args.jsonl:
+            raise ValueError("--json and --jsonl are mutually exclusive")
+        if args.stats and not (args.json or args.jsonl):
+            raise ValueError("--stats requires --json or --jsonl")
+        _validate_service_selection(args.service, args.services_file, args.all_services)
+        with phase("snapshot_load"):
+            snapshot = load_snapshot(args.from_snapshot) if args.from_snapshot else None
+        services = _load_services(args.service, args.services_file, args.all_services, args.timeout, snapshot)
+        expected_caps = load_expected_caps(args.expected_caps)
+
+        machine_output = args.json or args.jsonl
 
         results: list[dict[str, Any]] = []
+        summary = build_summary([])
+
+        def record(result: dict[str, Any]) -> None:
+            _count_result(summary, result)
+            if args.jsonl:
+                write_jsonl_record("result", "result", result)
+            else:
+                results.append(result)
+
         any_error = False
         any_not_found = False
         any_mismatch = False
 
-        for index, service in enumerate(services):
-            if index > 0 and not args.json:
+        if snapshot is not None:
+            show_outputs = ((service, None) for service in services)
+        else:
+            show_outputs = systemctl_show_batches(services, SYSTEMCTL_PROPERTIES, args.timeout)
+        for index, (service, batch_output) in enumerate(show_outputs):
+            if index > 0 and not machine_output:
                 print("")
 
             try:
-                output = systemctl_show(service, SYSTEMCTL_PROPERTIES, args.timeout)
-                kv = _parse_systemctl_show(output)
-                result = _build_result(service, kv)
-
-                load_state = (result.get("load_state") or "").lower()
-                if load_state == "not-found":
-                    result["status"] = "not-found"
+                with span(service, "service") as trace_args:
+                    if snapshot is not None:
+                        kv = snapshot.unit_properties(service)
+                    else:
+                        output = systemctl_show_output(service, batch_output, SYSTEMCTL_PROPERTIES, args.timeout)
+                        kv = _parse_systemctl_show(output)
+                    with phase("evaluation"):
+                        result = evaluate_service(service, kv, expected_caps)
+                    trace_args["status"] = result.get("status")
+                if result.get("status") == "not-found":
                     any_not_found = True
-                else:
-                    result["status"] = "ok"
-
-                if expected_caps is not None and result.get("status") == "ok":
-                    match, missing, unexpected = _compare_effective_caps(
-                        result.get("effective_capabilities") or [],
-                        expected_caps,
-                    )
-                    result["expected_capabilities"] = expected_caps
-                    result["match_expected"] = match
-                    result["missing_capabilities"] = missing
-                    result["unexpected_capabilities"] = unexpected
-                    if not match:
-                        result["status"] = "mismatch"
-                        any_mismatch = True
+                elif result.get("status") == "mismatch":
+                    any_mismatch = True
 
-                results.append(result)
+                record(result)
 
-                if args.json:
+                if machine_output:
                     continue
 
                 _print_text_report(result)
@@ -230,21 +325,24 @@ def main(argv: list[str]) -> int:
             except subprocess.TimeoutExpired:
                 any_error = True
                 error_result = {"service": service, "status": "error", "error": f"systemctl timed out after {args.timeout}s"}
-                results.append(error_result)
-                if not args.json:
+                record(error_result)
+                if not machine_output:
                     print(f"ERROR: {error_result['error']}", file=sys.stderr)
             except Exception as exc:
                 any_error = True
                 error_result = {"service": service, "status": "error", "error": str(exc)}
-                results.append(error_result)
-                if not args.json:
+                record(error_result)
+                if not machine_output:
                     print(f"ERROR: {error_result['error']}", file=sys.stderr)
 
+        if args.stats:
+            summary["stats"] = RUN_STATS.report()
         if args.json:
-            payload = {"results": results, "summary": _build_summary(results)}
+            payload = {"results": results, "summary": summary}
             print(json.dumps(payload, indent=2, ensure_ascii=False, sort_keys=True))
+        elif args.jsonl:
+            write_jsonl_record("summary", "summary", summary)
         elif len(services) > 1:
-            summary = _build_summary(results)
             print("")
             print(
                 "Summary: "
@@ -265,6 +363,9 @@ def main(argv: list[str]) -> int:
     except Exception as exc:
         print(f"ERROR: {exc}", file=sys.stderr)
         return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
 
 
 if __name__ == "__main__":
@@ -8,12 +8,28 @@ import subprocess
 import sys
 from typing import Any
 
-from _common import classify_file_not_found, parse_key_value_lines, read_non_empty_lines, sanitize_line, split_tokens, systemctl_show
+from _common import (
+    RUN_STATS,
+    classify_file_not_found,
+    list_service_units,
+    parse_key_value_lines,
+    phase,
+    read_non_empty_lines,
+    sanitize_line,
+    split_tokens,
+    systemctl_show_batches,
+    systemctl_show_output,
+    write_jsonl_record,
+)
+from _path_trie import PathTrie, add_fs_scope_result, run_queries
+from _snapshot import Snapshot, load_snapshot
+from _trace import TRACE, span
 
 
 # 基于 DBus 安全检查表的约定：
 # - 通过 systemctl show 读取 service 的沙箱/路径相关参数，派生可读/可写范围摘要
 # - 若显式使用 /var/lib /var/run /run，提示优先使用 StateDirectory=/RuntimeDirectory=
+# - 可选：基于全部 service 的有效范围构建路径前缀树，一次回答“哪些 service 可写某路径/某目录下”等查询
 
 SYSTEMCTL_PROPERTIES = (
     "LoadState",
@@ -84,34 +100,53 @@ def _protect_home_effect(mode: str) -> tuple[list[str], list[str], list[str]]:
     return [], [], []
 
 
-def _load_services(service: str | None, services_file: str | None) -> list[str]:
-    if service and services_file:
-        raise ValueError("service and --services-file are mutually exclusive")
-    if not service and not services_file:
-        raise ValueError("either a service argument or --services-file is required")
+def _validate_service_selection(service: str | None, services_file: str | None, all_services: bool) -> None:
+    if sum(bool(v) for v in (service, services_file, all_services)) > 1:
+        raise ValueError("service, --services-file and --all-services are mutually exclusive")
+    if not service and not services_file and not all_services:
+        raise ValueError("either a service argument, --services-file or --all-services is required")
+
 
+def _load_services(
+    service: str | None,
+    services_file: str | None,
+    all_services: bool,
+    timeout_seconds: float,
+    snapshot: Snapshot | None = None,
+) -> list[str]:
     if service:
         return [sanitize_line(service)]
 
+    if all_services:
+        services = snapshot.service_units() if snapshot is not None else list_service_units(timeout_seconds)
+        if not services:
+            raise ValueError("no service units found")
+        return services
+
     services = read_non_empty_lines(services_file or "")
     if not services:
         raise ValueError("services file is empty")
     return services
 
 
-def _build_summary(results: list[dict[str, Any]]) -> dict[str, int]:
-    summary = {"total": len(results), "ok": 0, "not_found": 0, "error": 0}
+def build_summary(results: list[dict[str, Any]]) -> dict[str, Any]:
+    summary = {"total": 0, "ok": 0, "not_found": 0, "error": 0}
     for r in results:
-        status = (r.get("status") or "").lower()
-        if status == "ok":
-            summary["ok"] += 1
-        elif status == "not-found":
-            summary["not_found"] += 1
-        else:
-            summary["error"] += 1
+        _count_result(summary, r)
     return summary
 
 
+def _count_result(summary: dict[str, Any], r: dict[str, Any]) -> None:
+    summary["total"] += 1
+    status = (r.get("status") or "").lower()
+    if status == "ok":
+        summary["ok"] += 1
+    elif status == "not-found":
+        summary["not_found"] += 1
+    else:
+        summary["error"] += 1
+
+
 def _derive_state_directory_paths(names: list[str]) -> list[str]:
     return [f"/var/lib/{name}" for name in names]
 
@@ -140,7 +175,7 @@ def _detect_state_runtime_hint(explicit_paths: list[str]) -> tuple[bool, list[st
     return True, offenders, message
 
 
-def _build_result(service: str, kv: dict[str, str]) -> dict[str, Any]:
+def build_result(service: str, kv: dict[str, str]) -> dict[str, Any]:
     load_state = (kv.get("LoadState") or "").strip()
 
     protect_system = _normalize_protect_system(kv.get("ProtectSystem") or "")
@@ -283,11 +318,55 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
         "--services-file",
         help="Path to a file containing unit names (one per line).",
     )
+    parser.add_argument(
+        "--all-services",
+        action="store_true",
+        help="Check every loaded and installed service unit (systemctl list-units/list-unit-files).",
+    )
     parser.add_argument(
         "--json",
         action="store_true",
         help="Output JSON to stdout (useful for CI pipelines).",
     )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Stream JSON Lines to stdout: one result record per line as soon as it is ready, then a summary record.",
+    )
+    parser.add_argument(
+        "--can-write",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="Report services that can write PATH (repeatable).",
+    )
+    parser.add_argument(
+        "--can-read",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="Report services that can read PATH (repeatable).",
+    )
+    parser.add_argument(
+        "--writable-under",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="Report services that can write PATH or anything below it (repeatable).",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        help="Read all system inputs from a snapshot archive (see tools/snapshot.py) instead of the live host.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Add per-phase timing and external command statistics to the JSON/JSONL summary (summary.stats).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
+    )
     parser.add_argument(
         "--timeout",
         type=float,
@@ -297,30 +376,82 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
     return parser.parse_args(argv)
 
 
+def _collect_queries(args: argparse.Namespace) -> list[tuple[str, str]]:
+    queries: list[tuple[str, str]] = []
+    queries.extend(("can-write", path) for path in args.can_write)
+    queries.extend(("can-read", path) for path in args.can_read)
+    queries.extend(("writable-under", path) for path in args.writable_under)
+    for _, path in queries:
+        if not path.startswith("/"):
+            raise ValueError(f"query path must be absolute: {path}")
+    return queries
+
+
+def _print_query_results(query_results: list[dict[str, Any]]) -> None:
+    for q in query_results:
+        print(f"Query: {q['type']} {q['path']} -> {_format_list(q.get('services') or [])}")
+
+
 def main(argv: list[str]) -> int:
     args = _parse_args(argv)
+    RUN_STATS.reset()
+    if args.trace_file:
+        TRACE.start("check_service_fs_scope")
 
     try:
-        services = _load_services(args.service, args.services_file)
+        # 参数冲突在快照加载与任何系统查询之前拒绝
+        if args.json and args.jsonl:
+            raise ValueError("--json and --jsonl are mutually exclusive")
+        if args.stats and not (args.json or args.jsonl):
+            raise ValueError("--stats requires --json or --jsonl")
+        _validate_service_selection(args.service, args.services_file, args.all_services)
+        queries = _collect_queries(args)
+        with phase("snapshot_load"):
+            snapshot = load_snapshot(args.from_snapshot) if args.from_snapshot else None
+        services = _load_services(args.service, args.services_file, args.all_services, args.timeout, snapshot)
+
+        machine_output = args.json or args.jsonl
 
         results: list[dict[str, Any]] = []
+        summary = build_summary([])
+        trie = PathTrie()
+
+        def record(result: dict[str, Any]) -> None:
+            _count_result(summary, result)
+            if queries:
+                add_fs_scope_result(trie, result)
+            if args.jsonl:
+                write_jsonl_record("result", "result", result)
+            else:
+                results.append(result)
+
         any_error = False
         any_not_found = False
 
-        for index, service in enumerate(services):
-            if index > 0 and not args.json:
+        if snapshot is not None:
+            show_outputs = ((service, None) for service in services)
+        else:
+            show_outputs = systemctl_show_batches(services, SYSTEMCTL_PROPERTIES, args.timeout)
+        for index, (service, batch_output) in enumerate(show_outputs):
+            if index > 0 and not machine_output:
                 print("")
 
             try:
-                output = systemctl_show(service, SYSTEMCTL_PROPERTIES, args.timeout)
-                kv = _parse_systemctl_show(output)
-                result = _build_result(service, kv)
-                results.append(result)
+                with span(service, "service") as trace_args:
+                    if snapshot is not None:
+                        kv = snapshot.unit_properties(service)
+                    else:
+                        output = systemctl_show_output(service, batch_output, SYSTEMCTL_PROPERTIES, args.timeout)
+                        kv = _parse_systemctl_show(output)
+                    with phase("evaluation"):
+                        result = build_result(service, kv)
+                    trace_args["status"] = result.get("status")
+                record(result)
 
                 if result.get("status") == "not-found":
                     any_not_found = True
 
-                if args.json:
+                if machine_output:
                     continue
 
                 _print_text_report(result)
@@ -331,23 +462,37 @@ def main(argv: list[str]) -> int:
             except subprocess.TimeoutExpired:
                 any_error = True
                 error_result = {"service": service, "status": "error", "error": f"systemctl timed out after {args.timeout}s"}
-                results.append(error_result)
-                if not args.json:
+                record(error_result)
+                if not machine_output:
                     print(f"ERROR: {error_result['error']}", file=sys.stderr)
             except Exception as exc:
                 any_error = True
                 error_result = {"service": service, "status": "error", "error": str(exc)}
-                results.append(error_result)
-                if not args.json:
+                record(error_result)
+                if not machine_output:
                     print(f"ERROR: {error_result['error']}", file=sys.stderr)
 
+        with phase("path_queries"):
+            query_results = run_queries(trie, queries) if queries else []
+
+        if args.stats:
+            summary["stats"] = RUN_STATS.report()
         if args.json:
-            payload = {"results": results, "summary": _build_summary(results)}
+            payload: dict[str, Any] = {"results": results, "summary": summary}
+            if queries:
+                payload["queries"] = query_results
             print(json.dumps(payload, indent=2, ensure_ascii=False, sort_keys=True))
-        elif len(services) > 1:
-            summary = _build_summary(results)
-            print("")
-            print("Summary: " + " ".join(f"{k}={v}" for k, v in summary.items()))
+        elif args.jsonl:
+            for q in query_results:
+                write_jsonl_record("query", "query", q)
+            write_jsonl_record("summary", "summary", summary)
+        else:
+            if len(services) > 1:
+                print("")
+                print("Summary: " + " ".join(f"{k}={v}" for k, v in summary.items()))
+            if query_results:
+                print("")
+                _print_query_results(query_results)
 
         if any_not_found:
             return 2
@@ -361,6 +506,9 @@ def main(argv: list[str]) -> int:
     except Exception as exc:
         print(f"ERROR: {exc}", file=sys.stderr)
         return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
 
 
 if __name__ == "__main__":
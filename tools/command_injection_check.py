@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import os
+import re
 import shlex
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from string import Template
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+
+from _candidate_scan import glob_excluded, iter_candidate_files, scan_candidates
+from _codex_control import CodexController, estimate_tokens, parse_budget, throughput
+from _json_extract import compile_schema, extract_json, render_repair_prompt
+from _source_index import SOURCE_SUFFIXES, build_source_index, exec_call_site_context
+from _trace import TRACE, span
 
 
 CHECK_TYPE_CONFIG = {
@@ -60,6 +70,60 @@ RG_EXCLUDE_GLOBS = [
 ]
 
 MAX_PRE_SCAN_LINES = 200
+DEFAULT_HINT_TOKEN_BUDGET = 4000
+MAX_SCOPE_FILES = 200
+RG_PATHS_PER_CALL = 500
+MAX_EXEC_CALL_SITE_LINES = 300
+
+WHOLE_PROJECT_SCOPE = "The whole project."
+
+# 候选排序：按正则的严重程度打底分（隐式 shell 执行最高），再按命中行及邻近行的信号加减分
+CANDIDATE_SEVERITY = {
+    r"\bos\.system\s*\(": 5,
+    r"\b(?:system|popen|_popen)\s*\(": 5,
+    r"\bg_spawn_(?:async|sync|command_line_async|command_line_sync)\s*\(": 3,
+    r"\bsubprocess\.(?:run|Popen|call|check_output)\s*\(": 3,
+    r"\bexec\.Command(?:Context)?\s*\(": 3,
+    r"\bsyscall\.Exec\s*\(": 3,
+    r"\bsyscall\.ForkExec\s*\(": 3,
+    r"\bposix_spawn(?:p)?\s*\(": 3,
+}
+
+# (信号, 命中行加分, 邻近行加分, 正则)
+CANDIDATE_SIGNALS = [
+    ("shell_c", 8, 4, re.compile(r"[\"'`](?:/bin/|/usr/bin/)?(?:ba|da|z)?sh[\"'`]\s*,\s*[\"'`]-c[\"'`]|\b(?:ba|da|z)?sh -c\b")),
+    ("shell_true", 6, 0, re.compile(r"\bshell\s*=\s*True\b")),
+    ("command_line", 3, 0, re.compile(r"\bg_spawn_command_line_")),
+    (
+        "format_string",
+        3,
+        2,
+        re.compile(r"\bSprintf\b|\bs?n?printf\s*\(|\bstrn?cat\s*\(|\.format\s*\(|\bf[\"']|%[sdvq]|\$\{|[\"'`]\s*\+|\+\s*[\"'`]"),
+    ),
+]
+
+SIGNAL_CONTEXT_LINES = 3
+
+TEST_PATH_PATTERN = re.compile(
+    r"(?:^|/)(?:tests?|testdata|testing|fixtures?|mocks?|__tests__|spec)(?:/|$)"
+    r"|(?:^|/)(?:test_[^/]*|[^/]*_test\.[^/]+|[^/]*\.test\.[^/]+|[^/]*_spec\.[^/]+)$"
+)
+TEST_PATH_PENALTY = 6
+VENDOR_PATH_PATTERN = re.compile(r"(?:^|/)(?:vendor|third_party|3rdparty|external)(?:/|$)")
+VENDOR_PATH_PENALTY = 3
+
+# 合并分片结果时的去重依据：各类发现用于区分的字段
+FINDING_KIND_KEYS = {
+    "explicit_shell_exec": "interpreter",
+    "implicit_shell_exec": "api",
+}
+
+CONFIDENCE_LEVELS = ["low", "medium", "high"]
+
+# 失败分片写入合并结果 gaps 的格式；含此类 gap 的结果不能作为增量检查的基线
+SHARD_FAILURE_GAP = "shard {id} not checked: {error}"
+REPAIR_SEPARATOR = "\n===== json repair pass =====\n"
+SHARD_FAILURE_GAP_PATTERN = re.compile(r"^shard .+ not checked: ")
 
 
 def load_prompt_template(path: Path) -> Template:
@@ -67,78 +131,470 @@ def load_prompt_template(path: Path) -> Template:
     return Template(text)
 
 
-def run_codex(cmd: str, prompt: str, cwd: Path, timeout: int) -> subprocess.CompletedProcess:
+def run_codex(cmd: str, prompt: str, cwd: Path, timeout: float) -> subprocess.CompletedProcess:
     args = shlex.split(cmd)
-    return subprocess.run(
-        args,
-        input=prompt,
-        text=True,
-        capture_output=True,
-        cwd=str(cwd),
-        timeout=timeout,
-        check=False,
-    )
+    with span(os.path.basename(args[0]), "command", {"timeout": timeout, "prompt_chars": len(prompt)}) as trace_args:
+        result = subprocess.run(
+            args,
+            input=prompt,
+            text=True,
+            capture_output=True,
+            cwd=str(cwd),
+            timeout=timeout,
+            check=False,
+        )
+        trace_args["exit_code"] = result.returncode
+    return result
 
 
-def parse_json_output(output: str) -> Dict[str, Any]:
-    output = output.strip()
-    if not output:
-        raise ValueError("Empty codex output")
-    try:
-        return json.loads(output)
-    except json.JSONDecodeError as exc:
-        raise ValueError(f"Codex output is not valid JSON: {exc}") from exc
+def output_schema(check_type: str) -> Dict[str, Any]:
+    properties: Dict[str, Any] = {"check_type": {"enum": [check_type, "unknown"]}, "gaps": {"type": "array"}}
+    for kind in FINDING_KIND_KEYS:
+        properties[kind] = {"type": "array"}
+    return {
+        "type": "object",
+        "required": sorted(CHECK_TYPE_CONFIG[check_type]["required_keys"]),
+        "properties": properties,
+    }
+
+
+OUTPUT_VALIDATORS = {check_type: compile_schema(output_schema(check_type)) for check_type in CHECK_TYPE_CONFIG}
 
 
 def validate_output(payload: Dict[str, Any], check_type: str) -> List[str]:
-    errors: List[str] = []
-    if not isinstance(payload, dict):
-        return ["Output must be a JSON object"]
-    missing = CHECK_TYPE_CONFIG[check_type]["required_keys"] - set(payload.keys())
-    if missing:
-        errors.append(f"Missing top-level keys: {sorted(missing)}")
-    if payload.get("check_type") not in (check_type, "unknown"):
-        errors.append("check_type mismatch")
-    return errors
-
-
-def build_pre_scan_hints(project_root: Path) -> str:
+    return OUTPUT_VALIDATORS[check_type](payload)
+
+
+def repair_output(
+    output: str,
+    errors: List[str],
+    args: argparse.Namespace,
+    project_root: Path,
+    controller: CodexController,
+    usage: Optional[Dict[str, Any]] = None,
+) -> Tuple[Any, List[str], str]:
+    # 一次低成本修复：把原始输出与校验错误交给 codex 只修正格式，不重新分析源码；返回 (值, 校验错误, 修复输出原文)
+    prompt = render_repair_prompt(output, errors, output_schema(args.check_type))
+    try:
+        result = controller.run(
+            lambda timeout: run_codex(args.codex_cmd, prompt, project_root, timeout), prompt, usage, kind="repair"
+        )
+    except subprocess.TimeoutExpired as exc:
+        return None, [f"repair timed out after {exc.timeout:g}s"], _timeout_output(exc)
+    raw_text = result.stdout + result.stderr
+    if result.returncode != 0:
+        return None, [f"repair failed with code {result.returncode}"], raw_text
+    value, repair_errors = extract_json(result.stdout, OUTPUT_VALIDATORS[args.check_type])
+    return value, repair_errors, raw_text
+
+
+def candidate_pattern(text: str) -> str:
+    for pattern in RG_CANDIDATE_PATTERNS:
+        if re.search(pattern, text):
+            return pattern
+    return ""
+
+
+def run_rg_pre_scan(project_root: Path, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    # rg 不存在时抛出 FileNotFoundError，执行失败时抛出 RuntimeError；paths 限定只扫描这些文件（增量检查）
     cmd = ["rg", "--line-number", "--no-heading", "--with-filename"]
     for glob in RG_EXCLUDE_GLOBS:
         cmd.extend(["--glob", f"!{glob}"])
     for pattern in RG_CANDIDATE_PATTERNS:
         cmd.extend(["-e", pattern])
-    try:
-        result = subprocess.run(
-            cmd,
-            cwd=str(project_root),
-            text=True,
-            capture_output=True,
-            check=False,
+
+    if paths is None:
+        commands = [cmd]
+    else:
+        commands = [cmd + ["--"] + paths[i : i + RG_PATHS_PER_CALL] for i in range(0, len(paths), RG_PATHS_PER_CALL)]
+
+    hits: List[Dict[str, Any]] = []
+    for command in commands:
+        with span("rg", "command", {"argv": " ".join(command)}):
+            result = subprocess.run(
+                command,
+                cwd=str(project_root),
+                text=True,
+                capture_output=True,
+                check=False,
+            )
+        if result.returncode not in (0, 1):
+            error_msg = result.stderr.strip() or result.stdout.strip()
+            if not error_msg:
+                error_msg = f"rg failed with code {result.returncode}"
+            raise RuntimeError(error_msg)
+
+        for line in result.stdout.splitlines():
+            if not line.strip():
+                continue
+            parts = line.split(":", 2)
+            if len(parts) != 3 or not parts[1].isdigit():
+                continue
+            hits.append({"file": parts[0], "line": int(parts[1]), "pattern": candidate_pattern(parts[2]), "text": parts[2]})
+    return hits
+
+
+def run_pre_scan(
+    project_root: Path,
+    paths: Optional[List[str]] = None,
+    scanner: str = "auto",
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # 返回结构化命中 {"file","line","pattern","text"}；rg 不可用时（auto）改用内置扫描器，失败时返回说明文字
+    if paths is not None and not paths:
+        return [], None
+    if scanner != "builtin":
+        try:
+            return run_rg_pre_scan(project_root, paths), None
+        except FileNotFoundError:
+            if scanner == "rg":
+                return [], "rg not available; pre-scan skipped."
+        except RuntimeError as exc:
+            return [], f"rg error: {exc}"
+    return scan_candidates(project_root, RG_CANDIDATE_PATTERNS, RG_EXCLUDE_GLOBS, paths), None
+
+
+def git_changed_files(project_root: Path, since: str) -> List[str]:
+    # 自 since 以来改动（含工作区未提交修改、删除）及未跟踪的文件，路径相对 project_root
+    commands = [
+        ["git", "diff", "--name-only", "--relative", since, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ]
+    changed: List[str] = []
+    for command in commands:
+        with span("git", "command", {"argv": " ".join(command)}):
+            result = subprocess.run(command, cwd=str(project_root), text=True, capture_output=True, check=False)
+        if result.returncode != 0:
+            error_msg = result.stderr.strip() or f"{' '.join(command[:2])} failed with code {result.returncode}"
+            raise ValueError(error_msg)
+        changed.extend(line.strip() for line in result.stdout.splitlines() if line.strip())
+    return sorted(set(changed))
+
+
+def _file_lines(project_root: Path, path: str, cache: Dict[str, List[str]]) -> List[str]:
+    if path not in cache:
+        try:
+            cache[path] = (project_root / path).read_text(encoding="utf-8", errors="replace").splitlines()
+        except OSError:
+            cache[path] = []
+    return cache[path]
+
+
+def score_candidate(hit: Dict[str, Any], context: List[str]) -> Tuple[int, List[str]]:
+    # 返回 (分数, 命中的信号)；context 为命中行前后若干行（不含命中行）
+    score = CANDIDATE_SEVERITY.get(hit.get("pattern", ""), 3)
+    signals: List[str] = []
+    for name, line_weight, context_weight, pattern in CANDIDATE_SIGNALS:
+        if pattern.search(hit["text"]):
+            score += line_weight
+            signals.append(name)
+        elif context_weight and any(pattern.search(line) for line in context):
+            score += context_weight
+            signals.append(f"{name}_nearby")
+    if TEST_PATH_PATTERN.search(hit["file"]):
+        score -= TEST_PATH_PENALTY
+        signals.append("test_path")
+    elif VENDOR_PATH_PATTERN.search(hit["file"]):
+        score -= VENDOR_PATH_PENALTY
+        signals.append("vendor_path")
+    return score, signals
+
+
+def rank_candidates(hits: List[Dict[str, Any]], project_root: Path) -> List[Dict[str, Any]]:
+    cache: Dict[str, List[str]] = {}
+    ranked: List[Dict[str, Any]] = []
+    for hit in hits:
+        lines = _file_lines(project_root, hit["file"], cache)
+        index = hit["line"] - 1
+        context = lines[max(0, index - SIGNAL_CONTEXT_LINES) : index] + lines[index + 1 : index + 1 + SIGNAL_CONTEXT_LINES]
+        score, signals = score_candidate(hit, context)
+        ranked.append(dict(hit, score=score, signals=signals))
+    ranked.sort(key=lambda hit: (-hit["score"], hit["file"], hit["line"]))
+    return ranked
+
+
+def format_pre_scan_hits(
+    hits: List[Dict[str, Any]],
+    project_root: Path,
+    token_budget: int = DEFAULT_HINT_TOKEN_BUDGET,
+) -> str:
+    # 按分数从高到低装入 token 预算，再按文件分组输出（文件按其最高分排序，组内按行号）
+    if not hits:
+        return "Pre-scan found no candidate lines."
+    ranked = rank_candidates(hits, project_root)
+    selected: Dict[str, List[Dict[str, Any]]] = {}
+    totals: Dict[str, int] = {}
+    for hit in ranked:
+        totals[hit["file"]] = totals.get(hit["file"], 0) + 1
+    used = 0
+    for hit in ranked:
+        cost = estimate_tokens(f"{hit['line']}: {hit['text'].strip()}\n")
+        if hit["file"] not in selected:
+            cost += estimate_tokens(f"--- {hit['file']} (999 of 999 candidates)\n")
+        if used + cost > token_budget:
+            continue
+        selected.setdefault(hit["file"], []).append(hit)
+        used += cost
+
+    blocks: List[str] = []
+    for path, file_hits in selected.items():
+        lines = [f"--- {path} ({len(file_hits)} of {totals[path]} candidates)"]
+        lines.extend(f"{hit['line']}: {hit['text'].strip()}" for hit in sorted(file_hits, key=lambda hit: hit["line"]))
+        blocks.append("\n".join(lines))
+    omitted = len(ranked) - sum(len(file_hits) for file_hits in selected.values())
+    if omitted:
+        omitted_files = sum(1 for path in totals if len(selected.get(path, [])) < totals[path])
+        blocks.append(f"... ({omitted} lower-ranked candidates in {omitted_files} files omitted to fit the hint budget)")
+    return "\n\n".join(blocks)
+
+
+def build_pre_scan_hints(project_root: Path, token_budget: int = DEFAULT_HINT_TOKEN_BUDGET) -> str:
+    hits, message = run_pre_scan(project_root)
+    if message:
+        return message
+    return format_pre_scan_hits(hits, project_root, token_budget)
+
+
+def shard_scope(path: str, depth: int) -> str:
+    parts = path.split("/")[:-1]
+    return "/".join(parts[:depth]) or "."
+
+
+def shard_files(project_root: Path, scan_paths: Optional[List[str]]) -> List[str]:
+    # 分片覆盖的文件：增量模式为全部待检查的改动文件，否则为项目内全部源码文件（遍历规则与内置预扫描一致）
+    if scan_paths is not None:
+        return list(scan_paths)
+    return [
+        path
+        for path in iter_candidate_files(project_root, RG_EXCLUDE_GLOBS)
+        if os.path.splitext(path)[1].lower() in SOURCE_SUFFIXES
+    ]
+
+
+def build_shards(files: List[str], hits: List[Dict[str, Any]], depth: int) -> List[Dict[str, Any]]:
+    # 按文件所在目录的前 depth 级把全部待检查文件分组，预扫描命中只作为各分片的提示（无命中的文件同样需要检查）；
+    # 分组超过 MAX_SCOPE_FILES 个文件或 MAX_PRE_SCAN_LINES 条命中时按文件边界继续切分，避免提示词截断
+    hits_by_file: Dict[str, List[Dict[str, Any]]] = {}
+    for hit in hits:
+        hits_by_file.setdefault(hit["file"], []).append(hit)
+    grouped: Dict[str, List[str]] = {}
+    for path in sorted(set(files) | set(hits_by_file)):
+        grouped.setdefault(shard_scope(path, depth), []).append(path)
+
+    shards: List[Dict[str, Any]] = []
+    for scope in sorted(grouped):
+        chunks: List[Dict[str, List[Any]]] = [{"files": [], "hits": []}]
+        for path in grouped[scope]:
+            file_hits = hits_by_file.get(path, [])
+            # 单个文件命中超过上限时拆到相邻分片，各分片都列出该文件
+            for start in range(0, max(len(file_hits), 1), MAX_PRE_SCAN_LINES):
+                part = file_hits[start : start + MAX_PRE_SCAN_LINES]
+                current = chunks[-1]
+                if current["files"] and (
+                    len(current["files"]) >= MAX_SCOPE_FILES or len(current["hits"]) + len(part) > MAX_PRE_SCAN_LINES
+                ):
+                    chunks.append({"files": [], "hits": []})
+                chunks[-1]["files"].append(path)
+                chunks[-1]["hits"].extend(part)
+        for number, chunk in enumerate(chunks, start=1):
+            shard_id = scope if len(chunks) == 1 else f"{scope}#{number}"
+            shards.append({"id": shard_id, "scope": scope, "files": chunk["files"], "hits": chunk["hits"]})
+    return shards
+
+
+def shard_dir_name(index: int, shard_id: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", shard_id).strip("_") or "root"
+    return f"{index:03d}-{safe}"
+
+
+def shard_scope_text(shard: Dict[str, Any], total: int, since: Optional[str] = None) -> str:
+    lines: List[str] = []
+    if since:
+        lines.append(
+            f"This is an incremental run over files changed since `{since}`; "
+            "findings in unchanged files are kept from the previous result."
         )
-    except FileNotFoundError:
-        return "rg not available; pre-scan skipped."
-
-    if result.returncode not in (0, 1):
-        error_msg = result.stderr.strip() or result.stdout.strip()
-        if not error_msg:
-            error_msg = f"rg failed with code {result.returncode}"
-        return f"rg error: {error_msg}"
-
-    lines = [line for line in result.stdout.splitlines() if line.strip()]
-    if not lines:
-        return "rg found no candidate lines."
-    if len(lines) > MAX_PRE_SCAN_LINES:
-        lines = lines[:MAX_PRE_SCAN_LINES]
-        lines.append("... (truncated)")
+    if total > 1:
+        lines.append(f"This run is shard `{shard['id']}` ({total} shards in total, split by source subtree).")
+    lines.extend(
+        [
+            "Only report invocation sites located in the files below.",
+            "Check every listed file, including files without pre-scan candidates: they may still run commands "
+            "through calls the pre-scan does not match (e.g. execve/execvp or project-specific wrappers).",
+            "You may still read any project file to trace where command arguments come from.",
+        ]
+    )
+    files = shard["files"]
+    lines.extend(f"- {path}" for path in files[:MAX_SCOPE_FILES])
+    if len(files) > MAX_SCOPE_FILES:
+        lines.append(f"- ... ({len(files) - MAX_SCOPE_FILES} more)")
     return "\n".join(lines)
 
 
+def _timeout_output(exc: subprocess.TimeoutExpired) -> str:
+    parts = []
+    for chunk in (exc.stdout, exc.stderr):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("utf-8", errors="replace")
+        parts.append(chunk or "")
+    return "".join(parts)
+
+
+def check_shard(
+    prompt: str,
+    args: argparse.Namespace,
+    project_root: Path,
+    shard_dir: Path,
+    controller: CodexController,
+) -> Dict[str, Any]:
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    raw_path = shard_dir / "raw.txt"
+    result_path = shard_dir / "result.json"
+    # 本次检查（含重试与修复）的用量
+    usage: Dict[str, Any] = {}
+    outcome: Dict[str, Any] = {"result": str(result_path), "raw_output": str(raw_path), "usage": usage}
+
+    try:
+        with span(shard_dir.name, "check"):
+            result = controller.run(lambda timeout: run_codex(args.codex_cmd, prompt, project_root, timeout), prompt, usage)
+    except subprocess.TimeoutExpired as exc:
+        raw_path.write_text(_timeout_output(exc), encoding="utf-8")
+        outcome.update({"status": "error", "error": f"codex exec timed out after {exc.timeout:g}s"})
+    else:
+        raw_text = result.stdout + result.stderr
+        raw_path.write_text(raw_text, encoding="utf-8")
+        if result.returncode != 0:
+            outcome.update({"status": "error", "error": f"codex exec failed with code {result.returncode}"})
+        else:
+            # 容错提取最后一个合法的顶层 JSON 对象；不合法时做一次只修格式的修复
+            payload, validation_errors = extract_json(result.stdout, OUTPUT_VALIDATORS[args.check_type])
+            if validation_errors and not args.no_repair and result.stdout.strip():
+                print(f"INFO: Repairing codex output in {shard_dir}", file=sys.stderr)
+                fixed, repair_errors, repair_raw = repair_output(
+                    result.stdout, validation_errors, args, project_root, controller, usage
+                )
+                raw_path.write_text(raw_text + REPAIR_SEPARATOR + repair_raw, encoding="utf-8")
+                if repair_errors:
+                    validation_errors = validation_errors + ["repair pass: " + "; ".join(repair_errors)]
+                else:
+                    payload, validation_errors = fixed, []
+                    outcome["repaired"] = True
+            if validation_errors:
+                outcome.update({"status": "invalid_output", "error": "; ".join(validation_errors)})
+            else:
+                outcome.update({"status": "ok", "payload": payload})
+
+    if outcome["status"] == "ok":
+        write_json(result_path, outcome["payload"])
+    else:
+        write_json(result_path, {"check_type": args.check_type, "error": outcome["error"], "raw_output": str(raw_path)})
+    return outcome
+
+
+def _evidence_path(value: Any) -> str:
+    # 证据路径按相对 project_root 的规范形式比较（"./a.c" 与 "a.c" 相同；不能用 lstrip("./")，会误删 ".hidden/" 等前缀）
+    path = str(value or "")
+    return os.path.normpath(path) if path else ""
+
+
+def _finding_key(kind: str, finding: Any) -> Tuple[Any, ...]:
+    if not isinstance(finding, dict):
+        return (kind, json.dumps(finding, sort_keys=True, ensure_ascii=False))
+    locations = sorted(
+        (_evidence_path(item.get("file")), str(item.get("line", "")))
+        for item in finding.get("evidence") or []
+        if isinstance(item, dict)
+    )
+    anchor: Any = tuple(locations) if locations else finding.get("call_site")
+    return (kind, finding.get(FINDING_KIND_KEYS[kind]), anchor)
+
+
+def _evidence_files(finding: Any) -> List[str]:
+    if not isinstance(finding, dict):
+        return []
+    return [
+        _evidence_path(item.get("file"))
+        for item in finding.get("evidence") or []
+        if isinstance(item, dict) and item.get("file")
+    ]
+
+
+def load_previous_result(path: Path, check_type: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(payload, dict) or "error" in payload or validate_output(payload, check_type):
+        return None
+    if any(isinstance(gap, str) and SHARD_FAILURE_GAP_PATTERN.match(gap) for gap in payload.get("gaps") or []):
+        return None
+    return payload
+
+
+def carry_over_previous(previous: Dict[str, Any], changed: List[str]) -> Tuple[Dict[str, Any], int]:
+    # 保留上次结果中证据全部位于未改动文件的发现；证据涉及改动文件的发现由本次增量结果替代
+    changed_set = {_evidence_path(path) for path in changed}
+    carried = dict(previous)
+    kept = 0
+    for kind in FINDING_KIND_KEYS:
+        findings = [
+            finding
+            for finding in previous.get(kind) or []
+            if not changed_set.intersection(_evidence_files(finding))
+        ]
+        carried[kind] = findings
+        kept += len(findings)
+    if previous.get("summary") == "fail" and not kept:
+        carried["summary"] = "pass"
+    return carried, kept
+
+
+def merge_shard_results(check_type: str, outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # 合并各分片结果：发现按“类别 + 解释器/API + 证据位置”去重，summary 取最严重，confidence 取最低
+    merged: Dict[str, Any] = {
+        "check_type": check_type,
+        "summary": "pass",
+        "explicit_shell_exec": [],
+        "implicit_shell_exec": [],
+        "gaps": [],
+        "confidence": "high",
+    }
+    seen = set()
+    summaries = set()
+    confidence = len(CONFIDENCE_LEVELS) - 1
+    for outcome in outcomes:
+        payload = outcome.get("payload")
+        if payload is None:
+            summaries.add("unknown")
+            merged["gaps"].append(SHARD_FAILURE_GAP.format(id=outcome["id"], error=outcome["error"]))
+            continue
+        summaries.add(payload.get("summary"))
+        level = payload.get("confidence")
+        confidence = min(confidence, CONFIDENCE_LEVELS.index(level) if level in CONFIDENCE_LEVELS else 0)
+        for kind in FINDING_KIND_KEYS:
+            for finding in payload.get(kind) or []:
+                key = _finding_key(kind, finding)
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged[kind].append(finding)
+        for gap in payload.get("gaps") or []:
+            if gap not in merged["gaps"]:
+                merged["gaps"].append(gap)
+
+    if merged["explicit_shell_exec"] or merged["implicit_shell_exec"] or "fail" in summaries:
+        merged["summary"] = "fail"
+    elif summaries - {"pass"}:
+        merged["summary"] = "unknown"
+    merged["confidence"] = CONFIDENCE_LEVELS[confidence]
+    return merged
+
+
 def write_json(path: Path, data: Dict[str, Any]) -> None:
     path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
 
 
 def main() -> int:
+    started = time.monotonic()
     parser = argparse.ArgumentParser(description="Run static code checks with codex exec.")
     parser.add_argument("--project-root", required=True, help="Path to the target project root.")
     parser.add_argument(
@@ -148,11 +604,118 @@ def main() -> int:
         help="Check type to run.",
     )
     parser.add_argument("--codex-cmd", default="codex exec --skip-git-repo-check", help="Codex exec command.")
-    parser.add_argument("--timeout", type=int, default=300, help="Timeout in seconds.")
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=300,
+        help="Maximum per-invocation timeout in seconds; the adaptive timeout never exceeds it (default: 300).",
+    )
+    parser.add_argument(
+        "--min-timeout",
+        type=int,
+        default=60,
+        help="Lower bound for the timeout derived from observed codex latency (default: 60).",
+    )
     parser.add_argument("--output-dir", default="out", help="Output directory.")
     parser.add_argument("--prompt-file", default=None, help="Override prompt template path.")
+    parser.add_argument(
+        "--no-source-index",
+        action="store_true",
+        help="Do not precompute the project symbol index injected into the prompt.",
+    )
+    parser.add_argument(
+        "--shard-depth",
+        type=int,
+        default=0,
+        help="Split pre-scan candidate files into shards by their first N directory levels (default: 0 = one run).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Maximum number of concurrent codex shard runs; concurrency adapts below it (default: 1).",
+    )
+    parser.add_argument(
+        "--no-adaptive",
+        action="store_true",
+        help="Keep concurrency at --jobs and the timeout at --timeout instead of adapting to observed latency.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Retries for codex invocations that time out or exit non-zero (default: 2).",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=5.0,
+        help="Initial retry backoff in seconds, doubled per attempt with jitter (default: 5).",
+    )
+    parser.add_argument(
+        "--hint-token-budget",
+        type=int,
+        default=DEFAULT_HINT_TOKEN_BUDGET,
+        help=f"Approximate token budget for ranked pre-scan hints per prompt (default: {DEFAULT_HINT_TOKEN_BUDGET}).",
+    )
+    parser.add_argument(
+        "--pre-scan",
+        choices=["auto", "rg", "builtin"],
+        default="auto",
+        help="Candidate pre-scanner: rg, the built-in parallel scanner, or rg with built-in fallback (default: auto).",
+    )
+    parser.add_argument(
+        "--no-repair",
+        action="store_true",
+        help="Do not send invalid codex output back for one format-only repair pass.",
+    )
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        help=(
+            "Stop starting new shards once tokens=N estimated tokens or seconds=N of total codex time are used "
+            "(repeatable); shards not run are reported as failed."
+        ),
+    )
+    parser.add_argument(
+        "--since",
+        default=None,
+        help="Only check files changed since this git revision and merge with the previous result.",
+    )
+    parser.add_argument(
+        "--previous-result",
+        default=None,
+        help="Previous result.json to merge into with --since (default: the existing result in --output-dir).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every codex call.",
+    )
     args = parser.parse_args()
 
+    if args.shard_depth < 0:
+        print("ERROR: --shard-depth must be >= 0", file=sys.stderr)
+        return 2
+    if args.jobs < 1:
+        print("ERROR: --jobs must be >= 1", file=sys.stderr)
+        return 2
+    if args.hint_token_budget < 1:
+        print("ERROR: --hint-token-budget must be >= 1", file=sys.stderr)
+        return 2
+    if args.timeout < 1 or args.min_timeout < 1:
+        print("ERROR: --timeout and --min-timeout must be >= 1", file=sys.stderr)
+        return 2
+    if args.retries < 0 or args.retry_backoff < 0:
+        print("ERROR: --retries and --retry-backoff must be >= 0", file=sys.stderr)
+        return 2
+    try:
+        budget = parse_budget(args.budget)
+    except ValueError as exc:
+        print(f"ERROR: Invalid --budget: {exc}", file=sys.stderr)
+        return 2
+
     project_root = Path(args.project_root)
     if not project_root.exists():
         print(f"ERROR: Project root not found: {project_root}", file=sys.stderr)
@@ -171,38 +734,51 @@ def main() -> int:
     result_path = output_dir / "result.json"
     meta_path = output_dir / "meta.json"
 
+    if args.trace_file:
+        TRACE.start("command_injection_check")
     template = load_prompt_template(prompt_file)
-    prompt_vars = dict(CHECK_TYPE_CONFIG[args.check_type].get("prompt_vars", {}))
-    prompt_vars["PRE_SCAN_HINTS"] = build_pre_scan_hints(project_root)
-    prompt = template.safe_substitute(prompt_vars)
-    result = run_codex(args.codex_cmd, prompt, project_root, args.timeout)
-    raw_path.write_text(result.stdout + result.stderr, encoding="utf-8")
+    base_vars = dict(CHECK_TYPE_CONFIG[args.check_type].get("prompt_vars", {}))
 
-    if result.returncode != 0:
-        error_msg = f"codex exec failed with code {result.returncode}"
-        print(f"ERROR: {error_msg}", file=sys.stderr)
-        write_json(result_path, {"check_type": args.check_type, "error": error_msg, "raw_output": str(raw_path)})
-        write_json(
-            meta_path,
-            {
-                "check_type": args.check_type,
-                "project_root": str(project_root),
-                "prompt_file": str(prompt_file),
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-                "status": "error",
-            },
-        )
-        return 1
+    # 增量模式：只扫描自 --since 以来改动的文件，未改动文件沿用上次结果；无可用的上次结果时退回全量检查
+    previous: Optional[Dict[str, Any]] = None
+    changed: Optional[List[str]] = None
+    scan_paths: Optional[List[str]] = None
+    if args.since:
+        try:
+            changed = git_changed_files(project_root, args.since)
+        except (OSError, ValueError) as exc:
+            print(f"ERROR: git diff against {args.since} failed: {exc}", file=sys.stderr)
+            return 2
+        previous_path = Path(args.previous_result) if args.previous_result else result_path
+        previous = load_previous_result(previous_path, args.check_type)
+        if previous is None:
+            print(f"INFO: No usable previous result at {previous_path}; running a full check", file=sys.stderr)
+            changed = None
+        else:
+            scan_paths = [path for path in changed if not glob_excluded(path, RG_EXCLUDE_GLOBS) and (project_root / path).is_file()]
+            print(
+                f"INFO: {len(changed)} files changed since {args.since}, {len(scan_paths)} to check",
+                file=sys.stderr,
+            )
 
-    try:
-        payload = parse_json_output(result.stdout)
-        validation_errors = validate_output(payload, args.check_type)
-        if validation_errors:
-            raise ValueError("; ".join(validation_errors))
-    except ValueError as exc:
-        error_msg = str(exc)
-        print(f"ERROR: {error_msg}", file=sys.stderr)
-        write_json(result_path, {"check_type": args.check_type, "error": error_msg, "raw_output": str(raw_path)})
+    def incremental_meta(carried_findings: int) -> Dict[str, Any]:
+        return {
+            "since": args.since,
+            "previous_result": str(Path(args.previous_result) if args.previous_result else result_path),
+            "changed_files": len(changed or []),
+            "checked_files": len(scan_paths or []),
+            "carried_findings": carried_findings,
+        }
+
+    carried: Optional[Dict[str, Any]] = None
+    carried_findings = 0
+    if previous is not None and changed is not None:
+        carried, carried_findings = carry_over_previous(previous, changed)
+
+    if carried is not None and not scan_paths:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
+        write_json(result_path, merge_shard_results(args.check_type, [{"id": "previous", "payload": carried}]))
         write_json(
             meta_path,
             {
@@ -210,26 +786,155 @@ def main() -> int:
                 "project_root": str(project_root),
                 "prompt_file": str(prompt_file),
                 "generated_at": datetime.now(timezone.utc).isoformat(),
-                "status": "invalid_output",
+                "status": "ok",
+                "result": str(result_path),
+                "incremental": incremental_meta(carried_findings),
+                "shards": [],
             },
         )
-        return 1
+        print(f"INFO: No changed source files; previous result carried over to {result_path}")
+        return 0
 
-    write_json(result_path, payload)
-    write_json(
-        meta_path,
-        {
+    with span("pre_scan", "phase"):
+        hits, pre_scan_message = run_pre_scan(project_root, scan_paths, args.pre_scan)
+    # 分片与修复调用共用一个控制器：统一的并发上限、延迟统计与重试
+    controller = CodexController(
+        max_concurrency=args.jobs,
+        max_timeout=args.timeout,
+        min_timeout=args.min_timeout,
+        retries=args.retries,
+        backoff=args.retry_backoff,
+        adaptive=not args.no_adaptive,
+        budget=budget,
+    )
+    source_index = None
+    if not args.no_source_index:
+        with span("source_index", "phase"):
+            source_index = build_source_index(project_root, [Path(args.output_dir)])
+
+    def exec_call_sites(paths: Optional[List[str]]) -> str:
+        if source_index is None:
+            return "Source index disabled."
+        return exec_call_site_context(source_index, RG_CANDIDATE_PATTERNS, MAX_EXEC_CALL_SITE_LINES, paths)
+
+    # 分片覆盖全部待检查文件，预扫描命中按文件附到所在分片；没有可分片的源码文件时退回单次检查
+    # 增量模式始终按分片执行，保证每个改动文件都被重新检查（上次结果中涉及改动文件的发现已被丢弃）
+    shards = build_shards(shard_files(project_root, scan_paths), hits, args.shard_depth) if args.shard_depth else []
+    if args.shard_depth and not shards:
+        print("INFO: No source files to shard; running a single check", file=sys.stderr)
+    if not shards and carried is not None:
+        shards = [
+            dict(shard, id=shard["id"].replace(".", "changed", 1))
+            for shard in build_shards(scan_paths or [], hits, 0)
+        ]
+
+    if not shards:
+        prompt_vars = dict(base_vars)
+        prompt_vars["PRE_SCAN_HINTS"] = pre_scan_message or format_pre_scan_hits(hits, project_root, args.hint_token_budget)
+        prompt_vars["EXEC_CALL_SITES"] = exec_call_sites(None)
+        prompt_vars["SHARD_SCOPE"] = WHOLE_PROJECT_SCOPE
+        outcome = check_shard(template.safe_substitute(prompt_vars), args, project_root, output_dir, controller)
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
+        meta: Dict[str, Any] = {
             "check_type": args.check_type,
             "project_root": str(project_root),
             "prompt_file": str(prompt_file),
             "generated_at": datetime.now(timezone.utc).isoformat(),
-            "status": "ok",
-            "result": str(result_path),
-            "raw_output": str(raw_path),
-        },
+            "status": outcome["status"],
+            "usage": outcome["usage"],
+            "codex": controller.stats(),
+            "throughput": throughput(controller.usage, time.monotonic() - started, 1),
+        }
+        if outcome["status"] != "ok":
+            print(f"ERROR: {outcome['error']}", file=sys.stderr)
+            write_json(meta_path, meta)
+            return 1
+        meta.update({"result": str(result_path), "raw_output": str(raw_path)})
+        if outcome.get("repaired"):
+            meta["repaired"] = True
+        write_json(meta_path, meta)
+        print(f"INFO: Result written to {result_path}")
+        return 0
+
+    shard_file_count = len({path for shard in shards for path in shard["files"]})
+    print(
+        f"INFO: Checking {shard_file_count} files ({len(hits)} candidate lines) in {len(shards)} shards",
+        file=sys.stderr,
+    )
+    shards_dir = output_dir / "shards"
+
+    def run_shard(position: int) -> Dict[str, Any]:
+        shard = shards[position]
+        exhausted = controller.budget_exhausted()
+        if exhausted:
+            # 预算用尽：不再启动新的分片，按失败分片合并（gaps 记为未检查）
+            print(f"WARNING: shard {shard['id']} not run: {exhausted}", file=sys.stderr)
+            return {
+                "id": shard["id"],
+                "files": shard["files"],
+                "candidates": len(shard["hits"]),
+                "status": "skipped",
+                "error": exhausted,
+            }
+        prompt_vars = dict(base_vars)
+        prompt_vars["PRE_SCAN_HINTS"] = pre_scan_message or format_pre_scan_hits(
+            shard["hits"], project_root, args.hint_token_budget
+        )
+        prompt_vars["EXEC_CALL_SITES"] = exec_call_sites(shard["files"])
+        prompt_vars["SHARD_SCOPE"] = shard_scope_text(shard, len(shards), args.since if carried is not None else None)
+        shard_dir = shards_dir / shard_dir_name(position + 1, shard["id"])
+        outcome = check_shard(template.safe_substitute(prompt_vars), args, project_root, shard_dir, controller)
+        outcome.update({"id": shard["id"], "files": shard["files"], "candidates": len(shard["hits"])})
+        if outcome["status"] != "ok":
+            print(f"ERROR: shard {shard['id']}: {outcome['error']}", file=sys.stderr)
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        outcomes = list(executor.map(run_shard, range(len(shards))))
+    if args.trace_file:
+        TRACE.finish(args.trace_file)
+
+    failed = [outcome for outcome in outcomes if outcome["status"] != "ok"]
+    skipped = [outcome for outcome in outcomes if outcome["status"] == "skipped"]
+    status = "error" if len(failed) == len(outcomes) else "partial" if failed else "ok"
+    if status == "error" and carried is None:
+        write_json(result_path, {"check_type": args.check_type, "error": f"all {len(outcomes)} shards failed"})
+    else:
+        # 增量检查时即使全部分片失败也保留沿用的发现；失败分片的 gaps 使该结果不会被当作下次的上次结果
+        previous_outcomes = [{"id": "previous", "payload": carried}] if carried is not None else []
+        write_json(result_path, merge_shard_results(args.check_type, previous_outcomes + outcomes))
+
+    meta = {
+        "check_type": args.check_type,
+        "project_root": str(project_root),
+        "prompt_file": str(prompt_file),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "status": status,
+        "result": str(result_path),
+        "shard_depth": args.shard_depth,
+        "codex": controller.stats(),
+        "throughput": throughput(controller.usage, time.monotonic() - started, len(outcomes) - len(skipped)),
+        "shards": [
+            {
+                key: outcome[key]
+                for key in ("id", "files", "candidates", "status", "error", "repaired", "usage", "result", "raw_output")
+                if key in outcome
+            }
+            for outcome in outcomes
+        ],
+    }
+    if carried is not None:
+        meta["incremental"] = incremental_meta(carried_findings)
+    write_json(meta_path, meta)
+    print(
+        "INFO: Throughput: {checked} shards in {wall_seconds}s, ~{tokens} tokens ({tokens_per_minute}/min)".format(
+            **meta["throughput"]
+        ),
+        file=sys.stderr,
     )
     print(f"INFO: Result written to {result_path}")
-    return 0
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
@@ -1,18 +1,44 @@
 #!/usr/bin/env python3
 import argparse
 import hashlib
+import heapq
+import itertools
 import json
+import os
 import shlex
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
 from string import Template
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
 
+from _authz_prefilter import VERDICT_EVIDENT, VERDICTS, classify_method
+from _codex_control import CodexController, parse_budget, throughput
+from _json_extract import compile_schema, extract_json, render_repair_prompt
+from _risk_priority import DEFAULT_DBUS_SERVICES_DIR, RiskContext, load_risk_context, score_method
+from _source_index import SourceIndex, build_source_index, dbus_interface_context, dbus_method_context
+from _trace import TRACE, span
 
-REQUIRED_TOP_KEYS = {"input", "summary", "access_control", "confidence"}
-REQUIRED_INPUT_KEYS = {"path", "interface", "method"}
+
+OUTPUT_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["input", "summary", "access_control", "confidence"],
+    "properties": {
+        "input": {
+            "type": "object",
+            "required": ["path", "interface", "method"],
+            "properties": {"path": {"type": "string"}, "interface": {"type": "string"}, "method": {"type": "string"}},
+        },
+    },
+}
+BATCH_OUTPUT_SCHEMA: Dict[str, Any] = {"type": "array", "items": OUTPUT_SCHEMA}
+OUTPUT_VALIDATOR = compile_schema(OUTPUT_SCHEMA)
+BATCH_OUTPUT_VALIDATOR = compile_schema(BATCH_OUTPUT_SCHEMA)
+REPAIR_SEPARATOR = "\n===== json repair pass =====\n"
 
 
 def load_prompt_template(path: Path) -> Template:
@@ -33,29 +59,95 @@ def normalize_entry(entry: Dict[str, Any], index: int) -> Dict[str, str]:
     return {"path": path, "interface": interface, "method": method}
 
 
-def load_methods_file(path: Path) -> List[Dict[str, str]]:
-    text = path.read_text(encoding="utf-8")
-    if not text.strip():
-        raise ValueError("Methods file is empty")
-    stripped = text.lstrip()
-    entries: List[Dict[str, Any]]
-    # 同时支持 JSON 数组与 JSONL
-    if stripped.startswith("["):
-        data = json.loads(text)
-        if not isinstance(data, list):
-            raise ValueError("Methods file JSON must be an array")
-        entries = data
-    else:
-        entries = []
-        for line_no, line in enumerate(text.splitlines(), start=1):
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
+STREAM_METHODS_FILE = "-"
+
+
+def parse_stream_line(line: str, line_no: int) -> List[Dict[str, str]]:
+    # JSONL 方法清单（文件或 stdin）的一行：单个方法对象、方法数组，或 check_dbus_system_conf.py --jsonl --only-method
+    # 输出的 {"type": "triplets"} 记录；其他类型的记录（如 summary）忽略
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON on line {line_no}: {exc}") from exc
+    if isinstance(data, dict) and "type" in data:
+        if data["type"] != "triplets":
+            return []
+        data = data.get("triplets")
+    items = data if isinstance(data, list) else [data]
+    return [normalize_entry(item, line_no) for item in items]
+
+
+METHODS_READ_CHUNK = 1 << 16
+MAX_PENDING_ELEMENT_CHARS = 1 << 20
+
+
+def _iter_array_elements(stream: TextIO, head: str, line_base: int) -> Iterator[Tuple[int, List[Dict[str, str]], Optional[str]]]:
+    # JSON 数组按元素增量解析：每次最多读取 METHODS_READ_CHUNK 字符，解析出的元素即刻产出，读取新内容前丢弃已消费文本；
+    # 元素无法解析时（文本已读完或积压过长）记录错误并跳到下一个 `{` 继续
+    decoder = json.JSONDecoder()
+    buffer = head
+    pos = buffer.index("[") + 1
+    line_no = line_base + 1  # buffer[pos] 所在行号
+    counted = 0
+    element = 0
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        line_no += buffer.count("\n", counted, pos)
+        counted = pos
+        if pos < len(buffer):
             try:
-                entries.append(json.loads(line))
+                item, end = decoder.raw_decode(buffer, pos)
             except json.JSONDecodeError as exc:
-                raise ValueError(f"Invalid JSON on line {line_no}: {exc}") from exc
-    return [normalize_entry(entry, idx) for idx, entry in enumerate(entries, start=1)]
+                if eof or len(buffer) - pos > MAX_PENDING_ELEMENT_CHARS:
+                    element += 1
+                    yield line_no, [], f"Invalid JSON in array element {element}: {exc.msg}"
+                    pos = buffer.find("{", pos + 1)
+                    if pos == -1:
+                        return
+                    continue
+            else:
+                element += 1
+                try:
+                    yield line_no, [normalize_entry(item, element)], None
+                except ValueError as exc:
+                    yield line_no, [], str(exc)
+                pos = end
+                continue
+        if eof:
+            if buffer[pos:].strip():
+                yield line_no, [], "Unterminated JSON array"
+            return
+        chunk = stream.readline(METHODS_READ_CHUNK)
+        eof = not chunk
+        buffer, pos, counted = buffer[pos:] + chunk, 0, 0
+
+
+def iter_method_records(stream: TextIO) -> Iterator[Tuple[int, List[Dict[str, str]], Optional[str]]]:
+    # 流式读取方法清单（文件或 stdin），产出 (行号, 方法列表, 错误信息)；单条记录出错不中断读取
+    # 首个非空行以 `[` 开头时按 JSON 数组逐元素解析，否则按 JSONL 逐行解析（见 parse_stream_line）
+    line_no = 0
+    for line in iter(stream.readline, ""):
+        line_no += 1
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+        if text.startswith("["):
+            yield from _iter_array_elements(stream, line, line_no - 1)
+            return
+        try:
+            yield line_no, parse_stream_line(text, line_no), None
+        except ValueError as exc:
+            yield line_no, [], str(exc)
+
+
+def triplet_key(entry: Dict[str, str]) -> int:
+    # 去重用的 64 位摘要：百万级方法清单的去重集合只保存整数，而不是完整的三元组字符串
+    base = f"{entry['path']}\0{entry['interface']}\0{entry['method']}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(base, digest_size=8).digest(), "big")
 
 
 def build_method_id(entry: Dict[str, str]) -> str:
@@ -66,53 +158,617 @@ def build_method_id(entry: Dict[str, str]) -> str:
     return f"{safe[:40]}_{digest}"
 
 
-def run_codex(cmd: str, prompt: str, cwd: Path, timeout: int) -> subprocess.CompletedProcess:
+def run_codex(cmd: str, prompt: str, cwd: Path, timeout: float) -> subprocess.CompletedProcess:
     args = shlex.split(cmd)
-    return subprocess.run(
-        args,
-        input=prompt,
-        text=True,
-        capture_output=True,
-        cwd=str(cwd),
-        timeout=timeout,
-        check=False,
+    with span(os.path.basename(args[0]), "command", {"timeout": timeout, "prompt_chars": len(prompt)}) as trace_args:
+        result = subprocess.run(
+            args,
+            input=prompt,
+            text=True,
+            capture_output=True,
+            cwd=str(cwd),
+            timeout=timeout,
+            check=False,
+        )
+        trace_args["exit_code"] = result.returncode
+    return result
+
+
+def validate_output(payload: Dict[str, Any]) -> List[str]:
+    return OUTPUT_VALIDATOR(payload)
+
+
+class RateLimiter:
+    # 限制 codex 启动速率（次/秒），多个 worker 共享；0 表示不限速
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# 项目源码树指纹需跳过的目录（版本库元数据与缓存），输出目录另行排除
+FINGERPRINT_SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__"}
+
+
+def fingerprint_project(project_root: Path, exclude_dirs: List[Path]) -> str:
+    # 按相对路径排序后对文件内容逐个求 sha256，源码任一改动都会改变指纹
+    root = project_root.resolve()
+    excluded = {path.resolve() for path in exclude_dirs}
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        current = Path(dirpath)
+        dirnames[:] = sorted(
+            name for name in dirnames if name not in FINGERPRINT_SKIP_DIRS and (current / name).resolve() not in excluded
+        )
+        for name in sorted(filenames):
+            file_path = current / name
+            if not file_path.is_file():
+                continue
+            try:
+                content_hash = hashlib.sha256(file_path.read_bytes()).hexdigest()
+            except OSError:
+                continue
+            digest.update(f"{file_path.relative_to(root).as_posix()}\0{content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # 内容寻址缓存：method id + 渲染后提示词哈希 + 项目源码树指纹（+ codex 命令）共同决定 key
+    def __init__(self, cache_dir: Path, project_fingerprint: str, codex_cmd: str, force: bool) -> None:
+        self.cache_dir = cache_dir
+        self.project_fingerprint = project_fingerprint
+        self.codex_cmd = codex_cmd
+        self.force = force
+
+    def key(self, method_id: str, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        base = "\0".join([method_id, prompt_hash, self.project_fingerprint, self.codex_cmd])
+        return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.force:
+            return None
+        path = self.cache_dir / f"{key}.json"
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or not isinstance(entry.get("payload"), dict):
+            return None
+        if validate_output(entry["payload"]):
+            return None
+        return entry
+
+    def store(self, key: str, method_id: str, payload: Dict[str, Any], raw_text: str) -> None:
+        write_json(self.cache_dir / f"{key}.json", {"id": method_id, "payload": payload, "raw": raw_text})
+
+    def load_context(self, key: str) -> Optional[str]:
+        if self.force:
+            return None
+        try:
+            entry = json.loads((self.cache_dir / f"{key}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        context = entry.get("context") if isinstance(entry, dict) else None
+        return context if isinstance(context, str) and context.strip() else None
+
+    def store_context(self, key: str, context_id: str, context: str) -> None:
+        write_json(self.cache_dir / f"{key}.json", {"id": context_id, "context": context})
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    # 先写入 worker 独占的临时文件再原子替换，避免并发写同一结果文件时出现半截内容
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def write_json(path: Path, data: Dict[str, Any]) -> None:
+    write_text_atomic(path, json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+
+
+BATCH_PROMPT_SUFFIX = Template(
+    """
+
+## Batch mode
+This request covers several DBus methods. Ignore the single-method input above and apply every task to each method below (one JSON object per line: path/interface/method):
+
+${dbus_methods}
+
+Return **only** a JSON array containing exactly one object per listed method, in the same order. Each object must follow the output structure above, and its `input` must echo that method's path/interface/method.
+"""
+)
+
+BATCH_INPUT_PLACEHOLDER = "(batch, see the method list below)"
+
+SOURCE_INDEX_VARS = ("dbus_handler_slices", "dbus_handler_call_sites", "dbus_interface_refs")
+SOURCE_INDEX_DISABLED = "(source index disabled)"
+
+
+def source_index_vars(source_index: Optional[SourceIndex], entries: List[Dict[str, str]]) -> Dict[str, str]:
+    if source_index is None:
+        return {name: SOURCE_INDEX_DISABLED for name in SOURCE_INDEX_VARS}
+    if len(entries) == 1:
+        entry = entries[0]
+        return dbus_method_context(source_index, entry["path"], entry["interface"], entry["method"])
+    # 批量时按方法合并，重复片段（同一处理函数/引用）只保留一次
+    merged: Dict[str, List[str]] = {name: [] for name in SOURCE_INDEX_VARS}
+    for entry in entries:
+        context = dbus_method_context(source_index, entry["path"], entry["interface"], entry["method"])
+        for name in SOURCE_INDEX_VARS:
+            if context[name] not in merged[name]:
+                merged[name].append(context[name])
+    return {name: "\n\n".join(values) for name, values in merged.items()}
+
+
+# ${service_context} 渲染为整个小节；未开启或摘要不可用时为空，避免向模型声称“已有前一轮探索”
+SERVICE_CONTEXT_SECTION = Template(
+    "## Service context\n"
+    "A previous pass explored this service once and summarised what its methods share "
+    "(build layout, D-Bus export code, authorization helpers, policy files). "
+    "Use it to skip re-discovering these, but still confirm every method-specific claim in the source.\n\n"
+    "${summary}\n"
+)
+
+
+def render_prompt(
+    template: Template,
+    entry: Dict[str, str],
+    source_index: Optional[SourceIndex],
+    service_context: str = "",
+) -> str:
+    return template.safe_substitute(
+        source_index_vars(source_index, [entry]),
+        service_context=service_context,
+        dbus_path=entry["path"],
+        dbus_interface=entry["interface"],
+        dbus_method=entry["method"],
     )
 
 
-def parse_json_output(output: str) -> Dict[str, Any]:
-    output = output.strip()
-    if not output:
-        raise ValueError("Empty codex output")
+def render_batch_prompt(
+    template: Template,
+    entries: List[Dict[str, str]],
+    source_index: Optional[SourceIndex],
+    service_context: str = "",
+) -> str:
+    base = template.safe_substitute(
+        source_index_vars(source_index, entries),
+        service_context=service_context,
+        dbus_path=BATCH_INPUT_PLACEHOLDER,
+        dbus_interface=BATCH_INPUT_PLACEHOLDER,
+        dbus_method=BATCH_INPUT_PLACEHOLDER,
+    )
+    method_lines = "\n".join(json.dumps(entry, ensure_ascii=False) for entry in entries)
+    return base + BATCH_PROMPT_SUFFIX.safe_substitute(dbus_methods=method_lines)
+
+
+def build_batch_id(entries: List[Dict[str, str]]) -> str:
+    base = "\n".join(build_method_id(entry) for entry in entries)
+    digest = hashlib.sha256(base.encode("utf-8")).hexdigest()[:8]
+    interfaces = {entry["interface"] for entry in entries}
+    slug = interfaces.pop() if len(interfaces) == 1 else "mixed"
+    safe = "".join(ch if ch.isalnum() else "_" for ch in slug)
+    return f"batch_{safe[:40]}_{digest}"
+
+
+class MethodBatcher:
+    # 流式组批：batch_by=interface 时同一 interface 的方法才会合并（保持首次出现顺序），满 batch_size 即产出；
+    # batch_size=0 表示每组不限数量，直到 flush 才产出
+    def __init__(self, batch_size: int, batch_by: str) -> None:
+        self.batch_size = batch_size
+        self.batch_by = batch_by
+        self.groups: Dict[str, List[Dict[str, str]]] = {}
+
+    def add(self, entry: Dict[str, str]) -> List[List[Dict[str, str]]]:
+        key = entry["interface"] if self.batch_by == "interface" else ""
+        group = self.groups.setdefault(key, [])
+        group.append(entry)
+        if self.batch_size > 0 and len(group) >= self.batch_size:
+            del self.groups[key]
+            return [group]
+        return []
+
+    def flush(self) -> List[List[Dict[str, str]]]:
+        batches = list(self.groups.values())
+        self.groups = {}
+        return batches
+
+
+def split_batch_output(data: Any, entries: List[Dict[str, str]]) -> Dict[str, Any]:
+    # 返回 method id -> payload（dict）或错误信息（str）；部分元素不合法时其余元素照常采用
+    if not isinstance(data, list):
+        raise ValueError("Codex batch output must be a JSON array")
+
+    by_input: Dict[tuple, Dict[str, Any]] = {}
+    invalid: List[str] = []
+    for index, item in enumerate(data, start=1):
+        validation_errors = validate_output(item)
+        if validation_errors:
+            invalid.append(f"element {index}: " + "; ".join(validation_errors))
+            continue
+        input_obj = item["input"]
+        by_input[(input_obj.get("path"), input_obj.get("interface"), input_obj.get("method"))] = item
+
+    results: Dict[str, Any] = {}
+    for entry in entries:
+        payload = by_input.get((entry["path"], entry["interface"], entry["method"]))
+        if payload is not None:
+            results[build_method_id(entry)] = payload
+            continue
+        message = "Method missing from codex batch output"
+        if invalid:
+            message += " (invalid elements: " + " | ".join(invalid) + ")"
+        results[build_method_id(entry)] = message
+    return results
+
+
+def repair_output(
+    output: str,
+    errors: List[str],
+    schema: Dict[str, Any],
+    validator: Callable[[Any], List[str]],
+    args: argparse.Namespace,
+    project_root: Path,
+    controller: CodexController,
+    usage: Optional[Dict[str, Any]] = None,
+) -> Tuple[Any, List[str], str]:
+    # 一次低成本修复：把原始输出与校验错误交给 codex 只修正格式，不重新分析源码；返回 (值, 校验错误, 修复输出原文)
+    prompt = render_repair_prompt(output, errors, schema)
     try:
-        return json.loads(output)
-    except json.JSONDecodeError as exc:
-        raise ValueError(f"Codex output is not valid JSON: {exc}") from exc
+        result = controller.run(
+            lambda timeout: run_codex(args.codex_cmd, prompt, project_root, timeout), prompt, usage, kind="repair"
+        )
+    except subprocess.TimeoutExpired as exc:
+        return None, [f"repair timed out after {exc.timeout:g}s"], _timeout_output(exc)
+    raw_text = result.stdout + result.stderr
+    if result.returncode != 0:
+        return None, [f"repair failed with code {result.returncode}"], raw_text
+    value, repair_errors = extract_json(result.stdout, validator)
+    return value, repair_errors, raw_text
 
 
-def validate_output(payload: Dict[str, Any]) -> List[str]:
-    errors: List[str] = []
-    if not isinstance(payload, dict):
-        return ["Output must be a JSON object"]
-    missing = REQUIRED_TOP_KEYS - set(payload.keys())
-    if missing:
-        errors.append(f"Missing top-level keys: {sorted(missing)}")
-    input_obj = payload.get("input")
-    if not isinstance(input_obj, dict):
-        errors.append("Input must be an object")
-    else:
-        missing_input = REQUIRED_INPUT_KEYS - set(input_obj.keys())
-        if missing_input:
-            errors.append(f"Missing input keys: {sorted(missing_input)}")
-    return errors
+MAX_SERVICE_CONTEXT_CHARS = 8000
 
 
-def write_json(path: Path, data: Dict[str, Any]) -> None:
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+class ServiceContextStore:
+    # 服务级上下文复用：每个 interface 首次检查前单独调用一次 codex，探索构建布局、D-Bus 导出代码与授权辅助函数并生成摘要，
+    # 之后该 interface 的方法提示词注入此摘要；并发 worker 按 interface 加锁，保证每个 interface 只构建一次；
+    # 摘要写入 <output-dir>/contexts/，启用缓存时按 interface + 上下文提示词 + 项目指纹跨运行复用；
+    # 超时/非 0 退出由控制器按 --retries 重试，最终失败时方法照常检查
+    def __init__(
+        self,
+        template: Template,
+        args: argparse.Namespace,
+        project_root: Path,
+        context_dir: Path,
+        controller: CodexController,
+        cache: Optional[ResultCache],
+        source_index: Optional[SourceIndex],
+    ) -> None:
+        self.template = template
+        self.args = args
+        self.project_root = project_root
+        self.context_dir = context_dir
+        self.controller = controller
+        self.cache = cache
+        self.source_index = source_index
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._texts: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def render(self, entries: List[Dict[str, str]]) -> str:
+        # 返回完整的 "## Service context" 小节；没有任何可用摘要时返回空串，提示词中不出现该小节
+        interfaces = list(dict.fromkeys(entry["interface"] for entry in entries))
+        summaries = [(interface, self.get(interface)) for interface in interfaces]
+        summaries = [(interface, text) for interface, text in summaries if text]
+        if not summaries:
+            return ""
+        if len(interfaces) == 1:
+            summary = summaries[0][1]
+        else:
+            summary = "\n\n".join(f"### {interface}\n{text}" for interface, text in summaries)
+        return SERVICE_CONTEXT_SECTION.substitute(summary=summary)
+
+    def get(self, interface: str) -> str:
+        with self._lock:
+            lock = self._locks.setdefault(interface, threading.Lock())
+        with lock:
+            if interface not in self._texts:
+                self._texts[interface] = self._build(interface)
+            return self._texts[interface]
+
+    def _build(self, interface: str) -> str:
+        safe = "".join(ch if ch.isalnum() else "_" for ch in interface)[:60]
+        context_id = f"context_{safe}"
+        output_path = self.context_dir / f"{safe}.md"
+        raw_path = self.context_dir / f"{safe}.raw.txt"
+        hints = (
+            dbus_interface_context(self.source_index, interface)
+            if self.source_index is not None
+            else {"dbus_interface_refs": SOURCE_INDEX_DISABLED}
+        )
+        prompt = self.template.safe_substitute(hints, dbus_interface=interface)
+        record: Dict[str, Any] = {"interface": interface, "output": str(output_path)}
+        self.records[interface] = record
+
+        cache_key = self.cache.key(context_id, prompt) if self.cache is not None else ""
+        context = self.cache.load_context(cache_key) if self.cache is not None else None
+        if context is not None:
+            print(f"INFO: Cache hit for service context of {interface}", flush=True)
+            record["status"] = "cached"
+            write_text_atomic(output_path, context)
+            return context
+
+        print(f"INFO: Building service context for {interface}", flush=True)
+        record["raw_output"] = str(raw_path)
+        record["usage"] = {}
+        try:
+            with span(interface, "service_context"):
+                result = self.controller.run(
+                    lambda timeout: run_codex(self.args.codex_cmd, prompt, self.project_root, timeout),
+                    prompt,
+                    record["usage"],
+                    kind="context",
+                )
+        except subprocess.TimeoutExpired as exc:
+            write_text_atomic(raw_path, _timeout_output(exc))
+            error = f"codex exec timed out after {exc.timeout:g}s"
+        else:
+            write_text_atomic(raw_path, result.stdout + result.stderr)
+            context = result.stdout.strip()
+            if result.returncode != 0:
+                error = f"codex exec failed with code {result.returncode}"
+            elif not context:
+                error = "Empty codex output"
+            else:
+                error = ""
+        if error:
+            print(f"ERROR: Service context for {interface}: {error}", file=sys.stderr)
+            record.update({"status": "error", "error": error})
+            return ""
+
+        if len(context) > MAX_SERVICE_CONTEXT_CHARS:
+            context = context[:MAX_SERVICE_CONTEXT_CHARS] + "\n... (truncated)"
+        record["status"] = "ok"
+        write_text_atomic(output_path, context)
+        if self.cache is not None:
+            self.cache.store_context(cache_key, context_id, context)
+        return context
+
+
+def check_batch(
+    entries: List[Dict[str, str]],
+    template: Template,
+    args: argparse.Namespace,
+    project_root: Path,
+    per_method_dir: Path,
+    raw_dir: Path,
+    controller: CodexController,
+    cache: Optional[ResultCache],
+    source_index: Optional[SourceIndex],
+    contexts: Optional[ServiceContextStore] = None,
+) -> List[Dict[str, Any]]:
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    pending: List[Dict[str, str]] = []
+    cache_keys: Dict[str, str] = {}
+
+    for entry in entries:
+        method_id = build_method_id(entry)
+        if cache is None:
+            pending.append(entry)
+            continue
+        # 缓存 key 始终基于单方法提示词（不含服务上下文摘要），批量与否、批次组成变化都不影响命中，命中时也无需构建上下文
+        cache_keys[method_id] = cache.key(method_id, render_prompt(template, entry, source_index))
+        cached = cache.load(cache_keys[method_id])
+        if cached is None:
+            pending.append(entry)
+            continue
+        print(f"INFO: Cache hit for {entry['interface']}.{entry['method']} ({method_id})", flush=True)
+        raw_path = raw_dir / f"{method_id}.txt"
+        write_text_atomic(raw_path, str(cached.get("raw") or ""))
+        outcomes[method_id] = _payload_outcome(
+            method_id, entry, cached["payload"], per_method_dir / f"{method_id}.json", raw_path, cached=True
+        )
+
+    if pending:
+        service_context = contexts.render(pending) if contexts is not None else ""
+        if len(pending) == 1:
+            run_id = build_method_id(pending[0])
+            prompt = render_prompt(template, pending[0], source_index, service_context)
+            label = f"{pending[0]['interface']}.{pending[0]['method']}"
+        else:
+            run_id = build_batch_id(pending)
+            prompt = render_batch_prompt(template, pending, source_index, service_context)
+            label = f"{len(pending)} methods"
+        raw_path = raw_dir / f"{run_id}.txt"
+
+        print(f"INFO: Running codex for {label} ({run_id})", flush=True)
+        payloads: Dict[str, Any] = {}
+        repaired = False
+        # 本次调用（含重试与修复）的用量；批量时同批方法记录同一份整批用量
+        usage: Dict[str, Any] = {"methods": len(pending)}
+        try:
+            with span(label, "check", {"id": run_id, "methods": len(pending)}):
+                result = controller.run(lambda timeout: run_codex(args.codex_cmd, prompt, project_root, timeout), prompt, usage)
+        except subprocess.TimeoutExpired as exc:
+            write_text_atomic(raw_path, _timeout_output(exc))
+            payloads = {build_method_id(e): f"codex exec timed out after {exc.timeout:g}s" for e in pending}
+        else:
+            raw_text = result.stdout + result.stderr
+            write_text_atomic(raw_path, raw_text)
+            if result.returncode != 0:
+                payloads = {build_method_id(e): f"codex exec failed with code {result.returncode}" for e in pending}
+            else:
+                # 容错提取最后一个合法的顶层 JSON；不合法时做一次修复，修复仍失败则保留原输出中可用的部分
+                schema = OUTPUT_SCHEMA if len(pending) == 1 else BATCH_OUTPUT_SCHEMA
+                validator = OUTPUT_VALIDATOR if len(pending) == 1 else BATCH_OUTPUT_VALIDATOR
+                data, validation_errors = extract_json(result.stdout, validator)
+                if validation_errors and not args.no_repair and result.stdout.strip():
+                    print(f"INFO: Repairing codex output for {label} ({run_id})", flush=True)
+                    fixed, repair_errors, repair_raw = repair_output(
+                        result.stdout, validation_errors, schema, validator, args, project_root, controller, usage
+                    )
+                    raw_text += REPAIR_SEPARATOR + repair_raw
+                    write_text_atomic(raw_path, raw_text)
+                    if repair_errors:
+                        validation_errors = validation_errors + ["repair pass: " + "; ".join(repair_errors)]
+                    else:
+                        data, validation_errors, repaired = fixed, [], True
+                try:
+                    if len(pending) == 1:
+                        if validation_errors:
+                            raise ValueError("; ".join(validation_errors))
+                        payloads = {run_id: data}
+                    else:
+                        payloads = split_batch_output(data, pending)
+                except ValueError as exc:
+                    message = str(exc)
+                    if validation_errors and len(pending) > 1:
+                        message += " (" + "; ".join(validation_errors) + ")"
+                    payloads = {build_method_id(e): message for e in pending}
+
+        for entry in pending:
+            method_id = build_method_id(entry)
+            output_path = per_method_dir / f"{method_id}.json"
+            payload = payloads[method_id]
+            if isinstance(payload, str):
+                write_json(output_path, {"input": entry, "error": payload, "raw_output": str(raw_path)})
+                outcomes[method_id] = {
+                    "id": method_id,
+                    "input": entry,
+                    "error": payload,
+                    "raw_output": str(raw_path),
+                    "usage": usage,
+                }
+                continue
+            if cache is not None:
+                cached_raw = raw_text if len(pending) == 1 else json.dumps(payload, ensure_ascii=False)
+                cache.store(cache_keys[method_id], method_id, payload, cached_raw)
+            outcomes[method_id] = _payload_outcome(method_id, entry, payload, output_path, raw_path, cached=False)
+            outcomes[method_id]["usage"] = usage
+            if repaired:
+                outcomes[method_id]["repaired"] = True
+
+    return [outcomes[build_method_id(entry)] for entry in entries]
+
+
+def _payload_outcome(
+    method_id: str,
+    entry: Dict[str, str],
+    payload: Dict[str, Any],
+    output_path: Path,
+    raw_path: Path,
+    cached: bool,
+) -> Dict[str, Any]:
+    write_json(output_path, payload)
+    method_summary = payload.get("summary")
+    if method_summary not in {"pass", "fail", "unknown"}:
+        method_summary = "unknown"
+    return {
+        "id": method_id,
+        "input": entry,
+        "summary": method_summary,
+        "output": str(output_path),
+        "raw_output": str(raw_path),
+        "cached": cached,
+    }
+
+
+def _timeout_output(exc: subprocess.TimeoutExpired) -> str:
+    parts = []
+    for chunk in (exc.stdout, exc.stderr):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("utf-8", errors="replace")
+        parts.append(chunk or "")
+    return "".join(parts)
+
+
+JOURNAL_FILE_NAME = "journal.jsonl"
+
+
+class Journal:
+    # 追加写入的进度日志：每个方法完成后写一行并 fsync，进程被杀也只丢失正在执行的方法
+    def __init__(self, path: Path, resume: bool) -> None:
+        self.path = path
+        self._handle = path.open("a" if resume else "w", encoding="utf-8")
+
+    def append(self, outcome: Dict[str, Any]) -> None:
+        self._handle.write(json.dumps(outcome, ensure_ascii=False) + "\n")
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+def load_journal(path: Path) -> Dict[str, Dict[str, Any]]:
+    # 以 id 为 key 取最后一次记录；中断时可能留下不完整的末行，直接忽略
+    completed: Dict[str, Dict[str, Any]] = {}
+    if not path.exists():
+        return completed
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            outcome = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(outcome, dict) and isinstance(outcome.get("id"), str):
+            completed[outcome["id"]] = outcome
+    return completed
+
+
+def record_outcome(summary: Dict[str, Any], outcome: Dict[str, Any]) -> None:
+    outcome = dict(outcome)
+    cached = outcome.pop("cached", False)
+    if "cache" in summary:
+        summary["cache"]["hits" if cached else "misses"] += 1
+
+    if "error" in outcome:
+        print(f"ERROR: {outcome['error']}", file=sys.stderr)
+        summary["errors"].append(outcome)
+        summary["not_passed"].append(
+            {
+                "id": outcome["id"],
+                "input": outcome["input"],
+                "status": "error",
+                "error": outcome["error"],
+                "raw_output": outcome["raw_output"],
+            }
+        )
+        return
+
+    summary["results"].append(outcome)
+    if outcome["summary"] != "pass":
+        summary["not_passed"].append(
+            {
+                "id": outcome["id"],
+                "input": outcome["input"],
+                "status": outcome["summary"],
+                "output": outcome["output"],
+                "raw_output": outcome["raw_output"],
+            }
+        )
 
 
 def main() -> int:
+    started = time.monotonic()
     parser = argparse.ArgumentParser(description="Batch check DBus method access control with codex exec.")
-    parser.add_argument("--methods-file", required=True, help="Path to JSON array or JSONL methods file.")
+    parser.add_argument(
+        "--methods-file",
+        required=True,
+        help="Path to JSON array or JSONL methods file, or - to stream JSONL triplets from stdin.",
+    )
     parser.add_argument(
         "--prompt-file",
         default="prompts/dbus_method_access_control.md",
@@ -120,10 +776,165 @@ def main() -> int:
     )
     parser.add_argument("--project-root", default=".", help="Project root for codex execution.")
     parser.add_argument("--codex-cmd", default="codex exec --skip-git-repo-check", help="Codex exec command.")
-    parser.add_argument("--timeout", type=int, default=300, help="Per-method timeout in seconds.")
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=300,
+        help="Maximum per-invocation timeout in seconds; the adaptive timeout never exceeds it (default: 300).",
+    )
+    parser.add_argument(
+        "--min-timeout",
+        type=int,
+        default=60,
+        help="Lower bound for the timeout derived from observed codex latency (default: 60).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Maximum number of concurrent codex workers; concurrency adapts below it (default: 1).",
+    )
+    parser.add_argument(
+        "--no-adaptive",
+        action="store_true",
+        help="Keep concurrency at --jobs and the timeout at --timeout instead of adapting to observed latency.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Retries for codex invocations that time out or exit non-zero (default: 2).",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=5.0,
+        help="Initial retry backoff in seconds, doubled per attempt with jitter (default: 5).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Maximum methods per codex invocation (default: 1; 0 = whole interface group).",
+    )
+    parser.add_argument(
+        "--batch-by",
+        choices=["interface", "none"],
+        default="interface",
+        help="Only batch methods of the same interface (default), or batch in methods-file order.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0.0,
+        help="Maximum codex launches per second across all workers (default: 0, unlimited).",
+    )
     parser.add_argument("--output-dir", default="out", help="Output directory.")
+    parser.add_argument("--cache-dir", help="Result cache directory (default: <output-dir>/cache).")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the result cache entirely.")
+    parser.add_argument("--force", action="store_true", help="Ignore cached results and re-run codex (cache is refreshed).")
+    parser.add_argument(
+        "--no-source-index",
+        action="store_true",
+        help="Do not precompute the project symbol index injected into prompts.",
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="Statically classify methods first and skip codex for those with evident authorization.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip methods already completed in <output-dir>/journal.jsonl and rebuild the summary from it.",
+    )
+    parser.add_argument(
+        "--service-context",
+        action="store_true",
+        help="Build one reusable context summary per interface with codex and include it in that interface's prompts.",
+    )
+    parser.add_argument(
+        "--context-prompt-file",
+        default="prompts/dbus_service_context.md",
+        help="Prompt template for --service-context summaries.",
+    )
+    parser.add_argument(
+        "--no-repair",
+        action="store_true",
+        help="Do not send invalid codex output back for one format-only repair pass.",
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=["file", "risk"],
+        default="file",
+        help="Check methods in methods-file order (default), or highest risk score first.",
+    )
+    parser.add_argument(
+        "--risk-context",
+        action="append",
+        default=[],
+        help=(
+            "check_dbus_system_conf.py --services-file or check_service_cap.py --json/--jsonl output used for "
+            "risk scoring (repeatable)."
+        ),
+    )
+    parser.add_argument(
+        "--dbus-services-dir",
+        default=DEFAULT_DBUS_SERVICES_DIR,
+        help="D-Bus activation files mapping bus names to systemd units (default: /usr/share/dbus-1/system-services).",
+    )
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        help=(
+            "Stop starting new codex checks once tokens=N estimated tokens or seconds=N of total codex time "
+            "are used (repeatable); unchecked methods are listed in summary.json."
+        ),
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=0.0,
+        help="Start no new codex checks after this many seconds; unchecked methods are listed in summary.json.",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every codex call.",
+    )
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        print("ERROR: --jobs must be >= 1", file=sys.stderr)
+        return 2
+    if args.rate_limit < 0:
+        print("ERROR: --rate-limit must be >= 0", file=sys.stderr)
+        return 2
+    if args.timeout < 1 or args.min_timeout < 1:
+        print("ERROR: --timeout and --min-timeout must be >= 1", file=sys.stderr)
+        return 2
+    if args.retries < 0 or args.retry_backoff < 0:
+        print("ERROR: --retries and --retry-backoff must be >= 0", file=sys.stderr)
+        return 2
+    if args.prefilter and args.no_source_index:
+        print("ERROR: --prefilter requires the source index (drop --no-source-index)", file=sys.stderr)
+        return 2
+    if args.batch_size < 0 or (args.batch_size == 0 and args.batch_by != "interface"):
+        print("ERROR: --batch-size must be >= 1 (0 is only valid with --batch-by interface)", file=sys.stderr)
+        return 2
+    if args.risk_context and args.schedule != "risk":
+        print("ERROR: --risk-context requires --schedule risk", file=sys.stderr)
+        return 2
+    if args.deadline < 0:
+        print("ERROR: --deadline must be >= 0", file=sys.stderr)
+        return 2
+    try:
+        budget = parse_budget(args.budget)
+    except ValueError as exc:
+        print(f"ERROR: Invalid --budget: {exc}", file=sys.stderr)
+        return 2
+
+    streaming = args.methods_file == STREAM_METHODS_FILE
     methods_file = Path(args.methods_file)
     prompt_file = Path(args.prompt_file)
     project_root = Path(args.project_root)
@@ -131,20 +942,51 @@ def main() -> int:
     per_method_dir = output_dir / "per_method"
     raw_dir = output_dir / "raw"
 
-    try:
-        methods = load_methods_file(methods_file)
-    except ValueError as exc:
-        print(f"ERROR: {exc}", file=sys.stderr)
+    if not streaming and not methods_file.is_file():
+        print(f"ERROR: Methods file not found: {methods_file}", file=sys.stderr)
         return 2
 
     if not prompt_file.exists():
         print(f"ERROR: Prompt file not found: {prompt_file}", file=sys.stderr)
         return 2
 
+    risk_context: Optional[RiskContext] = None
+    if args.risk_context:
+        try:
+            risk_context = load_risk_context(args.risk_context, args.dbus_services_dir)
+        except (OSError, ValueError) as exc:
+            print(f"ERROR: Invalid risk context: {exc}", file=sys.stderr)
+            return 2
+
+    context_prompt_file = Path(args.context_prompt_file)
+    if args.service_context and not context_prompt_file.exists():
+        print(f"ERROR: Context prompt file not found: {context_prompt_file}", file=sys.stderr)
+        return 2
+
+    if args.trace_file:
+        TRACE.start("dbus_access_control_check")
     template = load_prompt_template(prompt_file)
+    if args.service_context and "service_context" not in template.template:
+        print(f"WARNING: {prompt_file} has no ${{service_context}} placeholder; service context will not be included")
     per_method_dir.mkdir(parents=True, exist_ok=True)
     raw_dir.mkdir(parents=True, exist_ok=True)
 
+    cache: Optional[ResultCache] = None
+    if not args.no_cache:
+        cache_dir = Path(args.cache_dir) if args.cache_dir else output_dir / "cache"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with span("fingerprint_project", "phase"):
+            project_fingerprint = fingerprint_project(project_root, [output_dir, cache_dir])
+        cache = ResultCache(cache_dir, project_fingerprint, args.codex_cmd, args.force)
+
+    source_index: Optional[SourceIndex] = None
+    if not args.no_source_index:
+        with span("source_index", "phase"):
+            source_index = build_source_index(project_root, [output_dir] + ([cache.cache_dir] if cache is not None else []))
+        print(
+            f"INFO: Source index built: {len(source_index.files)} files, {len(source_index.functions)} functions"
+        )
+
     summary: Dict[str, Any] = {
         "generated_at": datetime.now(timezone.utc).isoformat(),
         "project_root": str(project_root),
@@ -154,88 +996,210 @@ def main() -> int:
         "errors": [],
         "not_passed": [],
     }
+    if cache is not None:
+        summary["cache"] = {"project_fingerprint": cache.project_fingerprint, "hits": 0, "misses": 0}
 
-    for entry in methods:
-        method_id = build_method_id(entry)
-        print(f"INFO: Running codex for {entry['interface']}.{entry['method']} ({method_id})")
-        prompt = template.safe_substitute(
-            dbus_path=entry["path"],
-            dbus_interface=entry["interface"],
-            dbus_method=entry["method"],
+    # 静态预筛：授权明显成立的方法不再调用 codex，结论记录在 summary.json
+    prefilter: Optional[Dict[str, Any]] = None
+    if args.prefilter and source_index is not None:
+        prefilter = {"counts": {verdict: 0 for verdict in VERDICTS}, "methods": []}
+        summary["prefilter"] = prefilter
+
+    journal_path = output_dir / JOURNAL_FILE_NAME
+    resumed: Dict[str, Dict[str, Any]] = {}
+    if args.resume:
+        # 仅复用成功条目；失败条目在续跑时重新执行
+        resumed = {k: v for k, v in load_journal(journal_path).items() if "error" not in v}
+        print(f"INFO: Resuming from {journal_path}: {len(resumed)} methods already completed")
+
+    # 已接纳方法：三元组摘要 -> (负风险分值, 接纳序号)，用于去重、队列优先级与汇总排序。
+    # 方法条目只在待检批次中存活，结果完成即写入 summary，不再按方法保留条目、输出或评分
+    order: Dict[int, Tuple[int, int]] = {}
+    # 风险评分：按方法记录分值与依据，写入 summary.json（--schedule risk 时）
+    risk_records: Optional[List[Dict[str, Any]]] = [] if args.schedule == "risk" else None
+    # summary 的结果列表、未检方法与计数由 worker 与读取线程共同写入
+    summary_lock = threading.Lock()
+
+    def admit(entries: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        # 去重、预筛并跳过已完成条目，返回需要调用 codex 的方法
+        pending: List[Dict[str, str]] = []
+        for entry in entries:
+            key = triplet_key(entry)
+            if key in order:
+                continue
+            method_id = build_method_id(entry)
+            score = 0
+            if risk_records is not None:
+                scored = score_method(entry, risk_context)
+                score = scored["score"]
+                risk_records.append({"id": method_id, **scored})
+            order[key] = (-score, len(order))
+            if prefilter is not None and source_index is not None:
+                verdict = classify_method(source_index, entry)
+                prefilter["counts"][verdict["verdict"]] += 1
+                prefilter["methods"].append({"id": method_id, "input": entry, **verdict})
+                if verdict["verdict"] == VERDICT_EVIDENT:
+                    continue
+            if method_id in resumed:
+                with summary_lock:
+                    record_outcome(summary, resumed.pop(method_id))
+                continue
+            pending.append(entry)
+        return pending
+
+    limiter = RateLimiter(args.rate_limit)
+    # 所有 codex 调用（方法检查、修复、服务上下文）共用一个控制器：统一的并发上限、延迟统计与重试
+    controller = CodexController(
+        max_concurrency=args.jobs,
+        max_timeout=args.timeout,
+        min_timeout=args.min_timeout,
+        retries=args.retries,
+        backoff=args.retry_backoff,
+        adaptive=not args.no_adaptive,
+        before_launch=limiter.wait,
+        budget=budget,
+    )
+    contexts: Optional[ServiceContextStore] = None
+    if args.service_context:
+        (output_dir / "contexts").mkdir(parents=True, exist_ok=True)
+        contexts = ServiceContextStore(
+            load_prompt_template(context_prompt_file),
+            args,
+            project_root,
+            output_dir / "contexts",
+            controller,
+            cache,
+            source_index,
         )
-        result = run_codex(args.codex_cmd, prompt, project_root, args.timeout)
-        raw_path = raw_dir / f"{method_id}.txt"
-        raw_path.write_text(result.stdout + result.stderr, encoding="utf-8")
-
-        if result.returncode != 0:
-            error_msg = f"codex exec failed with code {result.returncode}"
-            print(f"ERROR: {error_msg}", file=sys.stderr)
-            error_entry = {"id": method_id, "input": entry, "error": error_msg, "raw_output": str(raw_path)}
-            summary["errors"].append(error_entry)
-            summary["not_passed"].append(
-                {
-                    "id": method_id,
-                    "input": entry,
-                    "status": "error",
-                    "error": error_msg,
-                    "raw_output": str(raw_path),
-                }
-            )
-            write_json(
-                per_method_dir / f"{method_id}.json",
-                {"input": entry, "error": error_msg, "raw_output": str(raw_path)},
-            )
-            continue
+    journal = Journal(journal_path, args.resume)
 
-        try:
-            payload = parse_json_output(result.stdout)
-            validation_errors = validate_output(payload)
-            if validation_errors:
-                raise ValueError("; ".join(validation_errors))
-        except ValueError as exc:
-            error_msg = str(exc)
-            print(f"ERROR: {error_msg}", file=sys.stderr)
-            error_entry = {"id": method_id, "input": entry, "error": error_msg, "raw_output": str(raw_path)}
-            summary["errors"].append(error_entry)
-            summary["not_passed"].append(
-                {
-                    "id": method_id,
-                    "input": entry,
-                    "status": "error",
-                    "error": error_msg,
-                    "raw_output": str(raw_path),
-                }
-            )
-            write_json(
-                per_method_dir / f"{method_id}.json",
-                {"input": entry, "error": error_msg, "raw_output": str(raw_path)},
-            )
-            continue
+    # 待检批次放入优先队列（分值高者先出，同分按入队顺序）；每个提交到线程池的任务运行时才取出当前最高优先级批次，
+    # 因此流式输入中后到的高风险批次可越过已排队的低风险批次。--schedule file 时分值恒为 0，等同于按清单顺序
+    queue: List[Tuple[int, int, List[Dict[str, str]]]] = []
+    queue_lock = threading.Lock()
+    sequence = itertools.count()
+    deadline_at = started + args.deadline if args.deadline else None
+    # 未检方法按原因（deadline / budget）记录 (排序键, 方法 id)
+    unchecked: Dict[str, List[Tuple[Tuple[int, int], str]]] = {"deadline": [], "budget": []}
+    checked = 0
 
-        output_path = per_method_dir / f"{method_id}.json"
-        write_json(output_path, payload)
-        method_summary = payload.get("summary")
-        if method_summary not in {"pass", "fail", "unknown"}:
-            method_summary = "unknown"
-        summary["results"].append(
-            {
-                "id": method_id,
-                "input": entry,
-                "summary": method_summary,
-                "output": str(output_path),
-                "raw_output": str(raw_path),
-            }
+    def enqueue(batch: List[Dict[str, str]]) -> None:
+        priority = -min(order[triplet_key(entry)][0] for entry in batch)
+        with queue_lock:
+            heapq.heappush(queue, (-priority, next(sequence), batch))
+
+    def worker() -> None:
+        with queue_lock:
+            _, _, batch = heapq.heappop(queue)
+        nonlocal checked
+        reason = ""
+        if deadline_at is not None and time.monotonic() >= deadline_at:
+            reason = "deadline"
+        elif controller.budget_exhausted():
+            reason = "budget"
+        if reason:
+            # 截止时间已到或预算用尽：不再启动新的 codex 检查，未检方法不写 journal，可用 --resume 续跑
+            with summary_lock:
+                unchecked[reason].extend((order[triplet_key(entry)], build_method_id(entry)) for entry in batch)
+            return
+        batch_outcomes = check_batch(
+            batch, template, args, project_root, per_method_dir, raw_dir, controller, cache, source_index, contexts
         )
-        if method_summary != "pass":
-            summary["not_passed"].append(
-                {
-                    "id": method_id,
-                    "input": entry,
-                    "status": method_summary,
-                    "output": str(output_path),
-                    "raw_output": str(raw_path),
-                }
+        with summary_lock:
+            checked += len(batch)
+            for outcome in batch_outcomes:
+                journal.append(outcome)
+                record_outcome(summary, outcome)
+
+    input_errors: List[Dict[str, Any]] = []
+    batcher = MethodBatcher(args.batch_size, args.batch_by)
+    # 文件输入按风险调度时先读完清单再启动 worker，保证全局按分值排序；其余情况读到即提交，读取与检查重叠
+    defer_dispatch = risk_records is not None and not streaming
+    stream = sys.stdin if streaming else methods_file.open("r", encoding="utf-8")
+    try:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = []
+            queued = 0
+
+            def dispatch(batches: List[List[Dict[str, str]]]) -> None:
+                nonlocal queued
+                for batch in batches:
+                    enqueue(batch)
+                    queued += 1
+                if not defer_dispatch:
+                    futures.extend(executor.submit(worker) for _ in range(queued))
+                    queued = 0
+
+            # 生产者/消费者：边读边去重、预筛、组批并提交；stdin 输入每行读完即产出批次，上游仍在内省时 codex 检查已开始
+            for line_no, entries, error in iter_method_records(stream):
+                if error is not None:
+                    print(f"ERROR: {args.methods_file}: line {line_no}: {error}", file=sys.stderr)
+                    input_errors.append({"line": line_no, "error": error})
+                    continue
+                for entry in admit(entries):
+                    dispatch(batcher.add(entry))
+                if streaming:
+                    dispatch(batcher.flush())
+            defer_dispatch = False
+            dispatch(batcher.flush())
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        journal.close()
+        if not streaming:
+            stream.close()
+
+    if prefilter is not None:
+        print(
+            "INFO: Pre-filter verdicts: "
+            + " ".join(f"{verdict}={count}" for verdict, count in prefilter["counts"].items())
+        )
+    if input_errors:
+        summary["input_errors"] = input_errors
+    summary["codex"] = controller.stats()
+    print(
+        "INFO: codex calls={calls} retries={retries} timeouts={timeouts} concurrency={final_concurrency}/{max_concurrency} "
+        "p50={latency_p50_seconds}s p95={latency_p95_seconds}s timeout={timeout_seconds}s".format(**summary["codex"])
+    )
+    if contexts is not None:
+        summary["service_contexts"] = sorted(contexts.records.values(), key=lambda record: record["interface"])
+    if args.trace_file:
+        TRACE.finish(args.trace_file)
+    if not order:
+        print(f"ERROR: No methods read from {args.methods_file}", file=sys.stderr)
+        return 2
+
+    # 结果在完成时写入，汇总前按方法清单顺序重排（--schedule risk 时按风险分值降序、同分保持清单顺序），
+    # summary.json 与 --jobs 取值、完成先后及是否续跑无关
+    for name in ("results", "errors", "not_passed"):
+        summary[name].sort(key=lambda item: order[triplet_key(item["input"])])
+    if risk_records is not None:
+        summary["risk"] = sorted(risk_records, key=lambda record: -record["score"])
+    unchecked_ids = {reason: [method_id for _, method_id in sorted(items)] for reason, items in unchecked.items()}
+    if deadline_at is not None:
+        summary["deadline"] = {"seconds": args.deadline, "unchecked": unchecked_ids["deadline"]}
+        if unchecked_ids["deadline"]:
+            print(
+                f"WARNING: Deadline reached, {len(unchecked_ids['deadline'])} methods not checked (rerun with --resume)",
+                file=sys.stderr,
+            )
+    if budget:
+        usage = summary["codex"]["usage"]
+        summary["budget"] = {
+            "limits": budget,
+            "used": {"tokens": usage["prompt_tokens"] + usage["output_tokens"], "seconds": usage["seconds"]},
+            "unchecked": unchecked_ids["budget"],
+        }
+        if unchecked_ids["budget"]:
+            print(
+                f"WARNING: Budget exhausted, {len(unchecked_ids['budget'])} methods not checked (rerun with --resume)",
+                file=sys.stderr,
             )
+    summary["throughput"] = throughput(summary["codex"]["usage"], time.monotonic() - started, checked)
+    print(
+        "INFO: Throughput: {checked} methods in {wall_seconds}s ({checked_per_minute}/min), "
+        "~{tokens} tokens ({tokens_per_minute}/min)".format(**summary["throughput"])
+    )
 
     summary_path = output_dir / "summary.json"
     write_json(summary_path, summary)
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from _common import (
+    RUN_STATS,
+    classify_file_not_found,
+    list_service_units,
+    phase,
+    read_non_empty_lines,
+    run_command,
+)
+from _snapshot import DPKG_INFO_DIR, Snapshot, collect_dpkg_file_lists, collect_text_files, collect_units, load_snapshot
+from _trace import TRACE, span
+
+import check_dbus_system_conf as dbus_conf
+import check_deb_binaries_privilege as deb_privilege
+import check_polkit_action_implicit as polkit_implicit
+import check_service_cap as service_cap
+import check_service_fs_scope as service_fs_scope
+
+
+# 统一编排入口：
+# - 先一次性采集主机快照（unit 属性、dpkg 文件清单/归属索引、system.d conf 索引、polkit 索引、introspection、pkaction 输出）
+# - 再基于同一份快照并发执行各规则检查，输出合并报告
+# - 各检查的结果结构与单独运行对应工具的 `--json` 输出一致
+# - 只调用各规则工具的公开函数（无下划线前缀，如 evaluate_service、scan_conf_files、build_summary）；
+#   规则工具内部重构时需保持这些函数的签名与返回结构
+
+SYSTEM_COMMANDS = {
+    "systemctl": "systemctl",
+    "busctl": dbus_conf.SYSTEM_COMMANDS["busctl"],
+    "dpkg_query": "dpkg-query",
+    "getcap": deb_privilege.SYSTEM_COMMANDS["getcap"],
+    "pkaction": polkit_implicit.SYSTEM_COMMANDS["pkaction"],
+}
+
+UNIT_PROPERTIES = tuple(dict.fromkeys(service_cap.SYSTEMCTL_PROPERTIES + service_fs_scope.SYSTEMCTL_PROPERTIES))
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="run_all",
+        description="Collect one host snapshot and run all rule checks against it, writing a combined JSON report.",
+    )
+    parser.add_argument("--services-file", help="Path to a file containing unit names (one per line).")
+    parser.add_argument(
+        "--all-services",
+        action="store_true",
+        help="Check every loaded and installed service unit.",
+    )
+    parser.add_argument(
+        "--expected-caps",
+        help="Path to a file containing expected effective capability tokens (one per line).",
+    )
+    parser.add_argument("--packages-file", help="Path to a file containing Debian package names (one per line).")
+    parser.add_argument("--actions-file", help="Path to a file containing polkit action ids (one per line).")
+    parser.add_argument(
+        "--bus-names-file",
+        help="Path to a file containing D-Bus bus names (one per line). Enables root service method report.",
+    )
+    parser.add_argument(
+        "--etc-dir",
+        default=dbus_conf.DEFAULT_SEARCH_DIRS[0],
+        help="DBus system.d directory (default: /etc/dbus-1/system.d).",
+    )
+    parser.add_argument(
+        "--usr-dir",
+        default=dbus_conf.DEFAULT_SEARCH_DIRS[1],
+        help="DBus system.d directory (default: /usr/share/dbus-1/system.d).",
+    )
+    parser.add_argument(
+        "--dpkg-info-dir",
+        default=DPKG_INFO_DIR,
+        help="dpkg database info directory holding *.list files (default: /var/lib/dpkg/info).",
+    )
+    parser.add_argument(
+        "--only-flagged",
+        action="store_true",
+        help="Only include flagged records (and errors) in polkit and D-Bus conf results.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of concurrent collectors/checks (default: 4).",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        help="Run checks against a snapshot archive instead of collecting from the live host. "
+        "Item lists default to the ones recorded in the snapshot.",
+    )
+    parser.add_argument("--output", help="Write the combined report to this file instead of stdout.")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Add per-phase timing and external command statistics to the report (stats).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Command timeout seconds (default: 10).",
+    )
+    return parser.parse_args(argv)
+
+
+def _load_list(path: str | None, label: str) -> list[str]:
+    if not path:
+        return []
+    items = read_non_empty_lines(path)
+    if not items:
+        raise ValueError(f"{label} file is empty")
+    return items
+
+
+def _load_services(args: argparse.Namespace, snapshot: Snapshot | None) -> list[str]:
+    if args.all_services:
+        return snapshot.service_units() if snapshot is not None else list_service_units(args.timeout)
+    return _load_list(args.services_file, "services")
+
+
+def _collect_package_binaries(
+    snapshot: Snapshot,
+    packages: list[str],
+    timeout_seconds: float,
+) -> tuple[dict[str, int], dict[str, str]]:
+    modes: dict[str, int] = {}
+    with phase("file_stat"):
+        for package in packages:
+            for path in snapshot.package_files(package) or []:
+                if path in modes:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode) and st.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+                    modes[path] = st.st_mode
+    with phase("capability_scan"):
+        return modes, deb_privilege.get_file_caps(sorted(modes), timeout_seconds)
+
+
+def _collect_pkaction(action_ids: list[str], timeout_seconds: float, jobs: int) -> dict[str, dict[str, Any]]:
+    def run(action_id: str) -> dict[str, Any]:
+        with phase("action_query"):
+            completed = run_command([SYSTEM_COMMANDS["pkaction"], "-a", action_id, "-v"], timeout_seconds)
+        return {"returncode": completed.returncode, "stdout": completed.stdout, "stderr": completed.stderr}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return dict(zip(action_ids, pool.map(run, action_ids)))
+
+
+def _collect_introspection(
+    snapshot: Snapshot,
+    bus_names: list[str],
+    conf_dirs: list[str],
+    timeout_seconds: float,
+    jobs: int,
+) -> dict[str, dict[str, dict[str, str]]]:
+    conf_files, _ = dbus_conf.iter_conf_files(conf_dirs, snapshot)
+    _, allow_own_index, _ = dbus_conf.scan_conf_files(conf_files, timeout_seconds, snapshot)
+    root_services = [
+        name for name in dict.fromkeys(bus_names) if dbus_conf.is_root_service(allow_own_index.get(name) or [])
+    ]
+
+    def record(service: str) -> dict[str, dict[str, str]]:
+        pages: dict[str, dict[str, str]] = {}
+
+        def introspect(object_path: str) -> str:
+            try:
+                xml_text = dbus_conf.busctl_introspect_xml(service, object_path, timeout_seconds)
+            except FileNotFoundError:
+                raise
+            except Exception as exc:
+                pages[object_path] = {"error": str(exc)}
+                raise
+            pages[object_path] = {"xml": xml_text}
+            return xml_text
+
+        # 遍历与 deny 规则无关，这里只为记录全部 object path 的 introspection 结果
+        with span(service, "service"):
+            dbus_conf.collect_methods_not_denied(service, [], introspect)
+        return pages
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return dict(zip(root_services, pool.map(record, root_services)))
+
+
+def _traced(name: str, category: str, fn: Callable[[], Any]) -> Callable[[], Any]:
+    # 在线程池中执行的任务以 span 包裹，轨迹中按 worker 线程分道显示
+    def run() -> Any:
+        with span(name, category):
+            return fn()
+
+    return run
+
+
+def collect_host_snapshot(
+    *,
+    services: list[str],
+    packages: list[str],
+    action_ids: list[str],
+    bus_names: list[str],
+    conf_dirs: list[str],
+    dpkg_info_dir: str,
+    timeout_seconds: float,
+    jobs: int,
+) -> Snapshot:
+    data: dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "inputs": {
+            "services": services,
+            "packages": packages,
+            "action_ids": action_ids,
+            "bus_names": bus_names,
+            "conf_dirs": conf_dirs,
+        },
+    }
+
+    def units() -> None:
+        data["units"], data["unit_errors"] = collect_units(services, UNIT_PROPERTIES, timeout_seconds)
+
+    def conf() -> None:
+        with phase("conf_scan"):
+            files, scanned, _ = collect_text_files(conf_dirs, (".conf",))
+        data["dbus_conf_files"], data["dbus_conf_dirs"] = files, scanned
+
+    def polkit() -> None:
+        with phase("policy_scan"):
+            files, scanned, _ = collect_text_files(polkit_implicit.POLICY_SEARCH_DIRS, (".policy", ".policy.in"))
+        data["polkit_policy_files"], data["polkit_policy_dirs"] = files, scanned
+        data["polkit_actions"] = _collect_pkaction(action_ids, timeout_seconds, jobs)
+
+    def dpkg() -> None:
+        with phase("package_listing"):
+            data["dpkg_files"] = collect_dpkg_file_lists(dpkg_info_dir)
+
+    collectors: list[Callable[[], None]] = [conf, dpkg]
+    if services:
+        collectors.append(units)
+    if action_ids:
+        collectors.append(polkit)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for future in [pool.submit(_traced(fn.__name__, "collect", fn)) for fn in collectors]:
+            future.result()
+
+    snapshot = Snapshot(data)
+    # 依赖 conf 索引与 dpkg 文件清单的二阶段采集
+    if bus_names:
+        with span("introspection", "collect"):
+            data["dbus_introspection"] = _collect_introspection(snapshot, bus_names, conf_dirs, timeout_seconds, jobs)
+    if packages and data.get("dpkg_files") is not None:
+        with span("package_binaries", "collect"):
+            data["file_modes"], data["file_caps"] = _collect_package_binaries(snapshot, packages, timeout_seconds)
+    return snapshot
+
+
+def _error_result(key: str, item: str, exc: Exception) -> dict[str, Any]:
+    return {key: item, "status": "error", "error": str(exc)}
+
+
+def _run_service_cap(snapshot: Snapshot, services: list[str], expected_caps: list[str] | None) -> dict[str, Any]:
+    results: list[dict[str, Any]] = []
+    for service in services:
+        try:
+            results.append(service_cap.evaluate_service(service, snapshot.unit_properties(service), expected_caps))
+        except Exception as exc:
+            results.append(_error_result("service", service, exc))
+    return {"results": results, "summary": service_cap.build_summary(results)}
+
+
+def _run_service_fs_scope(snapshot: Snapshot, services: list[str]) -> dict[str, Any]:
+    results: list[dict[str, Any]] = []
+    for service in services:
+        try:
+            results.append(service_fs_scope.build_result(service, snapshot.unit_properties(service)))
+        except Exception as exc:
+            results.append(_error_result("service", service, exc))
+    return {"results": results, "summary": service_fs_scope.build_summary(results)}
+
+
+def _run_deb_privilege(snapshot: Snapshot, packages: list[str], timeout_seconds: float) -> dict[str, Any]:
+    results: list[dict[str, Any]] = []
+    for package in packages:
+        try:
+            results.append(deb_privilege.scan_package(package, timeout_seconds, snapshot))
+        except Exception as exc:
+            results.append(_error_result("package", package, exc))
+    return {"results": results, "summary": deb_privilege.build_summary(results)}
+
+
+def _filter_flagged(results: list[dict[str, Any]], enabled: bool) -> list[dict[str, Any]]:
+    if not enabled:
+        return results
+    return [r for r in results if r.get("status") not in {"ok", "uncontrolled", "not-root"} or bool(r.get("flagged"))]
+
+
+def _run_polkit_implicit(
+    snapshot: Snapshot,
+    action_ids: list[str],
+    owners_cache: dict[str, list[str]],
+    timeout_seconds: float,
+    only_flagged: bool,
+) -> dict[str, Any]:
+    policy_index = polkit_implicit.index_policy_actions(polkit_implicit.POLICY_SEARCH_DIRS, snapshot)
+    results: list[dict[str, Any]] = []
+    for action_id in action_ids:
+        try:
+            results.append(polkit_implicit.check_action(action_id, policy_index, owners_cache, timeout_seconds, snapshot))
+        except Exception as exc:
+            results.append(_error_result("action_id", action_id, exc))
+    return {"results": _filter_flagged(results, only_flagged), "summary": polkit_implicit.build_summary(results)}
+
+
+def _run_dbus_conf(
+    snapshot: Snapshot,
+    conf_dirs: list[str],
+    bus_names: list[str],
+    owners_cache: dict[str, list[str]],
+    timeout_seconds: float,
+    only_flagged: bool,
+) -> dict[str, dict[str, Any]]:
+    conf_files, missing_dirs = dbus_conf.iter_conf_files(conf_dirs, snapshot)
+    conf_results, allow_own_index, default_deny_index = dbus_conf.scan_conf_files(conf_files, timeout_seconds, snapshot)
+    dbus_conf.attach_conf_owners(conf_results, owners_cache, timeout_seconds, snapshot)
+
+    reports: dict[str, dict[str, Any]] = {}
+    conf_report: dict[str, Any] = {
+        "results": _filter_flagged(conf_results, only_flagged),
+        "summary": dbus_conf.build_conf_summary(conf_results),
+    }
+    if missing_dirs:
+        conf_report["missing_dirs"] = missing_dirs
+    reports["check_dbus_system_conf"] = conf_report
+
+    if bus_names:
+        service_results: list[dict[str, Any]] = []
+        for service in bus_names:
+            try:
+                service_results.append(
+                    dbus_conf.check_bus_name(
+                        service, allow_own_index, default_deny_index, owners_cache, timeout_seconds, snapshot
+                    ),
+                )
+            except Exception as exc:
+                service_results.append(_error_result("service", service, exc))
+        reports["check_dbus_system_conf_services"] = {
+            "results": _filter_flagged(service_results, only_flagged),
+            "summary": dbus_conf.build_service_summary(service_results),
+        }
+    return reports
+
+
+def _exit_code_for(summary: dict[str, int]) -> int:
+    if summary.get("mismatch"):
+        return service_cap.EXIT_CAP_MISMATCH
+    if summary.get("not_found"):
+        return 2
+    if summary.get("error"):
+        return 1
+    return 0
+
+
+def run_checks(
+    snapshot: Snapshot,
+    *,
+    services: list[str],
+    expected_caps: list[str] | None,
+    packages: list[str],
+    action_ids: list[str],
+    bus_names: list[str],
+    conf_dirs: list[str],
+    timeout_seconds: float,
+    only_flagged: bool,
+    jobs: int,
+) -> dict[str, dict[str, Any]]:
+    # polkit policy 与 system.d conf 的属主查询共用一个缓存；两个检查并发时同一路径至多各查一次，结果相同
+    owners_cache: dict[str, list[str]] = {}
+    tasks: dict[str, Callable[[], dict[str, Any]]] = {}
+    if services:
+        tasks["check_service_cap"] = lambda: _run_service_cap(snapshot, services, expected_caps)
+        tasks["check_service_fs_scope"] = lambda: _run_service_fs_scope(snapshot, services)
+    if packages:
+        tasks["check_deb_binaries_privilege"] = lambda: _run_deb_privilege(snapshot, packages, timeout_seconds)
+    if action_ids:
+        tasks["check_polkit_action_implicit"] = lambda: _run_polkit_implicit(
+            snapshot, action_ids, owners_cache, timeout_seconds, only_flagged
+        )
+
+    reports: dict[str, dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        dbus_future = pool.submit(
+            _traced(
+                "check_dbus_system_conf",
+                "check",
+                lambda: _run_dbus_conf(snapshot, conf_dirs, bus_names, owners_cache, timeout_seconds, only_flagged),
+            ),
+        )
+        futures = {name: pool.submit(_traced(name, "check", task)) for name, task in tasks.items()}
+        for name, future in futures.items():
+            reports[name] = future.result()
+        reports.update(dbus_future.result())
+    return {name: reports[name] for name in sorted(reports)}
+
+
+def main(argv: list[str]) -> int:
+    args = _parse_args(argv)
+    RUN_STATS.reset()
+    if args.trace_file:
+        TRACE.start("run_all")
+
+    try:
+        # 参数冲突在快照加载与任何系统查询之前拒绝
+        if args.jobs < 1:
+            raise ValueError("--jobs must be >= 1")
+        if args.services_file and args.all_services:
+            raise ValueError("--services-file and --all-services are mutually exclusive")
+
+        collect_started = time.monotonic()
+        with phase("snapshot_load"):
+            loaded = load_snapshot(args.from_snapshot) if args.from_snapshot else None
+        services = _load_services(args, loaded)
+        expected_caps = service_cap.load_expected_caps(args.expected_caps)
+        packages = _load_list(args.packages_file, "packages")
+        action_ids = _load_list(args.actions_file, "actions")
+        bus_names = _load_list(args.bus_names_file, "bus names")
+        conf_dirs = [args.etc_dir, args.usr_dir]
+
+        if loaded is not None:
+            snapshot = loaded
+            if not (services or packages or action_ids or bus_names):
+                recorded = snapshot.inputs()
+                services = list(recorded.get("services") or [])
+                packages = list(recorded.get("packages") or [])
+                action_ids = list(recorded.get("action_ids") or [])
+                bus_names = list(recorded.get("bus_names") or [])
+                conf_dirs = list(recorded.get("conf_dirs") or conf_dirs)
+        else:
+            snapshot = collect_host_snapshot(
+                services=services,
+                packages=packages,
+                action_ids=action_ids,
+                bus_names=bus_names,
+                conf_dirs=conf_dirs,
+                dpkg_info_dir=args.dpkg_info_dir,
+                timeout_seconds=args.timeout,
+                jobs=args.jobs,
+            )
+        collect_seconds = time.monotonic() - collect_started
+
+        check_started = time.monotonic()
+        reports = run_checks(
+            snapshot,
+            services=services,
+            expected_caps=expected_caps,
+            packages=packages,
+            action_ids=action_ids,
+            bus_names=bus_names,
+            conf_dirs=conf_dirs,
+            timeout_seconds=args.timeout,
+            only_flagged=args.only_flagged,
+            jobs=args.jobs,
+        )
+        check_seconds = time.monotonic() - check_started
+
+        exit_codes = {name: _exit_code_for(report.get("summary") or {}) for name, report in reports.items()}
+        payload = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "snapshot": {
+                "created_at": snapshot.data.get("created_at"),
+                "units": len(snapshot.data.get("units") or {}),
+                "dbus_conf_files": len(snapshot.data.get("dbus_conf_files") or {}),
+                "dbus_introspected_services": len(snapshot.data.get("dbus_introspection") or {}),
+                "polkit_policy_files": len(snapshot.data.get("polkit_policy_files") or {}),
+                "polkit_actions": len(snapshot.data.get("polkit_actions") or {}),
+                "dpkg_packages": len(snapshot.data.get("dpkg_files") or {}),
+                "collect_seconds": round(collect_seconds, 3),
+                "check_seconds": round(check_seconds, 3),
+            },
+            "reports": reports,
+            "exit_codes": exit_codes,
+        }
+        if args.stats:
+            payload["stats"] = RUN_STATS.report()
+
+        text = json.dumps(payload, indent=2, ensure_ascii=False, sort_keys=True)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as handle:
+                handle.write(text + "\n")
+            print(f"INFO: Report written to {args.output}", file=sys.stderr)
+        else:
+            print(text)
+
+        return max(exit_codes.values(), default=0)
+    except FileNotFoundError as exc:
+        exit_code, message = classify_file_not_found(exc, set(SYSTEM_COMMANDS.values()))
+        print(message, file=sys.stderr)
+        return exit_code
+    except Exception as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+from _common import classify_file_not_found, list_service_units
+from _snapshot import DPKG_INFO_DIR, SNAPSHOT_VERSION, write_snapshot
+from _trace import TRACE
+
+import check_dbus_system_conf as dbus_conf
+import check_polkit_action_implicit as polkit_implicit
+from run_all import SYSTEM_COMMANDS, _load_list, collect_host_snapshot
+
+
+# 主机快照采集命令：
+# - 将各规则工具读取的全部外部输入序列化为一个 gzip 压缩、带版本号的归档
+# - 未指定列表文件时默认采集整机：全部 service、dpkg 数据库中的全部包、policy 文件中的全部 actionid、conf 中允许 root own 的全部 bus name
+# - 归档可用于各规则工具与 run_all.py 的 `--from-snapshot` 离线分析
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="snapshot",
+        description="Capture every external input of the rule tools into one compressed, versioned snapshot archive.",
+    )
+    parser.add_argument("output", help="Snapshot archive path (gzip-compressed JSON, e.g. host.snapshot.json.gz).")
+    parser.add_argument("--services-file", help="Only capture these units (default: every service unit).")
+    parser.add_argument("--packages-file", help="Only capture these packages' binaries (default: every installed package).")
+    parser.add_argument("--actions-file", help="Only capture these polkit actions (default: every action in policy files).")
+    parser.add_argument("--bus-names-file", help="Only introspect these bus names (default: every root-owned bus name).")
+    parser.add_argument(
+        "--etc-dir",
+        default=dbus_conf.DEFAULT_SEARCH_DIRS[0],
+        help="DBus system.d directory (default: /etc/dbus-1/system.d).",
+    )
+    parser.add_argument(
+        "--usr-dir",
+        default=dbus_conf.DEFAULT_SEARCH_DIRS[1],
+        help="DBus system.d directory (default: /usr/share/dbus-1/system.d).",
+    )
+    parser.add_argument(
+        "--dpkg-info-dir",
+        default=DPKG_INFO_DIR,
+        help="dpkg database info directory holding *.list files (default: /var/lib/dpkg/info).",
+    )
+    parser.add_argument("--jobs", type=int, default=4, help="Number of concurrent collectors (default: 4).")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Command timeout seconds (default: 10).",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a Chrome Trace Event Format file (chrome://tracing, Perfetto) with spans for every external command and item.",
+    )
+    return parser.parse_args(argv)
+
+
+def _installed_packages(info_dir: str) -> list[str]:
+    if not os.path.isdir(info_dir):
+        return []
+    return sorted({name[: -len(".list")].split(":", 1)[0] for name in os.listdir(info_dir) if name.endswith(".list")})
+
+
+def _root_bus_names(conf_dirs: list[str], timeout_seconds: float) -> list[str]:
+    conf_files, _ = dbus_conf.iter_conf_files(conf_dirs)
+    _, allow_own_index, _ = dbus_conf.scan_conf_files(conf_files, timeout_seconds)
+    return sorted(name for name, entries in allow_own_index.items() if dbus_conf.is_root_service(entries))
+
+
+def main(argv: list[str]) -> int:
+    args = _parse_args(argv)
+    if args.trace_file:
+        TRACE.start("snapshot")
+
+    try:
+        if args.jobs < 1:
+            raise ValueError("--jobs must be >= 1")
+
+        conf_dirs = [args.etc_dir, args.usr_dir]
+        services = _load_list(args.services_file, "services") or list_service_units(args.timeout)
+        packages = _load_list(args.packages_file, "packages") or _installed_packages(args.dpkg_info_dir)
+        action_ids = _load_list(args.actions_file, "actions") or sorted(
+            polkit_implicit.index_policy_actions(polkit_implicit.POLICY_SEARCH_DIRS),
+        )
+        bus_names = _load_list(args.bus_names_file, "bus names") or _root_bus_names(conf_dirs, args.timeout)
+
+        started = time.monotonic()
+        snapshot = collect_host_snapshot(
+            services=services,
+            packages=packages,
+            action_ids=action_ids,
+            bus_names=bus_names,
+            conf_dirs=conf_dirs,
+            dpkg_info_dir=args.dpkg_info_dir,
+            timeout_seconds=args.timeout,
+            jobs=args.jobs,
+        )
+        write_snapshot(args.output, snapshot)
+
+        print(
+            f"INFO: Snapshot v{SNAPSHOT_VERSION} written to {args.output} "
+            f"(services={len(services)} packages={len(packages)} actions={len(action_ids)} "
+            f"bus_names={len(bus_names)} seconds={time.monotonic() - started:.1f})",
+            file=sys.stderr,
+        )
+        return 0
+    except FileNotFoundError as exc:
+        exit_code, message = classify_file_not_found(exc, set(SYSTEM_COMMANDS.values()))
+        print(message, file=sys.stderr)
+        return exit_code
+    except Exception as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if args.trace_file:
+            TRACE.finish(args.trace_file)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))